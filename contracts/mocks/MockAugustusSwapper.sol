@@ -0,0 +1,203 @@
+// SPDX-License-Identifier: MIT
+pragma solidity 0.6.12;
+
+import {SafeMath} from "@openzeppelin/contracts/math/SafeMath.sol";
+import {MockERC20} from "./MockERC20.sol";
+import {MockUniswapV2Pair} from "./MockUniswapV2.sol";
+
+interface IMockUniswapV2Factory {
+    function getPair(address tokenA, address tokenB)
+        external
+        view
+        returns (address);
+}
+
+/// Pulls approved tokens on behalf of `MockAugustusSwapper`
+contract MockTokenTransferProxy {
+    address public owner;
+
+    function initialize(address _owner) external {
+        require(owner == address(0)); // dev: already initialized
+        owner = _owner;
+    }
+
+    function transferFrom(
+        address token,
+        address from,
+        address to,
+        uint256 amount
+    ) external {
+        require(msg.sender == owner); // dev: not augustus
+        require(MockERC20(token).transferFrom(from, to, amount));
+    }
+}
+
+/// Augustus stand-in with the `*OnUniswap*` entry points the fake Paraswap API
+/// builds transactions for
+/// @dev Swaps route through `MockUniswapV2Pair`s looked up on the factory, the
+///      `initCode` and `referrer` arguments are ignored
+contract MockAugustusSwapper {
+    using SafeMath for uint256;
+
+    address public tokenTransferProxy;
+    address public uniswapFactory;
+
+    function initialize(address _tokenTransferProxy, address _uniswapFactory)
+        external
+    {
+        require(tokenTransferProxy == address(0)); // dev: already initialized
+        tokenTransferProxy = _tokenTransferProxy;
+        uniswapFactory = _uniswapFactory;
+    }
+
+    function getTokenTransferProxy() external view returns (address) {
+        return tokenTransferProxy;
+    }
+
+    function swapOnUniswap(
+        uint256 amountIn,
+        uint256 amountOutMin,
+        address[] calldata path,
+        uint8
+    ) external payable {
+        _swap(uniswapFactory, amountIn, amountOutMin, path);
+    }
+
+    function swapOnUniswapFork(
+        address factory,
+        bytes32,
+        uint256 amountIn,
+        uint256 amountOutMin,
+        address[] calldata path,
+        uint8
+    ) external payable {
+        _swap(factory, amountIn, amountOutMin, path);
+    }
+
+    function buyOnUniswap(
+        uint256 amountInMax,
+        uint256 amountOut,
+        address[] calldata path,
+        uint8
+    ) external payable {
+        _buy(uniswapFactory, amountInMax, amountOut, path);
+    }
+
+    function buyOnUniswapFork(
+        address factory,
+        bytes32,
+        uint256 amountInMax,
+        uint256 amountOut,
+        address[] calldata path,
+        uint8
+    ) external payable {
+        _buy(factory, amountInMax, amountOut, path);
+    }
+
+    function getAmountsOut(
+        address factory,
+        uint256 amountIn,
+        address[] memory path
+    ) public view returns (uint256[] memory amounts) {
+        amounts = new uint256[](path.length);
+        amounts[0] = amountIn;
+        for (uint256 k = 0; k < path.length - 1; k++) {
+            (uint256 reserveIn, uint256 reserveOut) =
+                _reserves(factory, path[k], path[k + 1]);
+            uint256 amountInWithFee = amounts[k].mul(997);
+            amounts[k + 1] = amountInWithFee.mul(reserveOut).div(
+                reserveIn.mul(1000).add(amountInWithFee)
+            );
+        }
+    }
+
+    function getAmountsIn(
+        address factory,
+        uint256 amountOut,
+        address[] memory path
+    ) public view returns (uint256[] memory amounts) {
+        amounts = new uint256[](path.length);
+        amounts[path.length - 1] = amountOut;
+        for (uint256 k = path.length - 1; k > 0; k--) {
+            (uint256 reserveIn, uint256 reserveOut) =
+                _reserves(factory, path[k - 1], path[k]);
+            amounts[k - 1] = reserveIn
+                .mul(amounts[k])
+                .mul(1000)
+                .div(reserveOut.sub(amounts[k]).mul(997))
+                .add(1);
+        }
+    }
+
+    function _swap(
+        address factory,
+        uint256 amountIn,
+        uint256 amountOutMin,
+        address[] memory path
+    ) private {
+        uint256[] memory amounts = getAmountsOut(factory, amountIn, path);
+        require(amounts[amounts.length - 1] >= amountOutMin); // dev: insufficient output
+        _execute(factory, amounts, path);
+    }
+
+    function _buy(
+        address factory,
+        uint256 amountInMax,
+        uint256 amountOut,
+        address[] memory path
+    ) private {
+        uint256[] memory amounts = getAmountsIn(factory, amountOut, path);
+        require(amounts[0] <= amountInMax); // dev: excessive input
+        _execute(factory, amounts, path);
+    }
+
+    function _execute(
+        address factory,
+        uint256[] memory amounts,
+        address[] memory path
+    ) private {
+        MockTokenTransferProxy(tokenTransferProxy).transferFrom(
+            path[0],
+            msg.sender,
+            _pair(factory, path[0], path[1]),
+            amounts[0]
+        );
+        for (uint256 k = 0; k < path.length - 1; k++) {
+            address to =
+                k < path.length - 2
+                    ? _pair(factory, path[k + 1], path[k + 2])
+                    : msg.sender;
+            (uint256 amount0Out, uint256 amount1Out) =
+                path[k] < path[k + 1]
+                    ? (uint256(0), amounts[k + 1])
+                    : (amounts[k + 1], uint256(0));
+            MockUniswapV2Pair(_pair(factory, path[k], path[k + 1])).swap(
+                amount0Out,
+                amount1Out,
+                to,
+                new bytes(0)
+            );
+        }
+    }
+
+    function _pair(
+        address factory,
+        address tokenA,
+        address tokenB
+    ) private view returns (address pair) {
+        pair = IMockUniswapV2Factory(factory).getPair(tokenA, tokenB);
+        require(pair != address(0)); // dev: no pair
+    }
+
+    function _reserves(
+        address factory,
+        address tokenIn,
+        address tokenOut
+    ) private view returns (uint256 reserveIn, uint256 reserveOut) {
+        (uint256 reserve0, uint256 reserve1, ) =
+            MockUniswapV2Pair(_pair(factory, tokenIn, tokenOut)).getReserves();
+        (reserveIn, reserveOut) = tokenIn < tokenOut
+            ? (reserve0, reserve1)
+            : (reserve1, reserve0);
+    }
+}
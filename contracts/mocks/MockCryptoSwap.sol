@@ -0,0 +1,144 @@
+// SPDX-License-Identifier: MIT
+pragma solidity 0.6.12;
+
+import {SafeMath} from "@openzeppelin/contracts/math/SafeMath.sol";
+import {MockERC20} from "./MockERC20.sol";
+
+/// Three coin pool with the TriCrypto read/exchange interface
+/// @dev Not the crypto invariant: each trade is constant product between the
+///      two coins' balances in coin 0 terms (balance * precision * price_scale),
+///      less `mid_fee`. `last_prices` and `price_oracle` follow the spot price
+///      after every trade. Good enough for the bot's balances, grid and prefilter
+///      reads, the mempool projections (real pool math) will not match it.
+contract MockCryptoSwap {
+    using SafeMath for uint256;
+
+    uint256 constant N_COINS = 3;
+    uint256 constant PRECISION = 10**18;
+    uint256 constant FEE_DENOMINATOR = 10**10;
+
+    address[3] public coins;
+    uint256[3] public balances;
+    uint256[3] public precisions;
+    // prices of coins 1 and 2 in coin 0, 1e18 precision
+    uint256[2] public price_scale;
+    uint256[2] public price_oracle;
+    uint256[2] public last_prices;
+
+    uint256 public A_precise;
+    uint256 public gamma;
+    uint256 public mid_fee;
+    uint256 public out_fee;
+    uint256 public fee_gamma;
+
+    event TokenExchange(
+        address indexed buyer,
+        uint256 sold_id,
+        uint256 tokens_sold,
+        uint256 bought_id,
+        uint256 tokens_bought
+    );
+
+    function initialize(
+        address[3] memory _coins,
+        uint256[3] memory _precisions,
+        uint256[2] memory _price_scale,
+        uint256 _fee
+    ) public {
+        require(coins[0] == address(0)); // dev: already initialized
+        coins = _coins;
+        precisions = _precisions;
+        price_scale = _price_scale;
+        price_oracle = _price_scale;
+        last_prices = _price_scale;
+        // mainnet TriCrypto's parameters, only read by the bot
+        A_precise = 1707629;
+        gamma = 11809167828997;
+        fee_gamma = 500000000000000;
+        mid_fee = _fee;
+        out_fee = _fee;
+    }
+
+    function fee() external view returns (uint256) {
+        return mid_fee;
+    }
+
+    function D() external view returns (uint256 total) {
+        uint256[3] memory xp = _xp();
+        for (uint256 k = 0; k < N_COINS; k++) {
+            total = total.add(xp[k]);
+        }
+    }
+
+    function get_dy(
+        uint256 i,
+        uint256 j,
+        uint256 dx
+    ) public view returns (uint256) {
+        require(i != j && i < N_COINS && j < N_COINS); // dev: coin index out of range
+        uint256[3] memory xp = _xp();
+        uint256 dx_xp = dx.mul(precisions[i]).mul(_price(i)) / PRECISION;
+        uint256 dy_xp = xp[j].mul(dx_xp) / xp[i].add(dx_xp);
+        uint256 dy = dy_xp.mul(PRECISION) / _price(j) / precisions[j];
+        return dy.sub(dy.mul(mid_fee) / FEE_DENOMINATOR);
+    }
+
+    function exchange(
+        uint256 i,
+        uint256 j,
+        uint256 dx,
+        uint256 min_dy
+    ) external {
+        uint256 dy = get_dy(i, j, dx);
+        require(dy >= min_dy, "Slippage");
+        require(
+            MockERC20(coins[i]).transferFrom(msg.sender, address(this), dx)
+        );
+        require(MockERC20(coins[j]).transfer(msg.sender, dy));
+        balances[i] = balances[i].add(dx);
+        balances[j] = balances[j].sub(dy);
+        _update_prices();
+        emit TokenExchange(msg.sender, i, dx, j, dy);
+    }
+
+    function add_liquidity(uint256[3] calldata amounts, uint256) external {
+        for (uint256 k = 0; k < N_COINS; k++) {
+            if (amounts[k] > 0) {
+                require(
+                    MockERC20(coins[k]).transferFrom(
+                        msg.sender,
+                        address(this),
+                        amounts[k]
+                    )
+                );
+                balances[k] = balances[k].add(amounts[k]);
+            }
+        }
+        _update_prices();
+    }
+
+    function _price(uint256 k) internal view returns (uint256) {
+        return k == 0 ? PRECISION : price_scale[k - 1];
+    }
+
+    function _xp() internal view returns (uint256[3] memory xp) {
+        for (uint256 k = 0; k < N_COINS; k++) {
+            xp[k] = balances[k].mul(precisions[k]).mul(_price(k)) / PRECISION;
+        }
+    }
+
+    function _update_prices() internal {
+        uint256[3] memory xp = _xp();
+        if (xp[0] == 0) {
+            return;
+        }
+        for (uint256 k = 1; k < N_COINS; k++) {
+            if (xp[k] > 0) {
+                // spot price of coin k in coin 0 between the two balances
+                uint256 spot = _price(k).mul(xp[0]) / xp[k];
+                last_prices[k - 1] = spot;
+                price_oracle[k - 1] = spot;
+            }
+        }
+    }
+}
@@ -0,0 +1,80 @@
+// SPDX-License-Identifier: MIT
+pragma solidity 0.6.12;
+
+import {SafeMath} from "@openzeppelin/contracts/math/SafeMath.sol";
+
+/// ERC20 with open minting for the offline simulation
+/// @dev State is set in `initialize` so the runtime code can be placed at a
+///      mainnet token's address with setCode
+contract MockERC20 {
+    using SafeMath for uint256;
+
+    string public name;
+    string public symbol;
+    uint8 public decimals;
+    uint256 public totalSupply;
+
+    mapping(address => uint256) public balanceOf;
+    mapping(address => mapping(address => uint256)) public allowance;
+
+    event Transfer(address indexed from, address indexed to, uint256 value);
+    event Approval(
+        address indexed owner,
+        address indexed spender,
+        uint256 value
+    );
+
+    function initialize(
+        string memory _name,
+        string memory _symbol,
+        uint8 _decimals
+    ) public {
+        require(decimals == 0); // dev: already initialized
+        name = _name;
+        symbol = _symbol;
+        decimals = _decimals;
+    }
+
+    function approve(address _spender, uint256 _amount)
+        external
+        returns (bool)
+    {
+        allowance[msg.sender][_spender] = _amount;
+        emit Approval(msg.sender, _spender, _amount);
+        return true;
+    }
+
+    function transfer(address _to, uint256 _amount) external returns (bool) {
+        _transfer(msg.sender, _to, _amount);
+        return true;
+    }
+
+    function transferFrom(
+        address _from,
+        address _to,
+        uint256 _amount
+    ) external returns (bool) {
+        uint256 allowed = allowance[_from][msg.sender];
+        if (allowed != uint256(-1)) {
+            allowance[_from][msg.sender] = allowed.sub(_amount);
+        }
+        _transfer(_from, _to, _amount);
+        return true;
+    }
+
+    function mint(address _to, uint256 _amount) external {
+        totalSupply = totalSupply.add(_amount);
+        balanceOf[_to] = balanceOf[_to].add(_amount);
+        emit Transfer(address(0), _to, _amount);
+    }
+
+    function _transfer(
+        address _from,
+        address _to,
+        uint256 _amount
+    ) internal {
+        balanceOf[_from] = balanceOf[_from].sub(_amount);
+        balanceOf[_to] = balanceOf[_to].add(_amount);
+        emit Transfer(_from, _to, _amount);
+    }
+}
@@ -0,0 +1,100 @@
+// SPDX-License-Identifier: MIT
+pragma solidity 0.6.12;
+
+import {SafeMath} from "@openzeppelin/contracts/math/SafeMath.sol";
+import {
+    IFlashLoanReceiver
+} from "@aave/contracts/flashloan/interfaces/IFlashLoanReceiver.sol";
+import {MockERC20} from "./MockERC20.sol";
+
+/// AAVE v2 style flash loans out of the pool's own token balances
+/// @dev Every loan is repaid within the call (mode 0), `modes`, `onBehalfOf`
+///      and `referralCode` are accepted for ABI compatibility only
+contract MockLendingPool {
+    using SafeMath for uint256;
+
+    // in bps, same as AAVE v2 on mainnet
+    uint256 public constant FLASHLOAN_PREMIUM_TOTAL = 9;
+
+    event FlashLoan(
+        address indexed target,
+        address indexed initiator,
+        address indexed asset,
+        uint256 amount,
+        uint256 premium,
+        uint16 referralCode
+    );
+
+    function flashLoan(
+        address receiverAddress,
+        address[] memory assets,
+        uint256[] memory amounts,
+        uint256[] memory,
+        address,
+        bytes memory params,
+        uint16 referralCode
+    ) public {
+        require(assets.length == amounts.length); // dev: inconsistent params
+        uint256[] memory premiums = _lend(receiverAddress, assets, amounts);
+        require(
+            IFlashLoanReceiver(receiverAddress).executeOperation(
+                assets,
+                amounts,
+                premiums,
+                msg.sender,
+                params
+            )
+        ); // dev: invalid flash loan executor return
+        _collect(receiverAddress, assets, amounts, premiums, referralCode);
+    }
+
+    function _lend(
+        address receiverAddress,
+        address[] memory assets,
+        uint256[] memory amounts
+    ) private returns (uint256[] memory premiums) {
+        premiums = new uint256[](assets.length);
+        for (uint256 k = 0; k < assets.length; k++) {
+            premiums[k] = amounts[k].mul(FLASHLOAN_PREMIUM_TOTAL).div(10000);
+            require(MockERC20(assets[k]).transfer(receiverAddress, amounts[k]));
+        }
+    }
+
+    function _collect(
+        address receiverAddress,
+        address[] memory assets,
+        uint256[] memory amounts,
+        uint256[] memory premiums,
+        uint16 referralCode
+    ) private {
+        for (uint256 k = 0; k < assets.length; k++) {
+            require(
+                MockERC20(assets[k]).transferFrom(
+                    receiverAddress,
+                    address(this),
+                    amounts[k].add(premiums[k])
+                )
+            );
+            emit FlashLoan(
+                receiverAddress,
+                msg.sender,
+                assets[k],
+                amounts[k],
+                premiums[k],
+                referralCode
+            );
+        }
+    }
+}
+
+/// Points `getLendingPool` at a `MockLendingPool`
+/// @dev Placed at the mainnet provider's address with setCode, ArbieV3 reads
+///      the pool from there in its constructor
+contract MockLendingPoolAddressesProvider {
+    address public getLendingPool;
+
+    function initialize(address _lendingPool) external {
+        require(getLendingPool == address(0)); // dev: already initialized
+        getLendingPool = _lendingPool;
+    }
+}
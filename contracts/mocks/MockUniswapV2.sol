@@ -0,0 +1,133 @@
+// SPDX-License-Identifier: MIT
+pragma solidity 0.6.12;
+
+import {SafeMath} from "@openzeppelin/contracts/math/SafeMath.sol";
+import {MockERC20} from "./MockERC20.sol";
+
+/// Uniswap V2 pair without liquidity tokens or flash swaps
+/// @dev Reserves are seeded by transferring tokens in and calling `sync`
+contract MockUniswapV2Pair {
+    using SafeMath for uint256;
+
+    address public factory;
+    address public token0;
+    address public token1;
+
+    uint112 private reserve0;
+    uint112 private reserve1;
+    uint32 private blockTimestampLast;
+
+    event Swap(
+        address indexed sender,
+        uint256 amount0In,
+        uint256 amount1In,
+        uint256 amount0Out,
+        uint256 amount1Out,
+        address indexed to
+    );
+    event Sync(uint112 reserve0, uint112 reserve1);
+
+    function initialize(address _token0, address _token1) external {
+        require(factory == address(0)); // dev: already initialized
+        factory = msg.sender;
+        token0 = _token0;
+        token1 = _token1;
+    }
+
+    function getReserves()
+        public
+        view
+        returns (
+            uint112,
+            uint112,
+            uint32
+        )
+    {
+        return (reserve0, reserve1, blockTimestampLast);
+    }
+
+    function swap(
+        uint256 amount0Out,
+        uint256 amount1Out,
+        address to,
+        bytes calldata
+    ) external {
+        require(amount0Out > 0 || amount1Out > 0); // dev: insufficient output
+        require(amount0Out < reserve0 && amount1Out < reserve1); // dev: insufficient liquidity
+        if (amount0Out > 0) require(MockERC20(token0).transfer(to, amount0Out));
+        if (amount1Out > 0) require(MockERC20(token1).transfer(to, amount1Out));
+
+        uint256 balance0 = MockERC20(token0).balanceOf(address(this));
+        uint256 balance1 = MockERC20(token1).balanceOf(address(this));
+        uint256 amount0In =
+            balance0 > reserve0 - amount0Out
+                ? balance0 - (reserve0 - amount0Out)
+                : 0;
+        uint256 amount1In =
+            balance1 > reserve1 - amount1Out
+                ? balance1 - (reserve1 - amount1Out)
+                : 0;
+        require(amount0In > 0 || amount1In > 0); // dev: insufficient input
+        {
+            // 0.3% fee on the input, same K check as the real pair, scoped
+            // to keep the stack shallow
+            uint256 adjusted0 = balance0.mul(1000).sub(amount0In.mul(3));
+            uint256 adjusted1 = balance1.mul(1000).sub(amount1In.mul(3));
+            require(
+                adjusted0.mul(adjusted1) >=
+                    uint256(reserve0).mul(reserve1).mul(1000**2)
+            ); // dev: K
+        }
+
+        _update(balance0, balance1);
+        emit Swap(msg.sender, amount0In, amount1In, amount0Out, amount1Out, to);
+    }
+
+    function sync() external {
+        _update(
+            MockERC20(token0).balanceOf(address(this)),
+            MockERC20(token1).balanceOf(address(this))
+        );
+    }
+
+    function _update(uint256 balance0, uint256 balance1) private {
+        require(balance0 <= uint112(-1) && balance1 <= uint112(-1)); // dev: overflow
+        reserve0 = uint112(balance0);
+        reserve1 = uint112(balance1);
+        blockTimestampLast = uint32(block.timestamp);
+        emit Sync(reserve0, reserve1);
+    }
+}
+
+/// Uniswap V2 factory creating `MockUniswapV2Pair`s
+contract MockUniswapV2Factory {
+    mapping(address => mapping(address => address)) public getPair;
+    address[] public allPairs;
+
+    event PairCreated(
+        address indexed token0,
+        address indexed token1,
+        address pair,
+        uint256
+    );
+
+    function allPairsLength() external view returns (uint256) {
+        return allPairs.length;
+    }
+
+    function createPair(address tokenA, address tokenB)
+        external
+        returns (address pair)
+    {
+        require(tokenA != tokenB); // dev: identical addresses
+        (address token0, address token1) =
+            tokenA < tokenB ? (tokenA, tokenB) : (tokenB, tokenA);
+        require(getPair[token0][token1] == address(0)); // dev: pair exists
+        pair = address(new MockUniswapV2Pair());
+        MockUniswapV2Pair(pair).initialize(token0, token1);
+        getPair[token0][token1] = pair;
+        getPair[token1][token0] = pair;
+        allPairs.push(pair);
+        emit PairCreated(token0, token1, pair, allPairs.length);
+    }
+}
@@ -0,0 +1,197 @@
+"""Exact batched integer arithmetic for token amounts.
+
+Token amounts routinely exceed 2 ** 53 (1 WETH is 10 ** 18 wei) so float64 math
+silently drops the low digits, while object arrays of python ints are slow.
+``Amounts`` keeps a batch of unsigned 128-bit integers as two uint64 arrays
+(``hi``, ``lo``) and implements the handful of operations the strategy needs
+(add, sub, compare and ``mul_div`` by small integer fractions such as basis
+points) with numpy, splitting into 32-bit limbs where products need headroom.
+
+128 bits covers every realistic balance (3.4e20 tokens at 18 decimals). Values
+that do not fit, like the ``2 ** 256 - 1`` srcAmount placeholder for failed
+quotes, saturate to ``MAX_AMOUNT``; arithmetic that would overflow or go
+negative raises ``OverflowError``.
+"""
+import numpy as np
+
+MAX_AMOUNT = 2 ** 128 - 1
+_U64_MASK = 2 ** 64 - 1
+_U32 = np.uint64(32)
+_U32_MASK = np.uint64(2 ** 32 - 1)
+
+
+def _unwrap(obj):
+    return getattr(obj, "__wrapped__", obj)
+
+
+class Amounts:
+    """A batch of unsigned 128-bit integers"""
+
+    __slots__ = ("hi", "lo")
+
+    def __init__(self, hi, lo):
+        self.hi = np.asarray(hi, dtype=np.uint64)
+        self.lo = np.asarray(lo, dtype=np.uint64)
+
+    @classmethod
+    def from_ints(cls, values):
+        """Build from python ints, numeric strings or brownie ``Wei`` proxies"""
+        values = [min(int(_unwrap(value)), MAX_AMOUNT) for value in values]
+        hi = np.fromiter((value >> 64 for value in values), np.uint64, len(values))
+        lo = np.fromiter(
+            (value & _U64_MASK for value in values), np.uint64, len(values)
+        )
+        return cls(hi, lo)
+
+    @classmethod
+    def from_limbs(cls, limbs):
+        """Build from an ``(n, 2)`` array of ``[hi, lo]`` limbs"""
+        limbs = np.asarray(limbs, dtype=np.uint64).reshape(-1, 2)
+        return cls(limbs[:, 0], limbs[:, 1])
+
+    @classmethod
+    def full(cls, n, value):
+        return cls.from_ints([value]).repeat(n)
+
+    def repeat(self, n):
+        return Amounts(np.repeat(self.hi, n), np.repeat(self.lo, n))
+
+    def limbs(self):
+        return np.stack([self.hi, self.lo], axis=-1)
+
+    def to_ints(self):
+        return [(int(hi) << 64) | int(lo) for hi, lo in zip(self.hi, self.lo)]
+
+    def to_float(self):
+        """Approximate as float64, fine for ranking, never for amounts sent on chain"""
+        return self.hi.astype(np.float64) * 2.0 ** 64 + self.lo.astype(np.float64)
+
+    def ratio(self, other):
+        """``self / other`` as float64, for ranking candidates"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.to_float() / _coerce(other, len(self)).to_float()
+
+    def where(self, mask, other):
+        """``other`` where ``mask`` holds, ``self`` elsewhere"""
+        other = _coerce(other, len(self))
+        return Amounts(
+            np.where(mask, other.hi, self.hi), np.where(mask, other.lo, self.lo)
+        )
+
+    def __len__(self):
+        return len(self.hi)
+
+    def __getitem__(self, idx):
+        if np.isscalar(idx) or isinstance(idx, (int, np.integer)):
+            return (int(self.hi[idx]) << 64) | int(self.lo[idx])
+        return Amounts(self.hi[idx], self.lo[idx])
+
+    def __repr__(self):
+        return f"Amounts({self.to_ints()})"
+
+    def __add__(self, other):
+        other = _coerce(other, len(self))
+        lo = self.lo + other.lo
+        carry = (lo < self.lo).astype(np.uint64)
+        hi = self.hi + other.hi
+        overflow = hi < self.hi
+        hi_carry = hi + carry
+        overflow |= hi_carry < hi
+        if overflow.any():
+            raise OverflowError("amount addition overflows 128 bits")
+        return Amounts(hi_carry, lo)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        other = _coerce(other, len(self))
+        if (self < other).any():
+            raise OverflowError("amount subtraction underflows")
+        lo = self.lo - other.lo
+        borrow = (self.lo < other.lo).astype(np.uint64)
+        return Amounts(self.hi - other.hi - borrow, lo)
+
+    def _cmp(self, other):
+        """-1, 0 or 1 per element"""
+        other = _coerce(other, len(self))
+        hi = (self.hi > other.hi).astype(np.int8) - (self.hi < other.hi).astype(np.int8)
+        lo = (self.lo > other.lo).astype(np.int8) - (self.lo < other.lo).astype(np.int8)
+        return np.where(hi != 0, hi, lo)
+
+    def __lt__(self, other):
+        return self._cmp(other) < 0
+
+    def __le__(self, other):
+        return self._cmp(other) <= 0
+
+    def __gt__(self, other):
+        return self._cmp(other) > 0
+
+    def __ge__(self, other):
+        return self._cmp(other) >= 0
+
+    def __eq__(self, other):
+        return self._cmp(other) == 0
+
+    def __ne__(self, other):
+        return self._cmp(other) != 0
+
+    __hash__ = None
+
+    def mul_div(self, numerator, denominator):
+        """Exact ``floor(self * numerator / denominator)`` for 32-bit factors"""
+        num = np.asarray(numerator, dtype=np.uint64)
+        den = np.asarray(denominator, dtype=np.uint64)
+        if (num > _U32_MASK).any() or (den > _U32_MASK).any() or (den == 0).any():
+            raise ValueError("numerator and denominator must be in (0, 2 ** 32)")
+
+        # four little-endian 32-bit limbs, product needs a fifth
+        limbs = [
+            self.lo & _U32_MASK,
+            self.lo >> _U32,
+            self.hi & _U32_MASK,
+            self.hi >> _U32,
+        ]
+        product, carry = [], np.zeros(len(self), dtype=np.uint64)
+        for limb in limbs:
+            t = limb * num + carry
+            product.append(t & _U32_MASK)
+            carry = t >> _U32
+        product.append(carry)
+
+        quotient, rem = [None] * 5, np.zeros(len(self), dtype=np.uint64)
+        for k in range(4, -1, -1):
+            cur = (rem << _U32) | product[k]
+            quotient[k] = cur // den
+            rem = cur % den
+        if quotient[4].any():
+            raise OverflowError("amount multiplication overflows 128 bits")
+
+        hi = (quotient[3] << _U32) | quotient[2]
+        lo = (quotient[1] << _U32) | quotient[0]
+        return Amounts(hi, lo)
+
+
+def _coerce(value, n):
+    if isinstance(value, Amounts):
+        return value
+    if isinstance(value, (int, np.integer, str)) or hasattr(value, "__wrapped__"):
+        return Amounts.full(n, value)
+    return Amounts.from_ints(value)
+
+
+def to_limbs(values):
+    """Split integer amounts into an ``(n, 2)`` uint64 array of ``[hi, lo]`` limbs"""
+    return Amounts.from_ints(values).limbs()
+
+
+def from_limbs(limbs):
+    """Join ``[hi, lo]`` limbs back into a list of python ints"""
+    return Amounts.from_limbs(limbs).to_ints()
+
+
+def limbs_to_float(limbs):
+    """Approximate ``[hi, lo]`` limbs as float64 for vectorized screening"""
+    limbs = np.asarray(limbs, dtype=np.uint64)
+    hi, lo = limbs[..., 0].astype(np.float64), limbs[..., 1].astype(np.float64)
+    return hi * 2.0 ** 64 + lo
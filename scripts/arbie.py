@@ -1,10 +1,10 @@
 import concurrent.futures
 import itertools as it
-from mmap import ALLOCATIONGRANULARITY
 import os
 import sys
 import time
-from functools import lru_cache, partial
+from functools import lru_cache
+from mmap import ALLOCATIONGRANULARITY
 from pathlib import Path
 
 import numpy as np
@@ -12,14 +12,40 @@ import pandas as pd
 import requests
 from brownie import ArbieV3, accounts, chain, interface, multicall, web3
 from brownie.convert import to_address
-from brownie.network.gas.strategies import GasNowScalingStrategy, GasNowStrategy
 from cachecontrol import CacheControl
 from eth_abi import abi
 from hexbytes import HexBytes
 from loguru import logger
 from retry import retry
 
-ACCOUNT = accounts.add(os.getenv("PRIVATE_KEY"))
+from scripts import (
+    cancel,
+    codec,
+    config,
+    mempool,
+    metrics,
+    pool_math,
+    prefilter,
+    presim,
+    profiler,
+    quoting,
+    recorder,
+    rpc,
+    scanpool,
+    scheduler,
+    signers,
+    strategy,
+    surface,
+    templates,
+)
+from scripts.amounts import MAX_AMOUNT, Amounts
+from scripts.quoting import TooManyRequests
+
+# the first signer, pays for nothing but is the sender of gas estimates, there is
+# no point in retrying main() without keys so fail right away
+ACCOUNT = accounts.add(signers.require_keys(signers.KEYS)[0])
+# spread RPC calls over ARBIE_RPC_ENDPOINTS, if set, before any contract call
+rpc.install(web3)
 
 PROJECT_DIR = Path(__file__).parent.parent
 # Using tor proxies CloudFlare interrupts :/
@@ -31,20 +57,31 @@ RANDOM_STATE = 42
 N_THREADS = 30
 CHAIN_ID = 1
 
+# overridable to point the bot at local stand-ins, see scripts/simulate.py
+PARASWAP_API = os.getenv("ARBIE_PARASWAP_API", "https://apiv4.paraswap.io")
+COIN_GECKO_BASE = os.getenv("ARBIE_COINGECKO_API", "https://api.coingecko.com")
+
 # 1 = Ethereum Mainnet
-TOKENS_LIST_URL = f"https://apiv4.paraswap.io/v2/tokens/{CHAIN_ID}"
-PRICES_URL = "https://apiv4.paraswap.io/v2/prices"
-TX_BUILDER_URL = f"https://apiv4.paraswap.io/v2/transactions/{CHAIN_ID}"
-COIN_GECKO_API = (
-    "https://api.coingecko.com/api/v3/simple/price?ids=ethereum&vs_currencies={}"
-)
+TOKENS_LIST_URL = f"{PARASWAP_API}/v2/tokens/{CHAIN_ID}"
+PRICES_URL = f"{PARASWAP_API}/v2/prices"
+TX_BUILDER_URL = f"{PARASWAP_API}/v2/transactions/{CHAIN_ID}"
+COIN_GECKO_API = COIN_GECKO_BASE + "/api/v3/simple/price?ids=ethereum&vs_currencies={}"
 
 # Contract Addrs
-ARBIE_ADDR = "0x5CfB168f03f8185BD21a3d75f6887c6DCD2B1312"
+ARBIE_ADDR = os.getenv("ARBIE_ADDR", "0x5CfB168f03f8185BD21a3d75f6887c6DCD2B1312")
 TRICRYPTO_SWAP_ADDR = "0x80466c64868E1ab14a1Ddf27A676C3fcBE638Fe5"
 MULTICALL2_ADDR = "0x5BA1e12693Dc8F9c48aAD8770482f4739bEeD696"
 AUGUSTUSSWAPPER_ADDR = "0x1bD435F3C054b6e901B7b108a0ab7617C808677b"
 LENDING_POOL_ADDR_PROVIDER_ADDR = "0xB53C1a33016B2DC2fF3653530bfF1848a515c8c5"
+UNISWAP_ROUTER_ADDR = "0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D"
+UNISWAP_FACTORY_ADDR = "0x5C69bEe701ef814a2B6a3EDD4B1652CB9cc5aA6f"
+SUSHISWAP_ROUTER_ADDR = "0xd9e1cE17f2641f24aE83637ab66a2cca9C378B9F"
+SUSHISWAP_FACTORY_ADDR = "0xC0AEe478e3658e2610c5F7A4A2E1777cE9e4f2Ac"
+# the exchanges paraswap is allowed to route through, router -> factory
+V2_ROUTERS = {
+    UNISWAP_ROUTER_ADDR: UNISWAP_FACTORY_ADDR,
+    SUSHISWAP_ROUTER_ADDR: SUSHISWAP_FACTORY_ADDR,
+}
 
 # Contracts
 LENDING_POOL_ADDR_PROVIDER = interface.ILendingPoolAddressesProvider(
@@ -54,27 +91,38 @@ LENDING_POOL = interface.IAAVELendingPool(LENDING_POOL_ADDR_PROVIDER.getLendingP
 AUGUSTUSSWAPPER = interface.IAugustusSwapper(AUGUSTUSSWAPPER_ADDR)
 CRYPTO_SWAP = interface.CryptoSwap(TRICRYPTO_SWAP_ADDR)
 ARBIE = ArbieV3.at(ARBIE_ADDR)
+# receives the profit, its balance change is what a pre-simulated tx pays
+ARBIE_OWNER = ARBIE.owner() if presim.ENABLED else None
 
 # Contract Constants
 with multicall(MULTICALL2_ADDR) as call:
-    AAVE_FLASH_LOAN_FEE = call(LENDING_POOL).FLASHLOAN_PREMIUM_TOTAL()
-AAVE_FLASH_LOAN_FEE = AAVE_FLASH_LOAN_FEE.__wrapped__ / 10_000  # .09%
+    AAVE_FLASH_LOAN_PREMIUM = call(LENDING_POOL).FLASHLOAN_PREMIUM_TOTAL()
+AAVE_FLASH_LOAN_PREMIUM = AAVE_FLASH_LOAN_PREMIUM.__wrapped__  # in bps
+AAVE_FLASH_LOAN_FEE = AAVE_FLASH_LOAN_PREMIUM / strategy.BPS  # .09%
 SLIPPAGE = 0.01
+SLIPPAGE_BPS = strategy.to_bps(SLIPPAGE)
 
 ENCODE_TYP = "(bool,uint256,uint256,uint256,uint256,uint256,bytes)"
 
 # Thread Pool initialized here to reduce overhead of constantly creating
 THREAD_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=N_THREADS)
-
-TX_PARAMS = {
-    # "from": ACCOUNT,
-    "gas_price": GasNowScalingStrategy("fast"),
-    "required_confs": 3,
-}
-
-
-class TooManyRequests(Exception):
-    pass
+# cancels the work of a block as soon as a newer one is mined
+HEAD_WATCHER = cancel.HeadWatcher(lambda: web3.eth.block_number, poll_interval=0.5)
+# batches the reads made on the decision path into one round trip
+RPC_BATCH = rpc.Coalescer(web3)
+# spends the per block quote budget on the most promising grid rows
+SCHEDULER = scheduler.QuoteScheduler(scheduler.chain_budget(CHAIN_ID), N_THREADS)
+# prices the grid rows that were not quoted, from quotes of recent blocks
+QUOTE_MODEL = surface.QuoteModel()
+# raw multicalls for the per-block reads, decoded straight to ints
+MULTICALL = codec.Multicall(RPC_BATCH, MULTICALL2_ADDR)
+# strategy settings, hot reloaded from ARBIE_CONFIG and the control socket
+CONFIG = config.Config(SLIPPAGE, N_THREADS, 1 / 500, 1 / 250, 100, "Uniswap,Sushiswap")
+CONFIG_WATCHER = config.ConfigWatcher(CONFIG)
+# runs the mempool size search on ARBIE_SCAN_PROCESSES worker processes, if set
+SCAN_POOL = scanpool.ScanPool()
+# submits from whichever key has no tx in flight, without waiting for receipts
+SIGNERS = signers.SignerPool(signers.KEYS, RPC_BATCH, chain.id)
 
 
 # Logger Setup
@@ -128,22 +176,14 @@ def get_prices_data(_from, to, amount, side="SELL", network=CHAIN_ID, **kwargs):
         "amount": amount,
         "side": side,
         "network": network,
-        "includeDEXS": "Uniswap,Sushiswap",  # noqa
+        "includeDEXS": CONFIG.include_dexs,
     }
     query_params.update(kwargs)
-    resp = CACHED_SESSION.get(PRICES_URL, params=query_params)
-    if resp.ok:
-        return resp.json()
-    elif resp.status_code == 429:
-        raise TooManyRequests()
-    elif resp.status_code == 400:
-        return {"priceRoute": {"details": {"srcAmount": 2 ** 256 - 1, "destAmount": 0}}}
-    else:
-        raise Exception(resp.status_code)
+    return quoting.get_prices(CACHED_SESSION, PRICES_URL, query_params)
 
 
-def gas_limit_to_cost(gas_limit, address):
-    gas_price_eth = GasNowStrategy("fast").get_gas_price() / 10 ** 18  # in wei
+def gas_limit_to_cost(gas_limit, gas_price, address):
+    gas_price_eth = gas_price / 10 ** 18  # in wei
     row = tokens_df.loc[address]
     symbol = row["symbol"]
     if symbol in ("WETH", "ETH"):
@@ -168,12 +208,16 @@ def color(value):
     return "<g>" if value > AAVE_FLASH_LOAN_FEE else "<y>" if value > 0 else "<r>"
 
 
-def build_paraswap_tx(data, is_arb_curve=False):
+def build_paraswap_tx(quote, is_arb_curve=False):
 
-    details = data["priceRoute"]["details"]
+    price_route = quote.route
+    details = price_route["details"]
 
     if is_arb_curve:
-        details["destAmount"] = str(int(int(details["destAmount"]) * (1 - SLIPPAGE)))
+        dest_amount = Amounts.from_ints([details["destAmount"]])
+        details["destAmount"] = str(
+            strategy.curve_dest_amount_exact(dest_amount, SLIPPAGE_BPS)[0]
+        )
 
     from_token = to_address(details["tokenFrom"])
     to_token = to_address(details["tokenTo"])
@@ -182,7 +226,7 @@ def build_paraswap_tx(data, is_arb_curve=False):
         "fromDecimals": int(tokens_df.loc[from_token, "decimals"]),
         "referrer": "Arbie",
         "userAddress": ARBIE_ADDR,
-        "priceRoute": data["priceRoute"],
+        "priceRoute": price_route,
         "destAmount": details["destAmount"],  # need to account here
         "srcAmount": details["srcAmount"],
         "destToken": details["tokenTo"],
@@ -207,220 +251,617 @@ io_reverse_lookup = {
     idx: addr
     for idx, addr in zip(range(len(crypto_swap_coin_addrs)), crypto_swap_coin_addrs)
 }
+crypto_swap_symbols = [tokens_df.loc[addr, "symbol"] for addr in crypto_swap_coin_addrs]
+crypto_swap_precisions = tuple(
+    10 ** (18 - int(tokens_df.loc[addr, "decimals"])) for addr in crypto_swap_coin_addrs
+)
+
 
+def get_v2_pairs():
+    """Uniswap/Sushiswap pairs between the pool coins, keyed by (factory, a, b)
 
-def get_crypto_swap_balances():
-    """Get the token balances of the crypto swap"""
+    Both token orders map to the same pair address.
+    """
     with multicall(MULTICALL2_ADDR) as call:
-        return [call(CRYPTO_SWAP).balances(i) for i in range(3)]
+        pairs = {
+            (factory, a, b): call(interface.IUniswapV2Factory(factory)).getPair(a, b)
+            for factory in V2_ROUTERS.values()
+            for a, b in it.combinations(crypto_swap_coin_addrs, 2)
+        }
+    pair_index = {}
+    for (factory, a, b), pair in pairs.items():
+        pair = unwrap_proxy(pair)
+        if int(pair, 16):
+            pair_index[(factory, a, b)] = pair_index[(factory, b, a)] = pair
+    return pair_index
+
+
+# crypto pool parameters read for the local pool math, in CryptoPoolState order
+CRYPTO_POOL_CALLS = [
+    (TRICRYPTO_SWAP_ADDR, codec.encode_call(codec.selector(signature), *args))
+    for signature, *args in [
+        ("A_precise()",),
+        ("gamma()",),
+        ("D()",),
+        ("price_scale(uint256)", 0),
+        ("price_scale(uint256)", 1),
+        ("mid_fee()",),
+        ("out_fee()",),
+        ("fee_gamma()",),
+    ]
+] + [(TRICRYPTO_SWAP_ADDR, codec.balances(i)) for i in range(3)]
+# oracle and last trade prices of coins 1 and 2 in coin 0, then the current fee
+PREFILTER_CALLS = [
+    (TRICRYPTO_SWAP_ADDR, codec.encode_call(codec.selector(signature), k))
+    for signature in ("price_oracle(uint256)", "last_prices(uint256)")
+    for k in range(2)
+] + [(TRICRYPTO_SWAP_ADDR, codec.encode_call(codec.selector("fee()")))]
+
+
+def get_pool_snapshot(block_number):
+    """Crypto pool parameters and V2 reserves, the base the mempool projects from"""
+    pairs = {
+        pair: sorted((a, b), key=lambda addr: int(addr, 16))
+        for (_, a, b), pair in V2_PAIRS.items()
+    }
+    calls = CRYPTO_POOL_CALLS + [(pair, codec.GET_RESERVES) for pair in pairs]
+    _, results = MULTICALL.aggregate(calls)
+    n_params = len(CRYPTO_POOL_CALLS)
+    params = [codec.to_int(data) for data in results[:n_params]]
+    A, gamma, D, *price_scale, mid_fee, out_fee, fee_gamma = params[:-3]
+    crypto_pool = pool_math.CryptoPoolState(
+        A,
+        gamma,
+        D,
+        tuple(price_scale),
+        tuple(params[-3:]),
+        crypto_swap_precisions,
+        mid_fee,
+        out_fee,
+        fee_gamma,
+    )
+    v2_pairs = {
+        pair: pool_math.V2PairState(pair, *pairs[pair], *codec.reserves(data))
+        for pair, data in zip(pairs, results[n_params:])
+    }
+    return mempool.PoolSnapshot(block_number, crypto_pool, v2_pairs)
 
 
-def get_crypto_swap_io():
-    balances = get_crypto_swap_balances()
-    multicall_results = []
+# pending transaction watcher, candidates are prepared per pending tx hash
+# spot spreads are recorded for the backtester even while the prefilter is off
+TRACK_SPREADS = prefilter.ENABLED or recorder.ENABLED
+V2_PAIRS = get_v2_pairs() if mempool.ENABLED or TRACK_SPREADS else {}
+PENDING = (
+    mempool.PendingWatcher(RPC_BATCH, TRICRYPTO_SWAP_ADDR, V2_ROUTERS)
+    if mempool.ENABLED
+    else None
+)
+PREPARED = {}
 
-    # make calls to crypto_swap get_dy for 200 evenly spaced values
-    # between [balances[i] / 10, balances[i] / 2]
-    start_time = time.time()
-    with multicall(MULTICALL2_ADDR) as call:
-        for i, j in swap_io_pairs:
-            balance = balances[i]
-            for dx in np.linspace(balance // 500, balance // 250, 100):
-                dx = int(dx)
-                min_dy = call(CRYPTO_SWAP).get_dy(i, j, dx)
-                multicall_results.append([i, j, dx, min_dy])
-    logger.debug(f"Multicall2 response time: {time.time() - start_time:.2f}")
-    return multicall_results
 
+def make_tx_template(key):
+    """Flash loan envelope for a (direction, i, j) with placeholder amounts"""
+    direction, i, j = key
+    is_curve = direction == recorder.CURVE
+    # i > j > i borrows coin i, j > i > j borrows coin j
+    asset = crypto_swap_coin_addrs[i if is_curve else j]
 
-def arbitrage_curve(crypto_swap_io):
-    # buy on curve sell on quickswap
-    # aave i > curve j > paraswap i
+    def encode_params(dx, min_dy, deadline, payload):
+        return abi.encode_single(
+            ENCODE_TYP, [is_curve, i, j, dx, min_dy, deadline, payload]
+        )
+
+    def encode_flash_loan(amount, params):
+        return codec.flash_loan(
+            ARBIE_ADDR, [asset], [amount], [0], ACCOUNT.address, params, 0
+        )
+
+    return templates.build_template(key, encode_params, encode_flash_loan)
 
-    multicall_results = crypto_swap_io
 
-    # make calls to paraswap api checking for the best routes
-    # min dy is the output of the curve swap
-    df = pd.DataFrame(multicall_results, columns=["i", "j", "dx", "min_dy"]).applymap(
-        unwrap_proxy
+TX_TEMPLATES = templates.TemplateCache(make_tx_template)
+# (direction, i, j) of the last scanned block's best rows, pre-built while idle
+TOP_CANDIDATES = {}
+
+
+def apply_config(new, changed):
+    """Swap in a new strategy config between blocks, rebuilding only what it affects"""
+    global CONFIG, SLIPPAGE, SLIPPAGE_BPS, THREAD_POOL, swap_io_pairs
+    CONFIG, SLIPPAGE, SLIPPAGE_BPS = new, new.slippage, strategy.to_bps(new.slippage)
+    THREAD_POOL, swap_io_pairs = quoting.apply_config(
+        new,
+        changed,
+        SCHEDULER,
+        QUOTE_MODEL,
+        THREAD_POOL,
+        swap_io_pairs,
+        crypto_swap_symbols,
+        TOP_CANDIDATES,
     )
+    if changed & {"slippage", "coins", "dx_min", "dx_max", "grid_size"}:
+        # sizes prepared from the mempool assumed the old settings
+        PREPARED.clear()
 
-    df["from"] = df["j"].replace(io_reverse_lookup)
-    df["to"] = df["i"].replace(io_reverse_lookup)
 
-    # take a random sample of 10% since we can't ping the paraswap api for all opportunities
-    sampling_df = df.sample(frac=0.10)
+def estimate_tx(calldata):
+    """Gas limit and gas price of a flash loan tx, in one batched round trip
 
-    logger.debug(
-        f"Calling Prices API {sampling_df.shape[0]} time(s) with {N_THREADS} threads"
+    The head block rides along in the same batch so a newer block cancels the
+    scan before anything is submitted.
+    """
+    tx = {"from": ACCOUNT.address, "to": LENDING_POOL.address, "data": calldata}
+    gas_limit, gas_price, head = RPC_BATCH.gather(
+        ("eth_estimateGas", [tx]), ("eth_gasPrice", []), ("eth_blockNumber", [])
     )
-    start_time = time.time()
-    # use threading to speed things up hopefully execution is <2-3 seconds
-    # real time: up to 10 seconds at worst
-    futures = THREAD_POOL.map(
-        get_prices_data,
-        sampling_df["from"].tolist(),
-        sampling_df["to"].tolist(),
-        sampling_df["min_dy"].tolist(),  # input amount
-        timeout=10,
+    HEAD_WATCHER.observe(rpc.to_int(head))
+    return rpc.to_int(gas_limit), rpc.to_int(gas_price)
+
+
+def submit_tx(calldata, gas_limit, gas_price, deadline):
+    """Send a flash loan tx from an idle signer, returns the decision fields"""
+    signer = SIGNERS.acquire()
+    if signer is None:
+        logger.warning(f"All {len(SIGNERS)} signer(s) have a tx in flight, skipping")
+        return {}
+    try:
+        with metrics.span("submission"):
+            tx_hash = SIGNERS.submit(
+                signer, LENDING_POOL.address, calldata, gas_limit, gas_price, deadline
+            )
+    except BaseException:
+        SIGNERS.release(signer)
+        raise
+    return {"outcome": recorder.PENDING, "tx_hash": HexBytes(tx_hash)}
+
+
+def get_crypto_swap_balances(spreads=False):
+    """Get the token balances of the crypto swap
+
+    With ``spreads`` the same multicall also prices every pair for the prefilter,
+    returns ``(balances, {(i, j): spread})``.
+    """
+    calls = CRYPTO_POOL_CALLS[-3:]
+    pairs = list(set(V2_PAIRS.values())) if spreads else []
+    if spreads:
+        calls = calls + PREFILTER_CALLS + [(pair, codec.GET_RESERVES) for pair in pairs]
+    with metrics.span("balance_fetch"):
+        _, results = MULTICALL.aggregate(calls)
+    balances = [codec.to_int(data) for data in results[:3]]
+    if not spreads:
+        return balances, None
+
+    words = [codec.to_int(data) for data in results[3:8]]
+    curve_prices = [
+        prefilter.crypto_prices(words[0:2]),
+        prefilter.crypto_prices(words[2:4]),
+    ]
+    reserves = {pair: codec.reserves(data) for pair, data in zip(pairs, results[8:])}
+    coin_index = {addr: idx for idx, addr in io_reverse_lookup.items()}
+    dex_rates = {}
+    for (_, a, b), pair in V2_PAIRS.items():
+        reserve_a, reserve_b = reserves[pair]
+        if int(a, 16) > int(b, 16):
+            reserve_a, reserve_b = reserve_b, reserve_a
+        if not (reserve_a and reserve_b):
+            continue
+        key = coin_index[a], coin_index[b]
+        precisions = [crypto_swap_precisions[idx] for idx in key]
+        rate = prefilter.v2_rate(reserve_a, reserve_b, *precisions)
+        dex_rates[key] = max(dex_rates.get(key, 0.0), rate)
+    curve_fee = words[4] / pool_math.FEE_DENOMINATOR
+    return balances, prefilter.spreads(curve_prices, dex_rates, curve_fee)
+
+
+def prefilter_pairs(pair_spreads):
+    """Pairs whose spot spread could pay for a trade, all of them while disabled"""
+    min_spread = prefilter.threshold(AAVE_FLASH_LOAN_FEE, SLIPPAGE)
+    pairs = swap_io_pairs
+    if prefilter.ENABLED:
+        pairs = prefilter.select(swap_io_pairs, pair_spreads, min_spread)
+        logger.debug(f"Prefilter kept {len(pairs)}/{len(swap_io_pairs)} pair(s)")
+        metrics.inc("prefilter_skipped_total", len(swap_io_pairs) - len(pairs))
+    recorder.record_prefilter(
+        [
+            (i, j, pair_spreads.get((i, j), np.nan), (i, j) in pairs)
+            for i, j in swap_io_pairs
+        ]
     )
-    results = list(futures)
-    logger.debug(f"API response time: {time.time() - start_time:.2f}s")
-    sampling_df["results"] = results
-    sampling_df["dest_amount"] = sampling_df["results"].map(
-        # need to account for in tx building
-        lambda x: float(x["priceRoute"]["details"]["destAmount"])
-        * (1 - SLIPPAGE)
+    return pairs
+
+
+def get_crypto_swap_io(sizes=None):
+    balances, pair_spreads = get_crypto_swap_balances(TRACK_SPREADS and sizes is None)
+    pairs = swap_io_pairs if pair_spreads is None else prefilter_pairs(pair_spreads)
+
+    # make calls to crypto_swap get_dy for CONFIG.grid_size evenly spaced values
+    # between [balances[i] * CONFIG.dx_min, balances[i] * CONFIG.dx_max]
+    if sizes is None:
+        sizes = [
+            (i, j, int(dx))
+            for i, j in pairs
+            for dx in np.linspace(
+                balances[i] * CONFIG.dx_min,
+                balances[i] * CONFIG.dx_max,
+                CONFIG.grid_size,
+            )
+        ]
+    # else sizes found against a projected state, priced against the real one
+    with metrics.span("grid_multicall") as span:
+        min_dys = MULTICALL.uints(
+            [(TRICRYPTO_SWAP_ADDR, codec.get_dy(i, j, dx)) for i, j, dx in sizes]
+        )
+    multicall_results = [
+        [i, j, dx, min_dy] for (i, j, dx), min_dy in zip(sizes, min_dys)
+    ]
+    logger.debug(f"Multicall2 response time: {span.elapsed:.2f}")
+    recorder.record_balances(balances)
+    recorder.record_grid(multicall_results)
+    return multicall_results, balances, pair_spreads
+
+
+def request_quote(direction, i, j, dx, min_dy):
+    """Paraswap quote for one grid row, both directions trade coin j into coin i"""
+    _from, to = io_reverse_lookup[j], io_reverse_lookup[i]
+    if direction == recorder.CURVE:
+        # min dy is the output of the curve swap
+        return get_prices_data(_from, to, min_dy)
+    # slippage, no need to account for in tx building since we do so here
+    buy_amount = strategy.paraswap_buy_amount_exact(
+        Amounts.from_ints([dx]), SLIPPAGE_BPS
     )
-    sampling_df["profit"] = (
-        sampling_df["dest_amount"] - sampling_df["dx"]
-    ) / sampling_df["dx"]
-    return sampling_df
+    return get_prices_data(_from, to, buy_amount.to_ints()[0], side="BUY")
 
 
-def arbitrage_paraswap(crypto_swap_io):
-    # buy on paraswap sell on curve
-    # aave j > paraswap i > curve j
+def quote_margins(rows, results):
+    """Approximate margins of answered quotes under the current slippage"""
+    return quoting.quote_margins(rows, results, SLIPPAGE)
 
-    multicall_results = crypto_swap_io
 
-    # make calls to paraswap api checking for the best routes
-    # min dy is the output of the curve swap
-    df = pd.DataFrame(multicall_results, columns=["i", "j", "dx", "min_dy"]).applymap(
-        unwrap_proxy
+def quote_grid(crypto_swap_io, balances, pair_spreads, scope, quote_all=False):
+    """Quote the grid rows worth quoting in both directions, best expected value first"""
+    grid = pd.DataFrame(crypto_swap_io, columns=["i", "j", "dx", "min_dy"])
+    grid["size"] = grid["dx"] / np.asarray(balances, dtype=np.float64)[grid["i"]]
+    candidates = pd.concat(
+        [
+            grid.assign(direction=recorder.CURVE),
+            grid.assign(direction=recorder.PARASWAP),
+        ],
+        ignore_index=True,
     )
+    prior = None
+    if pair_spreads is not None:
+        # both directions pay the slippage allowance out of the spot spread
+        prior = np.array(
+            [
+                pair_spreads.get((i, j), SCHEDULER.floor + SLIPPAGE) - SLIPPAGE
+                for i, j in zip(candidates["i"], candidates["j"])
+            ]
+        )
+    with metrics.span("quote_fanout") as span:
+        quoted = SCHEDULER.run(
+            scope,
+            THREAD_POOL,
+            candidates,
+            request_quote,
+            quote_margins,
+            prior,
+            quote_all,
+        )
+    logger.debug(f"API response time: {span.elapsed:.2f}s")
+    if surface.ENABLED:
+        quoted = quoting.confirm_predicted(
+            scope,
+            THREAD_POOL,
+            QUOTE_MODEL,
+            candidates,
+            quoted,
+            request_quote,
+            quote_margins,
+            AAVE_FLASH_LOAN_FEE,
+        )
+    quoted["from"] = quoted["j"].replace(io_reverse_lookup)
+    quoted["to"] = quoted["i"].replace(io_reverse_lookup)
+    return {
+        direction: quoted[quoted["direction"] == direction].drop(
+            columns=["direction", "size"]
+        )
+        for direction in (recorder.CURVE, recorder.PARASWAP)
+    }
 
-    df["from"] = df["j"].replace(io_reverse_lookup)
-    df["to"] = df["i"].replace(io_reverse_lookup)
-
-    # take a random sample of 10% since we can't ping the paraswap api for all opportunities
-    sampling_df = df.sample(frac=0.10)
 
-    logger.debug(
-        f"Calling Prices API {sampling_df.shape[0]} time(s) with {N_THREADS} threads"
+def arbitrage_curve(sampling_df):
+    # buy on curve sell on quickswap
+    # aave i > curve j > paraswap i
+    results = sampling_df["results"].tolist()
+    recorder.record_quotes(
+        recorder.CURVE,
+        zip(
+            sampling_df["i"],
+            sampling_df["j"],
+            sampling_df["dx"],
+            sampling_df["min_dy"],
+            [x.dest_amount for x in results],
+        ),
     )
-    start_time = time.time()
-    # use threading to speed things up hopefully execution is <2-3 seconds
-    # real time: up to 10 seconds at worst
-    func = partial(get_prices_data, side="BUY")
-    futures = THREAD_POOL.map(
-        func,
-        sampling_df["from"].tolist(),
-        sampling_df["to"].tolist(),
-        # no need to account for in tx building call since
-        # we do so in our initial call
-        (sampling_df["dx"] * (1 + SLIPPAGE)).tolist(),
-        timeout=10,
+    dx = Amounts.from_ints(sampling_df["dx"])
+    dest_amount = Amounts.from_ints([x.dest_amount for x in results])
+    # need to account for in tx building
+    dest_amount = strategy.curve_dest_amount_exact(dest_amount, SLIPPAGE_BPS)
+    sampling_df["dest_amount"] = dest_amount.to_ints()
+    sampling_df["repay_amount"] = strategy.flash_loan_repayment_exact(
+        dx, AAVE_FLASH_LOAN_PREMIUM
+    ).to_ints()
+    sampling_df["profit"] = dest_amount.ratio(dx) - 1
+    return sampling_df
+
+
+def arbitrage_paraswap(sampling_df):
+    # buy on paraswap sell on curve
+    # aave j > paraswap i > curve j
+    results = sampling_df["results"].tolist()
+    recorder.record_quotes(
+        recorder.PARASWAP,
+        zip(
+            sampling_df["i"],
+            sampling_df["j"],
+            sampling_df["dx"],
+            sampling_df["min_dy"],
+            [x.src_amount for x in results],
+        ),
     )
-    results = list(futures)
-    logger.debug(f"API response time: {time.time() - start_time:.2f}s")
-    sampling_df["results"] = results
-    sampling_df["src_amount"] = sampling_df["results"].map(
-        lambda x: float(x["priceRoute"]["details"]["srcAmount"])
+    src_amount = Amounts.from_ints([x.src_amount for x in results])
+    sampling_df["src_amount"] = src_amount.to_ints()
+    sampling_df["repay_amount"] = strategy.flash_loan_repayment_exact(
+        src_amount, AAVE_FLASH_LOAN_PREMIUM
+    ).to_ints()
+    min_dy = Amounts.from_ints(sampling_df["min_dy"])
+    # failed quotes can never be profitable
+    sampling_df["profit"] = np.where(
+        src_amount == MAX_AMOUNT, -np.inf, min_dy.ratio(src_amount) - 1
     )
-    sampling_df["profit"] = (
-        sampling_df["min_dy"] - sampling_df["src_amount"]
-    ) / sampling_df["src_amount"]
     return sampling_df
 
 
-def go_arbie():
-    crypto_swap_io = get_crypto_swap_io()
+# direction names for the logs
+DIRECTIONS = {recorder.CURVE: "Curve", recorder.PARASWAP: "Paraswap"}
 
-    curve_df = arbitrage_curve(crypto_swap_io)
-    curve_row_idx = np.argmax(curve_df["profit"])
-    gc_profit_margin = curve_df.iloc[curve_row_idx, -1]
-    logger.opt(colors=True).info(
-        f"Curve Arb Profit Margin: {color(gc_profit_margin)}{gc_profit_margin:.2%}</>"
+
+def flash_loan_terms(direction, row):
+    """Borrowed amount, expected proceeds and the coin both are in, for a quoted row"""
+    if direction == recorder.CURVE:
+        # i > j > i
+        return int(row.dx), int(row.dest_amount), row["to"]
+    # j > i > j
+    return int(row.src_amount), int(row.min_dy), row["from"]
+
+
+def render_flash_loan(direction, row, paraswap_tx):
+    """``LENDING_POOL.flashLoan`` calldata for a row and its paraswap tx, and its deadline"""
+    paraswap_calldata = HexBytes(paraswap_tx["data"])
+    # calldata sent to lending pool, wrapping the params given to arbie
+    template = TX_TEMPLATES.get((direction, int(row.i), int(row.j)))
+    amount, _, _ = flash_loan_terms(direction, row)
+    deadline = chain.time() + 120
+    calldata = HexBytes(
+        template.render(
+            amount, int(row.dx), int(row.min_dy), deadline, paraswap_calldata
+        )
+    ).hex()
+    return calldata, deadline
+
+
+def try_build_paraswap_tx(quote, is_arb_curve=False):
+    """``build_paraswap_tx``, ``None`` if paraswap would not build it"""
+    try:
+        return build_paraswap_tx(quote, is_arb_curve)
+    except Exception as exc:
+        logger.warning(f"Could not build a paraswap tx: {exc!r}")
+        return None
+
+
+def try_row(scope, direction, row):
+    """Build, estimate and submit a direction's best row, returns the decision fields"""
+    metrics.observe_decision()
+    with metrics.span("tx_build"):
+        paraswap_tx = scope.call(
+            THREAD_POOL, build_paraswap_tx, row.results, direction == recorder.CURVE
+        )
+        calldata, deadline = render_flash_loan(direction, row, paraswap_tx)
+    with metrics.span("gas_estimation"):
+        gas_limit, gas_price = scope.call(THREAD_POOL, estimate_tx, calldata)
+    _, proceeds, asset = flash_loan_terms(direction, row)
+    cost, symbol, decimals = gas_limit_to_cost(gas_limit, gas_price, asset)
+    logger.info(
+        f"Estimated Gas Limit: {gas_limit} - Estimated cost: {cost / 10 ** decimals:.5f} {symbol}"
     )
+    decision = {"gas_limit": gas_limit, "gas_cost": int(cost)}
+    net_profit = proceeds - row["repay_amount"] - int(cost)
+    # last chance to back out, a submitted tx can only be cancelled at a cost
+    scope.check()
+    if net_profit > 0:
+        decision.update(submit_tx(calldata, gas_limit, gas_price, deadline))
+    return decision
 
-    if gc_profit_margin > AAVE_FLASH_LOAN_FEE:
-        # arbing curve
-        row = curve_df.iloc[curve_row_idx]
-        paraswap_tx = build_paraswap_tx(row.results, True)
-        paraswap_calldata = HexBytes(paraswap_tx["data"])
-        # calldata given to arbie through the lending pool
-        params = abi.encode_single(
-            ENCODE_TYP,
-            [
-                True,
-                int(row.i),
-                int(row.j),
-                int(row.dx),
-                int(row.min_dy),
-                chain.time() + 120,
-                paraswap_calldata,
-            ],
+
+def presimulate(scope, frames):
+    """Dry-run the top rows of both directions and submit the best that pays
+
+    Returns ``{direction: (row, decision fields)}`` of the submitted row, empty
+    if nothing was submitted.
+    """
+    rows = presim.top_rows(frames, presim.TOP_K, AAVE_FLASH_LOAN_FEE)
+    if not rows:
+        return {}
+    metrics.observe_decision()
+    with metrics.span("tx_build"):
+        paraswap_txs = scope.map(
+            THREAD_POOL,
+            try_build_paraswap_tx,
+            [row.results for _, row in rows],
+            [direction == recorder.CURVE for direction, _ in rows],
         )
-        # calldata sent to lending pool
-        # i > j > i
-        calldata = LENDING_POOL.flashLoan.encode_input(
-            ARBIE_ADDR,
-            [crypto_swap_coin_addrs[row.i]],
-            [int(row.dx)],
-            [0],
+        candidates = []
+        for (direction, row), paraswap_tx in zip(rows, paraswap_txs):
+            if paraswap_tx is None:
+                continue
+            calldata, deadline = render_flash_loan(direction, row, paraswap_tx)
+            _, _, asset = flash_loan_terms(direction, row)
+            candidates.append(
+                presim.Candidate(direction, row, asset, calldata, deadline)
+            )
+    if not candidates:
+        return {}
+    with metrics.span("presimulation"):
+        results, gas_price, head = scope.call(
+            THREAD_POOL,
+            presim.simulate,
+            RPC_BATCH,
+            MULTICALL2_ADDR,
+            LENDING_POOL.address,
             ACCOUNT.address,
-            params,
-            0,
-        )
-        gas_limit = web3.eth.estimate_gas(
-            {"from": ACCOUNT.address, "to": LENDING_POOL.address, "data": calldata}
+            ARBIE_OWNER,
+            candidates,
         )
-        cost, symbol, decimals = gas_limit_to_cost(gas_limit, row["to"])
-        logger.info(
-            f"Estimated Gas Limit: {gas_limit} - Estimated cost: {cost / 10 ** decimals:.5f} {symbol}"
+    HEAD_WATCHER.observe(head)
+    # gas cost per unit of gas in each borrowed coin, priced once per coin
+    unit_costs = {
+        asset: gas_limit_to_cost(1, gas_price, asset)[0]
+        for asset in {result.candidate.asset for result in results if result.ok}
+    }
+
+    def gas_cost(result):
+        return int(result.gas_limit * unit_costs[result.candidate.asset])
+
+    for result in results:
+        candidate = result.candidate
+        label = (
+            f"{DIRECTIONS[candidate.direction]} {candidate.row.i} > {candidate.row.j} "
+            f"dx {candidate.row.dx}"
         )
-        if row["dest_amount"] - (row["dx"] * (1 + AAVE_FLASH_LOAN_FEE)) - cost > 0:
-            ACCOUNT.transfer(
-                LENDING_POOL, data=calldata, gas_limit=gas_limit, **TX_PARAMS
+        if result.ok:
+            logger.info(
+                f"Pre-simulated {label}: profit {result.profit}, "
+                f"gas {result.gas_limit} costing {gas_cost(result)}"
             )
+        else:
+            metrics.inc("presim_reverted_total")
+            logger.info(f"Pre-simulated {label}: reverts ({result.error})")
+    best = presim.choose(results, lambda result: result.profit - gas_cost(result))
+    # last chance to back out, a submitted tx can only be cancelled at a cost
+    scope.check()
+    if best is None:
+        logger.info("No pre-simulated candidate pays for its gas")
+        return {}
+    candidate = best.candidate
+    decision = {"gas_limit": best.gas_limit, "gas_cost": gas_cost(best)}
+    decision.update(
+        submit_tx(candidate.calldata, best.gas_limit, gas_price, candidate.deadline)
+    )
+    return {candidate.direction: (candidate.row, decision)}
+
+
+def record_row(direction, row, decision):
+    # record the raw quote, tx building adjusts destAmount for slippage
+    results = row.results
+    quote = results.dest_amount if direction == recorder.CURVE else results.src_amount
+    recorder.record_decision(
+        direction,
+        (row.i, row.j, row.dx, row.min_dy, quote),
+        row["profit"],
+        **decision,
+    )
+
 
-    paraswap_df = arbitrage_paraswap(crypto_swap_io)
-    paraswap_row_idx = np.argmax(paraswap_df["profit"])
-    gp_profit_margin = paraswap_df.iloc[paraswap_row_idx, -1]
+def best_row(direction, frame):
+    row = frame.iloc[np.argmax(frame["profit"])]
+    margin = row["profit"]
     logger.opt(colors=True).info(
-        f"Paraswap Arb Profit Margin: {color(gp_profit_margin)}{gp_profit_margin:.2%}</>"
+        f"{DIRECTIONS[direction]} Arb Profit Margin: {color(margin)}{margin:.2%}</>"
     )
-
-    if gp_profit_margin > AAVE_FLASH_LOAN_FEE:
-        # arbing paraswap
-        row = paraswap_df.iloc[paraswap_row_idx]
-        paraswap_tx = build_paraswap_tx(row.results)
-        paraswap_calldata = HexBytes(paraswap_tx["data"])
-        params = abi.encode_single(
-            ENCODE_TYP,
-            [
-                False,
-                int(row.i),
-                int(row.j),
-                int(row.dx),
-                int(row.min_dy),
-                chain.time() + 120,
-                paraswap_calldata,
-            ],
-        )
-        # j > i > j
-        calldata = LENDING_POOL.flashLoan.encode_input(
-            ARBIE_ADDR,
-            [crypto_swap_coin_addrs[row.j]],
-            [int(row.src_amount)],
-            [0],
-            ACCOUNT.address,
-            params,
-            0,
+    TOP_CANDIDATES[direction] = (direction, int(row.i), int(row.j))
+    return row
+
+
+def go_arbie(scope, sizes=None):
+    crypto_swap_io, balances, pair_spreads = get_crypto_swap_io(sizes)
+    scope.check()
+    if not crypto_swap_io:
+        logger.info("No pair passed the prefilter")
+        return
+    # prepared sizes are few enough to quote them all
+    quoted = quote_grid(
+        crypto_swap_io, balances, pair_spreads, scope, sizes is not None
+    )
+    scope.check()
+
+    if not presim.ENABLED:
+        # buy on curve sell on paraswap, then buy on paraswap sell on curve
+        for direction, arbitrage in (
+            (recorder.CURVE, arbitrage_curve),
+            (recorder.PARASWAP, arbitrage_paraswap),
+        ):
+            row = best_row(direction, arbitrage(quoted[direction]))
+            decision = {}
+            if strategy.is_candidate(row["profit"], AAVE_FLASH_LOAN_FEE):
+                decision = try_row(scope, direction, row)
+            record_row(direction, row, decision)
+            scope.check()
+        return
+
+    frames = {
+        recorder.CURVE: arbitrage_curve(quoted[recorder.CURVE]),
+        recorder.PARASWAP: arbitrage_paraswap(quoted[recorder.PARASWAP]),
+    }
+    best = {
+        direction: best_row(direction, frame) for direction, frame in frames.items()
+    }
+    submitted = presimulate(scope, frames)
+    for direction, row in best.items():
+        # the submitted row takes the place of its direction's best
+        row, decision = submitted.get(direction, (row, {}))
+        record_row(direction, row, decision)
+
+
+def prepare_projections(deadline):
+    """Re-run the size search for every pending tx projected before ``deadline``"""
+    while True:
+        projection = PENDING.wait(deadline - time.time())
+        if projection is None:
+            return
+        candidates = mempool.search(
+            projection.snapshot,
+            crypto_swap_coin_addrs,
+            V2_PAIRS,
+            V2_ROUTERS.values(),
+            CONFIG,
+            simulate=SCAN_POOL.simulate,
         )
-
-        gas_limit = web3.eth.estimate_gas(
-            {"from": ACCOUNT.address, "to": LENDING_POOL.address, "data": calldata}
+        PREPARED[projection.tx_hash] = sorted(
+            {
+                row
+                for rows in candidates.values()
+                for row in rows
+                if row[:2] in swap_io_pairs
+            }
         )
-        cost, symbol, decimals = gas_limit_to_cost(gas_limit, row["from"])
-        logger.info(
-            f"Estimated Gas Limit: {gas_limit} - Estimated cost: {cost / 10 ** decimals:.5f} {symbol}"
+        TX_TEMPLATES.prebuild(
+            (direction, i, j)
+            for direction, rows in candidates.items()
+            for i, j, _ in rows
         )
-        if row["min_dy"] - (row["src_amount"] * (1 + AAVE_FLASH_LOAN_FEE)) - cost > 0:
-            ACCOUNT.transfer(
-                LENDING_POOL, data=calldata, gas_limit=gas_limit, **TX_PARAMS
-            )
+        logger.debug(f"Prepared sizes for pending tx {projection.tx_hash}")
+
+
+def take_prepared(block):
+    """Sizes prepared for the latest projected tx mined in ``block``, if any"""
+    mined = {HexBytes(tx_hash).hex() for tx_hash in block["transactions"]}
+    sizes = None
+    # projections stack in arrival order, the latest mined one includes the rest
+    for tx_hash, prepared in PREPARED.items():
+        if tx_hash in mined:
+            sizes = prepared
+    PREPARED.clear()
+    return sizes
 
 
 @retry(
@@ -430,8 +871,48 @@ def go_arbie():
     logger=logger,
 )
 def main():
-    for block in chain.new_blocks():
-        logger.opt(colors=True).info(f"New block mined <c>{block['number']}</>")
-        go_arbie()
-        logger.debug("Sleeping for 5s")
-        time.sleep(5)
\ No newline at end of file
+    metrics.start(PROJECT_DIR.joinpath("logs"), CHAIN_ID)
+    profiler.start(PROJECT_DIR.joinpath("logs"), CHAIN_ID)
+    recorder.start(PROJECT_DIR.joinpath(f"data/history-{CHAIN_ID}"))
+    HEAD_WATCHER.start()
+    started = CONFIG_WATCHER.start()
+    apply_config(started, config.changed_fields(CONFIG, started))
+    SIGNERS.start()
+    if PENDING is not None:
+        PENDING.start()
+        SCAN_POOL.start()
+    try:
+        for block in chain.new_blocks():
+            logger.opt(colors=True).info(f"New block mined <c>{block['number']}</>")
+            metrics.mark_block(block)
+            recorder.begin_block(block)
+            for tx_hash, outcome in SIGNERS.outcomes():
+                recorder.record_outcome(HexBytes(tx_hash), outcome)
+            update = CONFIG_WATCHER.poll()
+            if update is not None:
+                apply_config(*update)
+            scope = HEAD_WATCHER.new_scope(block["number"])
+            sizes = take_prepared(block) if PENDING is not None else None
+            if sizes is not None:
+                logger.info(f"Using {len(sizes)} size(s) prepared from the mempool")
+            try:
+                with profiler.block(block["number"]):
+                    go_arbie(scope, sizes)
+            except cancel.Cancelled as exc:
+                # the next block is already waiting, skip straight to it
+                logger.info(f"Abandoned {exc}")
+                metrics.inc("blocks_cancelled_total")
+                recorder.end_block()
+                continue
+            recorder.end_block()
+            # use the idle window to get the next block's transactions ready
+            idle_until = time.time() + 5
+            TX_TEMPLATES.prebuild(TOP_CANDIDATES.values())
+            if PENDING is not None:
+                PENDING.update(get_pool_snapshot(block["number"]), V2_PAIRS)
+                prepare_projections(idle_until)
+            logger.debug("Sleeping for 5s")
+            time.sleep(max(idle_until - time.time(), 0))
+    finally:
+        recorder.flush()
+        SCAN_POOL.close()
@@ -0,0 +1,340 @@
+"""Replay recorded history through the strategy math, no network required.
+
+Every recorded quote is re-priced with a parameter set (slippage, flash loan
+premium, margin threshold, dx range, gas model), the best row per block and
+direction is chosen exactly like ``go_arbie`` does and compared against the best
+row that was available in hindsight. Whole segments are evaluated as numpy
+arrays, and parameter sweeps fan out over a process pool where each worker
+memory-maps the history itself.
+
+Run with ``python -m scripts.backtest [history dir]`` or ``brownie run backtest``.
+"""
+import concurrent.futures
+import itertools as it
+import sys
+from functools import partial
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from scripts import amounts, recorder, strategy
+
+PROJECT_DIR = Path(__file__).parent.parent
+RANDOM_STATE = 42
+
+
+class Params(NamedTuple):
+    slippage: float = 0.01
+    flash_loan_fee: float = 0.0009
+    # margin a row must beat to be tried, defaults to the flash loan premium
+    min_margin: Optional[float] = None
+    # dx bounds as a fraction of the input coin's pool balance
+    size_range: Tuple[float, float] = (1 / 500, 1 / 250)
+    # fraction of the recorded quotes the strategy gets to see
+    sample_frac: float = 1.0
+    gas_limit: int = 500_000
+    gas_price_scale: float = 1.0
+    # slippage in effect when the history was recorded, BUY quotes were
+    # requested for dx * (1 + quote_slippage)
+    quote_slippage: float = 0.01
+    # prefilter threshold on the recorded spot spread, None quotes every pair
+    min_spread: Optional[float] = None
+    seed: int = RANDOM_STATE
+
+
+def param_grid(**axes):
+    """Cartesian product of parameter values, e.g. ``param_grid(slippage=[0.005, 0.01])``"""
+    names = list(axes)
+    return [Params(**dict(zip(names, values))) for values in it.product(*axes.values())]
+
+
+def _gas_cost_model(reader, start_block, end_block):
+    """Recorded gas cost per unit of gas, keyed by (direction, token)
+
+    Gas is only estimated for rows passing the margin threshold, so the most
+    recent estimate for the same direction and fee token is carried forward.
+    """
+    rows = {}
+    columns = ["direction", "i", "j", "gas_limit", "gas_cost"]
+    for chunk in reader.iter_table("decisions", columns, start_block, end_block):
+        gas_limit = np.asarray(chunk["gas_limit"])
+        known = gas_limit > 0
+        if not known.any():
+            continue
+        direction = np.asarray(chunk["direction"])[known]
+        token = np.where(
+            direction == recorder.CURVE,
+            np.asarray(chunk["i"])[known],
+            np.asarray(chunk["j"])[known],
+        )
+        per_gas = amounts.limbs_to_float(chunk["gas_cost"][known]) / gas_limit[known]
+        blocks = np.asarray(chunk["block_number"])[known]
+        for key in set(zip(direction.tolist(), token.tolist())):
+            mask = (direction == key[0]) & (token == key[1])
+            rows.setdefault(key, []).append((blocks[mask], per_gas[mask]))
+    return {
+        key: (
+            np.concatenate([b for b, _ in parts]),
+            np.concatenate([c for _, c in parts]),
+        )
+        for key, parts in rows.items()
+    }
+
+
+def _lookup_gas_price(model, direction, token, blocks):
+    price = np.full(len(blocks), np.nan)
+    for (key_direction, key_token), (known_blocks, per_gas) in model.items():
+        mask = (direction == key_direction) & (token == key_token)
+        if not mask.any():
+            continue
+        idx = np.searchsorted(known_blocks, blocks[mask], side="right") - 1
+        found = idx >= 0
+        values = np.full(mask.sum(), np.nan)
+        values[found] = per_gas[idx[found]]
+        price[mask] = values
+    return price
+
+
+def _resolved(reader, start_block):
+    """``{tx_hash: outcome}`` of txs submitted without waiting for their receipt"""
+    resolved = {}
+    # a tx is resolved blocks after its decision, possibly past ``end_block``
+    for segment in reader.segments(start_block):
+        chunk = segment.table("outcomes", ["tx_hash", "outcome"])
+        resolved.update(zip(map(bytes, chunk["tx_hash"]), chunk["outcome"].tolist()))
+    return resolved
+
+
+def _reverted(reader, start_block, end_block):
+    """(block, direction, i, j, dx) of recorded trades that reverted or were cancelled"""
+    reverted = set()
+    resolved = _resolved(reader, start_block)
+    columns = ["direction", "i", "j", "dx", "outcome", "tx_hash"]
+    for chunk in reader.iter_table("decisions", columns, start_block, end_block):
+        outcome = np.array(chunk["outcome"])
+        for n in np.flatnonzero(outcome == recorder.PENDING):
+            outcome[n] = resolved.get(bytes(chunk["tx_hash"][n]), recorder.PENDING)
+        failed = (outcome == recorder.REVERTED) | (outcome == recorder.CANCELLED)
+        for n in np.flatnonzero(failed):
+            reverted.add(
+                (
+                    int(chunk["block_number"][n]),
+                    int(chunk["direction"][n]),
+                    int(chunk["i"][n]),
+                    int(chunk["j"][n]),
+                    amounts.from_limbs(chunk["dx"][n])[0],
+                )
+            )
+    return reverted
+
+
+def _lookup_spread(table, blocks, i, j):
+    """Recorded prefilter spread of each quote's pair, NaN where none was recorded"""
+    query = (blocks << 16) + (i << 8) + j
+    keys = (
+        (np.asarray(table["block_number"]) << 16)
+        + (np.asarray(table["i"]).astype(np.int64) << 8)
+        + np.asarray(table["j"])
+    )
+    if not len(keys):
+        return np.full(len(query), np.nan)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    spread = np.asarray(table["spread"])[order]
+    idx = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+    return np.where(keys[idx] == query, spread[idx], np.nan)
+
+
+def _replay_segment(
+    segment, params, gas_model, reverted, totals, start_block, end_block
+):
+    block_table = recorder.trim(
+        segment.table("blocks", ["block_number", "balances"]), start_block, end_block
+    )
+    totals["blocks"] += len(block_table["block_number"])
+    quotes = recorder.trim(segment.table("quotes"), start_block, end_block)
+    if len(quotes["block_number"]) == 0:
+        return
+    blocks = np.asarray(quotes["block_number"])
+    direction = np.asarray(quotes["direction"])
+    i = np.asarray(quotes["i"]).astype(np.int64)
+    j = np.asarray(quotes["j"]).astype(np.int64)
+    dx = amounts.limbs_to_float(quotes["dx"])
+    min_dy = amounts.limbs_to_float(quotes["min_dy"])
+    quote = amounts.limbs_to_float(quotes["quote"])
+    is_curve = direction == recorder.CURVE
+
+    # failed quotes carry a 0 destAmount / huge srcAmount placeholder
+    valid = (quote > 0) & (quote < float(amounts.MAX_AMOUNT)) & (dx > 0)
+
+    block_idx = np.searchsorted(np.asarray(block_table["block_number"]), blocks)
+    balances = amounts.limbs_to_float(block_table["balances"])
+    balance_in = balances[block_idx, i]
+    lo, hi = params.size_range
+    in_range = (dx >= balance_in * lo * 0.999) & (dx <= balance_in * hi * 1.001)
+
+    rng = np.random.default_rng(params.seed + segment.first_block)
+    sampled = rng.random(len(blocks)) < params.sample_frac
+
+    # pairs the prefilter would have skipped, unknown spreads are quoted
+    filtered = np.zeros(len(blocks), dtype=bool)
+    if params.min_spread is not None:
+        prefilter = recorder.trim(segment.table("prefilter"), start_block, end_block)
+        spread = _lookup_spread(prefilter, blocks, i, j)
+        with np.errstate(invalid="ignore"):
+            filtered = spread < params.min_spread
+
+    token = np.where(is_curve, i, j)
+    gas_price = _lookup_gas_price(gas_model, direction, token, blocks)
+    priced = ~np.isnan(gas_price)
+    gas_cost = (
+        np.where(priced, gas_price, 0.0) * params.gas_limit * params.gas_price_scale
+    )
+
+    # BUY quotes scale linearly with the requested amount
+    src_amount = quote * (1 + params.slippage) / (1 + params.quote_slippage)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        margin = np.where(
+            is_curve,
+            strategy.curve_margin(dx, quote, params.slippage),
+            strategy.paraswap_margin(min_dy, src_amount),
+        )
+    net = np.where(
+        is_curve,
+        strategy.curve_net_profit(
+            dx, quote, params.slippage, params.flash_loan_fee, gas_cost
+        ),
+        strategy.paraswap_net_profit(
+            min_dy, src_amount, params.flash_loan_fee, gas_cost
+        ),
+    )
+    margin = np.where(valid, margin, np.nan)
+    net = np.where(valid, net, np.nan)
+
+    groups = blocks * 2 + direction
+    threshold = (
+        params.flash_loan_fee if params.min_margin is None else params.min_margin
+    )
+
+    # what the bot would have done: argmax margin over the rows it got to quote
+    seen = valid & in_range & sampled & ~filtered
+    chosen_groups, chosen = strategy.best_per_group(groups[seen], margin[seen])
+    chosen = np.flatnonzero(seen)[chosen]
+    taken = (margin[chosen] > threshold) & (net[chosen] > 0)
+
+    realized = np.where(taken, net[chosen], 0.0)
+    for n in np.flatnonzero(taken):
+        row = chosen[n]
+        key = (
+            int(blocks[row]),
+            int(direction[row]),
+            int(i[row]),
+            int(j[row]),
+            amounts.from_limbs(quotes["dx"][row])[0],
+        )
+        if key in reverted:
+            realized[n] = 0.0
+            totals["reverted"] += 1
+
+    # what was available in hindsight: the best net profit over every valid row
+    best_groups, best = strategy.best_per_group(groups[valid], net[valid])
+    best = np.flatnonzero(valid)[best]
+    available = np.maximum(net[best], 0.0)
+    profitable = available > 0
+    totals["profitable"] += int(profitable.sum())
+    # false negatives, the best opportunity in hindsight was thrown away unquoted
+    totals["prefilter_missed"] += int((profitable & filtered[best]).sum())
+    totals["prefilter_skipped"] += int((valid & in_range & sampled & filtered).sum())
+    realized_by_group = dict(zip(chosen_groups.tolist(), realized.tolist()))
+
+    for group, row, value in zip(best_groups.tolist(), best, available):
+        captured = realized_by_group.get(group, 0.0)
+        tok = int(token[row])
+        missed = max(float(value) - captured, 0.0)
+        totals["missed"][tok] = totals["missed"].get(tok, 0.0) + missed
+    for row, value in zip(chosen[taken], realized[taken]):
+        tok = int(token[row])
+        totals["realized"][tok] = totals["realized"].get(tok, 0.0) + float(value)
+
+    totals["trades"] += int(taken.sum())
+    totals["unpriced_gas"] += int((taken & ~priced[chosen]).sum())
+
+
+def run(root, params=Params(), start_block=None, end_block=None):
+    """Replay the history under ``root`` with one parameter set"""
+    reader = recorder.HistoryReader(root)
+    gas_model = _gas_cost_model(reader, start_block, end_block)
+    reverted = _reverted(reader, start_block, end_block)
+    totals = {
+        "blocks": 0,
+        "trades": 0,
+        "reverted": 0,
+        "unpriced_gas": 0,
+        "profitable": 0,
+        "prefilter_skipped": 0,
+        "prefilter_missed": 0,
+        "realized": {},
+        "missed": {},
+    }
+    for segment in reader.segments(start_block, end_block):
+        _replay_segment(
+            segment, params, gas_model, reverted, totals, start_block, end_block
+        )
+    return {"params": params, **totals}
+
+
+def sweep(root, param_sets, processes=None, start_block=None, end_block=None):
+    """Replay every parameter set in parallel and tabulate the results per token"""
+    func = partial(run, root, start_block=start_block, end_block=end_block)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        reports = list(pool.map(func, param_sets))
+
+    rows = []
+    for report in reports:
+        tokens = sorted(set(report["realized"]) | set(report["missed"]))
+        for token in tokens or [None]:
+            realized = report["realized"].get(token, 0.0)
+            missed = report["missed"].get(token, 0.0)
+            rows.append(
+                {
+                    **report["params"]._asdict(),
+                    "token": token,
+                    "blocks": report["blocks"],
+                    "trades": report["trades"],
+                    "reverted": report["reverted"],
+                    "unpriced_gas": report["unpriced_gas"],
+                    "prefilter_skipped": report["prefilter_skipped"],
+                    "false_negative_rate": (
+                        report["prefilter_missed"] / report["profitable"]
+                        if report["profitable"]
+                        else 0.0
+                    ),
+                    "realized": realized,
+                    "missed": missed,
+                    "capture": (
+                        realized / (realized + missed) if realized + missed else 0.0
+                    ),
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def main(root=None, processes=None):
+    root = Path(root) if root else PROJECT_DIR.joinpath("data/history-1")
+    param_sets = param_grid(
+        slippage=[0.005, 0.01, 0.02],
+        min_margin=[0.0009, 0.002, 0.005],
+        size_range=[(1 / 500, 1 / 250), (1 / 1000, 1 / 100)],
+    )
+    logger.info(f"Replaying {root} with {len(param_sets)} parameter set(s)")
+    results = sweep(root, param_sets, processes)
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        logger.info(f"\n{results}")
+    return results
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
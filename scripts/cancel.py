@@ -0,0 +1,161 @@
+"""Per-block cancellation of in-flight work.
+
+Every scanned block gets a ``CancelScope``. Work for the block is submitted to
+the thread pool through its scope and the pipeline calls ``scope.check()``
+between stages. A ``HeadWatcher`` polls the chain head in the background and
+cancels the active scope as soon as a newer block shows up: queued price
+requests are dropped before they reach the API (freeing the rate limit budget
+for the new block), running ones bail out at their next check and the block's
+pipeline unwinds with ``Cancelled``.
+"""
+import concurrent.futures
+import threading
+import time
+
+from loguru import logger
+
+
+class Cancelled(Exception):
+    """Raised when the block being worked on has been superseded"""
+
+    def __init__(self, block_number, head=None):
+        super().__init__(f"block {block_number} superseded by {head}")
+        self.block_number = block_number
+        self.head = head
+
+
+class CancelScope:
+    """Tracks the futures submitted for one block so they can be dropped together"""
+
+    def __init__(self, block_number):
+        self.block_number = block_number
+        self.head = None
+        self._event = threading.Event()
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        """Raise ``Cancelled`` if a newer block has been seen"""
+        if self._event.is_set():
+            raise Cancelled(self.block_number, self.head)
+
+    def cancel(self, head=None):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.head = head
+            self._event.set()
+            futures, self._futures = self._futures, set()
+        dropped = sum(future.cancel() for future in futures)
+        logger.debug(
+            f"Cancelled block {self.block_number} work, dropped {dropped} queued call(s)"
+        )
+
+    def _run(self, fn, args, kwargs):
+        self.check()
+        return fn(*args, **kwargs)
+
+    def submit(self, executor, fn, *args, **kwargs):
+        self.check()
+        future = executor.submit(self._run, fn, args, kwargs)
+        with self._lock:
+            if self._event.is_set():
+                future.cancel()
+            else:
+                self._futures.add(future)
+        future.add_done_callback(self._discard)
+        return future
+
+    def _discard(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def call(self, executor, fn, *args, timeout=None, **kwargs):
+        """Run ``fn`` on the executor, giving up on it once the scope is cancelled"""
+        future = self.submit(executor, fn, *args, **kwargs)
+        try:
+            return self._result(future, timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def map(self, executor, fn, *iterables, timeout=None):
+        """Like ``Executor.map`` but results are abandoned once the scope is cancelled"""
+        futures = [self.submit(executor, fn, *args) for args in zip(*iterables)]
+        end_time = None if timeout is None else time.monotonic() + timeout
+        try:
+            results = []
+            for future in futures:
+                remaining = None if end_time is None else end_time - time.monotonic()
+                results.append(self._result(future, remaining))
+            return results
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def _result(self, future, timeout):
+        # wake up regularly so a cancel is noticed even while a call is running
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self.check()
+            wait = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+            if wait <= 0:
+                raise concurrent.futures.TimeoutError()
+            try:
+                return future.result(timeout=wait)
+            except concurrent.futures.TimeoutError:
+                continue
+            except concurrent.futures.CancelledError:
+                self.check()
+                raise
+
+
+class HeadWatcher:
+    """Polls the chain head and cancels the active scope when a newer block appears"""
+
+    def __init__(self, get_block_number, poll_interval=0.5):
+        self._get_block_number = get_block_number
+        self.poll_interval = poll_interval
+        self.head = None
+        self._scope = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._poll, daemon=True)
+            self._thread.start()
+        return self
+
+    def new_scope(self, block_number):
+        """Open the scope for a freshly mined block, cancelling the previous one"""
+        scope = CancelScope(block_number)
+        with self._lock:
+            previous, self._scope = self._scope, scope
+            self.head = max(self.head or 0, block_number)
+        if previous is not None:
+            previous.cancel(block_number)
+        return scope
+
+    def observe(self, head):
+        """Feed a block number seen elsewhere, e.g. in a batched RPC response"""
+        with self._lock:
+            self.head = max(self.head or 0, head)
+            scope = self._scope
+        if scope is not None and head > scope.block_number:
+            scope.cancel(head)
+
+    def _poll(self):
+        while True:
+            try:
+                head = self._get_block_number()
+            except Exception as exc:
+                logger.debug(f"Head watcher failed to fetch block number: {exc!r}")
+            else:
+                self.observe(head)
+            time.sleep(self.poll_interval)
@@ -0,0 +1,222 @@
+"""Raw ABI encoding and decoding for the calls made every block.
+
+Brownie's contract objects encode through ``eth_abi`` type parsing on every call
+and hand results back as proxy objects that need unwrapping. The calls on the
+hot path all have fixed layouts, so here they are encoded by concatenating 32
+byte words behind precomputed selectors and decoded by slicing the raw return
+data (``memoryview`` slices, no copies) straight into ints.
+
+``Multicall`` sends ``aggregate``/``tryAggregate`` batches through a raw
+``eth_call``, optionally riding on a ``rpc.Coalescer`` batch.
+"""
+from functools import lru_cache
+
+from eth_utils import function_signature_to_4byte_selector, to_checksum_address
+
+WORD = 32
+
+
+@lru_cache(maxsize=None)
+def selector(signature):
+    """4 byte selector of a function signature, e.g. ``"balances(uint256)"``"""
+    return function_signature_to_4byte_selector(signature)
+
+
+GET_DY = selector("get_dy(uint256,uint256,uint256)")
+GET_DY_UNDERLYING = selector("get_dy_underlying(uint256,uint256,uint256)")
+BALANCES = selector("balances(uint256)")
+GET_RESERVES = selector("getReserves()")
+BALANCE_OF = selector("balanceOf(address)")
+FLASH_LOAN = selector(
+    "flashLoan(address,address[],uint256[],uint256[],address,bytes,uint16)"
+)
+AGGREGATE = selector("aggregate((address,bytes)[])")
+TRY_AGGREGATE = selector("tryAggregate(bool,(address,bytes)[])")
+
+
+# Encoding
+
+
+def word(value):
+    """A uint (or bool) as a 32 byte big endian word"""
+    return int(value).to_bytes(WORD, "big")
+
+
+def address_word(address):
+    return bytes.fromhex(address[2:]).rjust(WORD, b"\x00")
+
+
+def _pad(length):
+    return b"\x00" * (-length % WORD)
+
+
+def _bytes_tail(data):
+    return word(len(data)) + data + _pad(len(data))
+
+
+def encode_call(sig_selector, *args):
+    """Calldata for a function taking only static uint arguments"""
+    return sig_selector + b"".join(word(arg) for arg in args)
+
+
+def get_dy(i, j, dx):
+    return GET_DY + word(i) + word(j) + word(dx)
+
+
+def get_dy_underlying(i, j, dx):
+    return GET_DY_UNDERLYING + word(i) + word(j) + word(dx)
+
+
+def balances(i):
+    return BALANCES + word(i)
+
+
+def balance_of(address):
+    return BALANCE_OF + address_word(address)
+
+
+def _encode_calls(calls):
+    # (address,bytes)[] without its offset word, heads are relative to the
+    # first word after the length
+    heads, tails = [], []
+    offset = WORD * len(calls)
+    for target, data in calls:
+        tail = address_word(target) + word(2 * WORD) + _bytes_tail(bytes(data))
+        heads.append(word(offset))
+        tails.append(tail)
+        offset += len(tail)
+    return word(len(calls)) + b"".join(heads) + b"".join(tails)
+
+
+def aggregate(calls):
+    """``Multicall2.aggregate`` calldata for ``(target, calldata)`` pairs"""
+    return AGGREGATE + word(WORD) + _encode_calls(calls)
+
+
+def try_aggregate(require_success, calls):
+    """``Multicall2.tryAggregate`` calldata for ``(target, calldata)`` pairs"""
+    return TRY_AGGREGATE + word(require_success) + word(2 * WORD) + _encode_calls(calls)
+
+
+def _words_array(values):
+    return word(len(values)) + b"".join(word(value) for value in values)
+
+
+def flash_loan(receiver, assets, amounts, modes, on_behalf_of, params, referral=0):
+    """``LendingPool.flashLoan`` calldata"""
+    params = bytes(params)
+    tails = [
+        word(len(assets)) + b"".join(address_word(asset) for asset in assets),
+        _words_array(amounts),
+        _words_array(modes),
+        _bytes_tail(params),
+    ]
+    offsets, offset = [], 7 * WORD
+    for tail in tails:
+        offsets.append(word(offset))
+        offset += len(tail)
+    head = (
+        address_word(receiver)
+        + offsets[0]
+        + offsets[1]
+        + offsets[2]
+        + address_word(on_behalf_of)
+        + offsets[3]
+        + word(referral)
+    )
+    return FLASH_LOAN + head + b"".join(tails)
+
+
+# Decoding
+
+
+def to_int(data, n=0):
+    """The ``n``-th word of ABI data as an unsigned int"""
+    return int.from_bytes(data[WORD * n : WORD * (n + 1)], "big")
+
+
+def to_address(data, n=0):
+    return to_checksum_address(bytes(data[WORD * n + 12 : WORD * (n + 1)]))
+
+
+def address_array(data, n):
+    """``address[]`` whose offset is the ``n``-th word"""
+    offset = to_int(data, n)
+    length = int.from_bytes(data[offset : offset + WORD], "big")
+    return [
+        to_checksum_address(
+            bytes(data[offset + WORD * k + 12 : offset + WORD * (k + 1)])
+        )
+        for k in range(1, length + 1)
+    ]
+
+
+def _bytes_at(data, offset):
+    length = int.from_bytes(data[offset : offset + WORD], "big")
+    return data[offset + WORD : offset + WORD + length]
+
+
+def reserves(data):
+    """``getReserves()`` return data as ``(reserve0, reserve1)``"""
+    return to_int(data, 0), to_int(data, 1)
+
+
+def decode_aggregate(data):
+    """``aggregate`` return data as ``(block_number, [return data, ...])``"""
+    data = memoryview(data)
+    start = to_int(data, 1) + WORD
+    length = int.from_bytes(data[start - WORD : start], "big")
+    return to_int(data, 0), [
+        _bytes_at(data, start + to_int(data[start:], k)) for k in range(length)
+    ]
+
+
+def decode_try_aggregate(data):
+    """``tryAggregate`` return data as ``[(success, return data), ...]``"""
+    data = memoryview(data)
+    start = to_int(data, 0) + WORD
+    length = int.from_bytes(data[start - WORD : start], "big")
+    results = []
+    for k in range(length):
+        result = start + to_int(data[start:], k)
+        results.append(
+            (
+                bool(to_int(data[result:])),
+                _bytes_at(data, result + to_int(data[result:], 1)),
+            )
+        )
+    return results
+
+
+class Multicall:
+    """Raw ``Multicall2`` batches sent as a single ``eth_call``
+
+    ``batch`` is anything with a ``call(method, params)`` returning the raw JSON-RPC
+    result, e.g. ``rpc.Coalescer`` so the multicall shares a round trip with other
+    reads.
+    """
+
+    def __init__(self, batch, address):
+        self._batch = batch
+        self.address = address
+
+    def _eth_call(self, data, block):
+        tx = {"to": self.address, "data": "0x" + data.hex()}
+        return bytes.fromhex(self._batch.call("eth_call", [tx, block])[2:])
+
+    def aggregate(self, calls, block="latest"):
+        """``(block_number, [return data, ...])``, reverts if any call fails"""
+        return decode_aggregate(self._eth_call(aggregate(calls), block))
+
+    def try_aggregate(self, calls, block="latest", require_success=False):
+        """``[(success, return data), ...]`` for ``(target, calldata)`` pairs"""
+        return decode_try_aggregate(
+            self._eth_call(try_aggregate(require_success, calls), block)
+        )
+
+    def uints(self, calls, block="latest", default=0):
+        """First return word of each call as an int, ``default`` where a call failed"""
+        return [
+            to_int(data) if success and len(data) >= WORD else default
+            for success, data in self.try_aggregate(calls, block)
+        ]
@@ -0,0 +1,196 @@
+"""Strategy settings that can change while the bot is running.
+
+Slippage, the quote thread count, the grid's size range, the DEXs Paraswap may
+route through and the coins to trade are read from a JSON file (``ARBIE_CONFIG``)
+holding any subset of the ``Config`` fields, e.g.
+
+    {"slippage": 0.005, "n_threads": 40, "coins": ["WBTC", "WETH"]}
+
+``ConfigWatcher.poll()`` is called by the scan loop between blocks. It re-reads
+the file when its mtime changes and picks up commands sent to the control
+socket (``ARBIE_CONTROL_SOCKET``), one JSON object per line:
+
+- ``{"cmd": "get"}`` answers with the current config
+- ``{"cmd": "set", "values": {...}}`` overrides fields on top of the file
+- ``{"cmd": "reload"}`` drops the overrides and re-reads the file
+
+e.g. ``echo '{"cmd": "set", "values": {"slippage": 0.02}}' | nc -U arbie.sock``.
+A new config is validated as a whole and handed back with the names of the
+fields that changed, so the script only rebuilds what they affect. Invalid
+input is logged (or answered with the error) and the running config is kept.
+"""
+import json
+import os
+import socketserver
+import threading
+from pathlib import Path
+from typing import NamedTuple
+
+from loguru import logger
+
+PATH = os.getenv("ARBIE_CONFIG")
+SOCKET = os.getenv("ARBIE_CONTROL_SOCKET")
+
+
+class Config(NamedTuple):
+    slippage: float
+    n_threads: int
+    # grid sizes, as fractions of the pool balance of the input coin
+    dx_min: float
+    dx_max: float
+    grid_size: int
+    include_dexs: str  # Paraswap includeDEXS
+    coins: tuple = ()  # symbols to trade, all of the pool's coins if empty
+
+
+# JSON values each scalar field accepts, ints are fine where a float is expected
+_SCALARS = {float: (int, float), int: (int,), str: (str,)}
+
+
+def _value(field, value):
+    """``value`` as the type of ``field``, raises ``ValueError`` if it is not one"""
+    if field == "coins":
+        if value is None:
+            return ()
+        if not isinstance(value, (list, tuple)) or not all(
+            isinstance(coin, str) for coin in value
+        ):
+            raise ValueError(f"coins must be a list of symbols, got {value!r}")
+        return tuple(value)
+    kind = Config.__annotations__[field]
+    # JSON true and false pass for ints otherwise
+    if isinstance(value, bool) or not isinstance(value, _SCALARS[kind]):
+        raise ValueError(f"{field} must be of type {kind.__name__}, got {value!r}")
+    return kind(value)
+
+
+def parse(values, base):
+    """``base`` updated with ``values``, raises ``ValueError`` if the result is invalid"""
+    unknown = set(values) - set(Config._fields)
+    if unknown:
+        raise ValueError(f"Unknown config field(s): {', '.join(sorted(unknown))}")
+    config = base._replace(
+        **{field: _value(field, value) for field, value in values.items()}
+    )
+    if not 0 <= config.slippage < 1:
+        raise ValueError(f"slippage must be in [0, 1), got {config.slippage}")
+    if len(config.coins) == 1:
+        raise ValueError("coins needs at least two coins to form a pair")
+    if config.n_threads < 1 or config.grid_size < 1:
+        raise ValueError("n_threads and grid_size must be at least 1")
+    if not 0 < config.dx_min <= config.dx_max <= 1:
+        raise ValueError("dx_min and dx_max must satisfy 0 < dx_min <= dx_max <= 1")
+    return config
+
+
+def changed_fields(old, new):
+    return {
+        field for field in Config._fields if getattr(old, field) != getattr(new, field)
+    }
+
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                reply = self.server.watcher.command(json.loads(line))
+            except Exception as exc:
+                reply = {"ok": False, "error": str(exc)}
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+
+class ConfigWatcher:
+    """Merges the config file and control socket overrides over ``defaults``"""
+
+    def __init__(self, defaults, path=PATH, socket_path=SOCKET):
+        self.defaults = defaults
+        self.path = Path(path) if path else None
+        self.socket_path = socket_path
+        self.current = defaults
+        self._file_values = {}
+        self._overrides = {}
+        self._mtime = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self):
+        """Load the file and open the control socket, returns the starting config"""
+        self._read_file()
+        config, _ = self.poll() or (self.current, set())
+        if self.socket_path and self._server is None:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self._server = socketserver.ThreadingUnixStreamServer(
+                self.socket_path, _ControlHandler
+            )
+            self._server.daemon_threads = True
+            self._server.watcher = self
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+            logger.info(f"Control socket listening on {self.socket_path}")
+        return config
+
+    def poll(self):
+        """``(config, changed fields)`` if anything changed since the last poll"""
+        self._read_file()
+        with self._lock:
+            if not self._dirty:
+                return None
+            self._dirty = False
+            try:
+                config = parse({**self._file_values, **self._overrides}, self.defaults)
+            except (TypeError, ValueError) as exc:
+                logger.error(f"Keeping the running config: {exc}")
+                return None
+        changed = changed_fields(self.current, config)
+        self.current = config
+        if not changed:
+            return None
+        logger.info(
+            "Config changed: "
+            + ", ".join(
+                f"{field}={getattr(config, field)}" for field in sorted(changed)
+            )
+        )
+        return config, changed
+
+    def command(self, request):
+        """Handle one control socket request, runs on the socket's thread"""
+        cmd = request.get("cmd")
+        with self._lock:
+            if cmd == "set":
+                values = {**self._overrides, **request.get("values", {})}
+                # validate now so the sender gets the error, apply between blocks
+                parse({**self._file_values, **values}, self.defaults)
+                self._overrides = values
+                self._dirty = True
+            elif cmd == "reload":
+                self._overrides = {}
+                self._mtime = None
+                self._dirty = True
+            elif cmd != "get":
+                raise ValueError(f"Unknown command {cmd!r}")
+        return {"ok": True, "config": self.current._asdict()}
+
+    def _read_file(self):
+        if self.path is None:
+            return
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        try:
+            values = json.loads(self.path.read_text()) if mtime is not None else {}
+            if not isinstance(values, dict):
+                raise ValueError("expected a JSON object")
+        except (OSError, ValueError) as exc:
+            logger.error(f"Could not read {self.path}: {exc}")
+            return
+        with self._lock:
+            self._file_values = values
+            self._dirty = True
@@ -0,0 +1,358 @@
+"""Pending transaction watcher projecting pool state ahead of the next block.
+
+The scan loop only reacts once a block is mined. With ``ARBIE_MEMPOOL=1`` a
+``PendingWatcher`` subscribes to the node's pending transaction filter, decodes
+pending calls that move the pools we trade against:
+
+- ``exchange``/``add_liquidity`` on the crypto pool
+- ``swap`` on a tracked V2 pair, or a V2 router swap whose path crosses one
+
+and applies them, in arrival order, to a copy of the last mined state. Each
+relevant transaction yields a ``Projection`` that the scan loop re-runs the size
+search against (``search``), so candidates and their tx templates are ready
+before the triggering transaction lands. On every block, transactions that are
+still pending are re-applied to the fresh state, mined or dropped ones are
+forgotten.
+
+Calls routed through other contracts (aggregators, zaps) are not visible to the
+decoder. Works against any node exposing ``eth_newPendingTransactionFilter``,
+including a local dev chain with automine disabled (``anvil --no-mining`` or
+hardhat's ``evm_setAutomine(false)``).
+"""
+import itertools as it
+import os
+import queue
+import threading
+import time
+from typing import NamedTuple
+
+import numpy as np
+from eth_utils import to_checksum_address
+from loguru import logger
+
+from scripts import codec, pool_math, recorder, scanpool, strategy
+
+ENABLED = os.getenv("ARBIE_MEMPOOL", "0") == "1"
+POLL_INTERVAL = float(os.getenv("ARBIE_MEMPOOL_POLL_INTERVAL", "0.1"))
+
+_selector = codec.selector
+_word = codec.to_int
+_address_array = codec.address_array
+
+
+CRYPTO_EXCHANGE = _selector("exchange(uint256,uint256,uint256,uint256)")
+CRYPTO_EXCHANGE_ETH = _selector("exchange(uint256,uint256,uint256,uint256,bool)")
+CRYPTO_ADD_LIQUIDITY = _selector("add_liquidity(uint256[3],uint256)")
+PAIR_SWAP = _selector("swap(uint256,uint256,address,bytes)")
+_PATH_ARGS = "address[],address,uint256)"
+# V2 router swaps, selector -> (exact input, pays with ETH)
+ROUTER_SWAPS = {
+    _selector(f"swapExactTokensForTokens(uint256,uint256,{_PATH_ARGS}"): (True, False),
+    _selector(f"swapExactTokensForETH(uint256,uint256,{_PATH_ARGS}"): (True, False),
+    _selector(f"swapExactETHForTokens(uint256,{_PATH_ARGS}"): (True, True),
+    _selector(f"swapTokensForExactTokens(uint256,uint256,{_PATH_ARGS}"): (False, False),
+    _selector(f"swapTokensForExactETH(uint256,uint256,{_PATH_ARGS}"): (False, False),
+    _selector(f"swapETHForExactTokens(uint256,{_PATH_ARGS}"): (False, True),
+}
+
+
+class PoolSnapshot(NamedTuple):
+    """State of every pool we watch, as mined or projected"""
+
+    block_number: int
+    crypto_pool: pool_math.CryptoPoolState
+    pairs: dict  # pair address -> V2PairState
+
+
+class Projection(NamedTuple):
+    """Pool state once ``tx_hash`` (and earlier pending txs) are mined"""
+
+    tx_hash: str
+    snapshot: PoolSnapshot
+
+
+class PendingWatcher:
+    """Applies pending pool-moving transactions to the last mined snapshot"""
+
+    def __init__(self, batch, crypto_pool_addr, routers, poll_interval=POLL_INTERVAL):
+        # routers: router address -> factory address, to find the pairs on a path
+        self._batch = batch
+        self.crypto_pool_addr = crypto_pool_addr.lower()
+        self.routers = {addr.lower(): factory for addr, factory in routers.items()}
+        self.poll_interval = poll_interval
+        self.projections = queue.Queue()
+        self._snapshot = None
+        self._pair_index = {}
+        self._watched = set()
+        self._seen = set()
+        # txs applied to the snapshot in arrival order, until they are mined
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def update(self, snapshot, pair_index):
+        """Reset to a freshly mined snapshot, re-applying the txs still pending
+
+        ``pair_index`` maps ``(factory, token_a, token_b)`` in both token orders
+        to the address of a tracked pair.
+        """
+        checked, still_pending = self._still_pending()
+        # projections of the previous block are stale now
+        while not self.projections.empty():
+            self.projections.get_nowait()
+        with self._lock:
+            # txs that arrived while the others were checked are pending too
+            arrived = [
+                tx for tx_hash, tx in self._pending.items() if tx_hash not in checked
+            ]
+            self._snapshot = snapshot
+            self._pair_index = pair_index
+            self._watched = {
+                self.crypto_pool_addr,
+                *self.routers,
+                *(addr.lower() for addr in snapshot.pairs),
+            }
+            self._pending = {}
+            projections = [self._project(tx) for tx in still_pending + arrived]
+            self._seen = set(self._pending)
+        for projection in projections:
+            if projection is not None:
+                self.projections.put(projection)
+
+    def _still_pending(self):
+        """``(checked hashes, txs neither mined nor dropped)`` of the applied txs"""
+        with self._lock:
+            txs = list(self._pending.values())
+        checked = {tx["hash"] for tx in txs}
+        if not txs:
+            return checked, []
+        try:
+            latest = self._batch.gather(
+                *[("eth_getTransactionByHash", [tx["hash"]]) for tx in txs]
+            )
+        except Exception as exc:
+            logger.debug(f"Could not check pending txs, dropping them: {exc!r}")
+            return checked, []
+        return checked, [
+            tx
+            for tx, now in zip(txs, latest)
+            if now is not None and now.get("blockNumber") is None
+        ]
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._poll, daemon=True)
+            self._thread.start()
+        return self
+
+    def wait(self, timeout):
+        """Next projection, or None if nothing relevant arrived within ``timeout``"""
+        try:
+            return self.projections.get(timeout=max(timeout, 0))
+        except queue.Empty:
+            return None
+
+    def _new_filter(self):
+        """A new pending transaction filter, None if it could not be opened"""
+        try:
+            return self._batch.call("eth_newPendingTransactionFilter")
+        except Exception as exc:
+            logger.warning(f"Could not open a pending transaction filter: {exc!r}")
+            return None
+
+    def _poll(self):
+        try:
+            filter_id = self._batch.call("eth_newPendingTransactionFilter")
+        except ValueError as exc:
+            logger.warning(f"Node has no pending transaction filter, {exc}")
+            return
+        except Exception as exc:
+            logger.warning(f"Could not open a pending transaction filter: {exc!r}")
+            filter_id = None
+        logger.info("Watching pending transactions")
+        while True:
+            txs = []
+            if filter_id is None:
+                # retried every tick until the node answers again
+                filter_id = self._new_filter()
+            else:
+                try:
+                    hashes = self._batch.call("eth_getFilterChanges", [filter_id])
+                    txs = self._batch.gather(
+                        *[("eth_getTransactionByHash", [tx_hash]) for tx_hash in hashes]
+                    )
+                except ValueError as exc:
+                    # filters expire if not polled, just open a new one
+                    logger.debug(f"Pending filter failed, re-creating: {exc}")
+                    filter_id = self._new_filter()
+                except Exception as exc:
+                    logger.debug(f"Pending transaction poll failed: {exc!r}")
+            for tx in txs:
+                if tx is not None:
+                    self._on_pending(tx)
+            time.sleep(self.poll_interval)
+
+    def _on_pending(self, tx):
+        if (tx.get("to") or "").lower() not in self._watched:
+            return
+        with self._lock:
+            if self._snapshot is None or tx["hash"] in self._seen:
+                return
+            self._seen.add(tx["hash"])
+            projection = self._project(tx)
+        if projection is not None:
+            self.projections.put(projection)
+
+    def _project(self, tx):
+        """Apply ``tx`` on top of the projected snapshot, called with the lock held"""
+        try:
+            snapshot = self.apply(self._snapshot, tx)
+        except Exception as exc:
+            logger.debug(f"Could not project pending tx {tx['hash']}: {exc!r}")
+            return None
+        if snapshot is None:
+            return None
+        # later pending txs build on top of this one
+        self._snapshot = snapshot
+        self._pending[tx["hash"]] = tx
+        logger.debug(f"Projected pending tx {tx['hash']}")
+        return Projection(tx["hash"], snapshot)
+
+    def apply(self, snapshot, tx):
+        """Snapshot after ``tx``, or None if it doesn't touch a watched pool"""
+        data = bytes.fromhex(tx["input"][2:])
+        selector, args = data[:4], data[4:]
+        to = tx["to"].lower()
+
+        if to == self.crypto_pool_addr:
+            pool = snapshot.crypto_pool
+            if selector in (CRYPTO_EXCHANGE, CRYPTO_EXCHANGE_ETH):
+                i, j, dx = _word(args, 0), _word(args, 1), _word(args, 2)
+                _, pool = pool_math.exchange(pool, i, j, dx)
+            elif selector == CRYPTO_ADD_LIQUIDITY:
+                pool = pool_math.add_liquidity(pool, [_word(args, k) for k in range(3)])
+            else:
+                return None
+            return snapshot._replace(crypto_pool=pool)
+
+        if to in self.routers and selector in ROUTER_SWAPS:
+            exact_in, from_value = ROUTER_SWAPS[selector]
+            # the exact side of the swap, only exact ETH inputs come from msg.value
+            if exact_in and from_value:
+                amount = int(tx["value"], 16)
+            else:
+                amount = _word(args, 0)
+            path = _address_array(args, 1 if from_value else 2)
+            return self._apply_path(snapshot, self.routers[to], path, amount, exact_in)
+
+        if selector == PAIR_SWAP:
+            pair = snapshot.pairs[to_checksum_address(to)]
+            amount0_out, amount1_out = _word(args, 0), _word(args, 1)
+            # the input was transferred in beforehand, back it out of the invariant
+            if amount0_out:
+                token_in, amount_out = pair.token1, amount0_out
+            else:
+                token_in, amount_out = pair.token0, amount1_out
+            amount_in = int(
+                pool_math.v2_amount_in(amount_out, *pair.reserves(token_in))
+            )
+            pairs = dict(snapshot.pairs)
+            pairs[pair.address] = pair.swap(token_in, amount_in, amount_out)
+            return snapshot._replace(pairs=pairs)
+        return None
+
+    def _apply_path(self, snapshot, factory, path, amount, exact_in):
+        hops = [
+            self._pair_index.get((factory, a, b)) for a, b in zip(path[:-1], path[1:])
+        ]
+        if None in hops:
+            if not exact_in:
+                # exact output amounts are worked out from the last hop backwards
+                return None
+            # follow the swap up to the first hop through a pair we don't track
+            cut = hops.index(None)
+            hops, path = hops[:cut], path[: cut + 1]
+        if not hops:
+            return None
+
+        pairs = dict(snapshot.pairs)
+        amounts = [amount]
+        for n in range(len(hops)) if exact_in else reversed(range(len(hops))):
+            reserves = pairs[hops[n]].reserves(path[n])
+            if exact_in:
+                amounts.append(int(pool_math.v2_amount_out(amounts[-1], *reserves)))
+            else:
+                amounts.insert(0, int(pool_math.v2_amount_in(amounts[0], *reserves)))
+        for n, (hop, token_in) in enumerate(zip(hops, path)):
+            pairs[hop] = pairs[hop].swap(token_in, amounts[n], amounts[n + 1])
+        return snapshot._replace(pairs=pairs)
+
+
+def search(
+    snapshot,
+    coins,
+    pair_index,
+    factories,
+    config,
+    top_k=5,
+    simulate=scanpool.simulate,
+):
+    """Re-run the size search against a (projected) snapshot
+
+    Prices both arbitrage directions per coin pair using the crypto pool for the
+    curve leg and the best tracked V2 pair for the paraswap leg (paraswap is
+    limited to Uniswap and Sushiswap), over the grid of the running ``config``:
+    ``grid_size`` sizes from ``dx_min`` to ``dx_max`` of the input coin's pool
+    balance, at its slippage. Returns the ``top_k`` most profitable ``(i, j, dx)``
+    per direction, best first. The curve leg is priced through ``simulate``, e.g.
+    ``scanpool.ScanPool.simulate``.
+    """
+    pool = snapshot.crypto_pool
+    tracked = {}
+    for i, j in it.permutations(range(len(coins)), r=2):
+        pairs = [
+            snapshot.pairs[pair_index[(factory, coins[j], coins[i])]]
+            for factory in factories
+            if (factory, coins[j], coins[i]) in pair_index
+        ]
+        if pairs:
+            tracked[(i, j)] = pairs
+    if not tracked:
+        return {recorder.CURVE: [], recorder.PARASWAP: []}
+    sizes = np.floor(
+        [
+            np.linspace(
+                pool.balances[i] * config.dx_min,
+                pool.balances[i] * config.dx_max,
+                config.grid_size,
+            )
+            for i, _ in tracked
+        ]
+    )
+    min_dys = simulate(pool_math.get_dy, (pool,), list(tracked), sizes)
+
+    rows, margins = [], {recorder.CURVE: [], recorder.PARASWAP: []}
+    for ((i, j), pairs), dx, min_dy in zip(tracked.items(), sizes, min_dys):
+        rows.extend((i, j, int(size)) for size in dx)
+
+        # aave i > curve j > paraswap i
+        dest = np.max(
+            [pool_math.v2_amount_out(min_dy, *p.reserves(coins[j])) for p in pairs],
+            axis=0,
+        )
+        margins[recorder.CURVE].append(strategy.curve_margin(dx, dest, config.slippage))
+        # aave j > paraswap i > curve j
+        buy = strategy.paraswap_buy_amount(dx, config.slippage)
+        src = np.min(
+            [pool_math.v2_amount_in(buy, *p.reserves(coins[j])) for p in pairs], axis=0
+        )
+        with np.errstate(invalid="ignore"):
+            margin = strategy.paraswap_margin(min_dy, src)
+        margins[recorder.PARASWAP].append(margin)
+
+    best = {}
+    for direction, values in margins.items():
+        values = np.concatenate(values) if values else np.empty(0)
+        values = np.where(np.isnan(values), -np.inf, values)
+        best[direction] = [rows[n] for n in np.argsort(-values, kind="stable")[:top_k]]
+    return best
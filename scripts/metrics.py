@@ -0,0 +1,249 @@
+"""In-process latency histograms and counters for the scan loop.
+
+Stages are timed with ``span(name)`` and aggregated into fixed-bucket histograms,
+counters are bumped with ``inc(name)``. When enabled (``ARBIE_METRICS=1``) the
+aggregates are served in Prometheus text format on a local HTTP endpoint and
+periodically dumped as JSON next to the logs. When disabled a span is just two
+``perf_counter`` calls and counters are no-ops.
+"""
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from loguru import logger
+
+ENABLED = os.getenv("ARBIE_METRICS", "0") == "1"
+HTTP_HOST = os.getenv("ARBIE_METRICS_HOST", "127.0.0.1")
+HTTP_PORT = int(os.getenv("ARBIE_METRICS_PORT", "9184"))
+DUMP_INTERVAL = float(os.getenv("ARBIE_METRICS_DUMP_INTERVAL", "60"))
+
+# upper bounds in seconds, roughly log spaced from 1ms to a mainnet block
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 12, 30)
+
+PREFIX = "arbie"
+
+
+class Histogram:
+    """Cumulative fixed-bucket histogram, safe to observe from the thread pool"""
+
+    __slots__ = ("counts", "sum", "count", "_lock")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        idx = len(BUCKETS)
+        for n, bound in enumerate(BUCKETS):
+            if value <= bound:
+                idx = n
+                break
+        with self._lock:
+            self.counts[idx] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        """Upper bucket bound containing the q-th quantile (inf if in the overflow bucket)"""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if total == 0:
+            return 0.0
+        target, seen = q * total, 0
+        for bound, n in zip(BUCKETS + (float("inf"),), counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class Span:
+    """Times a block of code, recording into the stage histogram on exit"""
+
+    __slots__ = ("name", "start", "elapsed")
+
+    def __init__(self, name):
+        self.name = name
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        if ENABLED:
+            observe(f"stage_seconds:{self.name}", self.elapsed)
+        return False
+
+
+_histograms = {}
+_counters = {}
+_registry_lock = threading.Lock()
+_last_block_timestamp = None
+_started = False
+
+
+def span(name):
+    """Context manager timing a pipeline stage, ``span.elapsed`` holds the duration"""
+    return Span(name)
+
+
+def observe(name, value):
+    if not ENABLED:
+        return
+    hist = _histograms.get(name)
+    if hist is None:
+        with _registry_lock:
+            hist = _histograms.setdefault(name, Histogram())
+    hist.observe(value)
+
+
+def inc(name, value=1):
+    if not ENABLED:
+        return
+    with _registry_lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def mark_block(block):
+    """Remember the timestamp of the block currently being scanned"""
+    global _last_block_timestamp
+    _last_block_timestamp = block["timestamp"]
+
+
+def observe_decision():
+    """Record the latency between the scanned block being mined and a trade decision"""
+    if ENABLED and _last_block_timestamp is not None:
+        observe("block_to_decision_seconds", time.time() - _last_block_timestamp)
+
+
+def _split(name):
+    # "stage_seconds:grid_multicall" -> ("arbie_stage_seconds", '{stage="grid_multicall"}')
+    base, _, label = name.partition(":")
+    return f"{PREFIX}_{base}", f'{{stage="{label}"}}' if label else ""
+
+
+def _with_label(labels, extra):
+    if not labels:
+        return f"{{{extra}}}"
+    return f"{labels[:-1]},{extra}}}"
+
+
+def render_prometheus():
+    """Render all metrics in the Prometheus text exposition format"""
+    lines = []
+    with _registry_lock:
+        counters = dict(_counters)
+        histograms = dict(_histograms)
+
+    for name, value in sorted(counters.items()):
+        metric, labels = _split(name)
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{labels} {value}")
+
+    typed = set()
+    for name, hist in sorted(histograms.items()):
+        metric, labels = _split(name)
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} histogram")
+            typed.add(metric)
+        with hist._lock:
+            counts, total, count = list(hist.counts), hist.sum, hist.count
+        cumulative = 0
+        for bound, n in zip(BUCKETS + ("+Inf",), counts):
+            cumulative += n
+            bucket_labels = _with_label(labels, 'le="{}"'.format(bound))
+            lines.append(f"{metric}_bucket{bucket_labels} {cumulative}")
+        lines.append(f"{metric}_sum{labels} {total}")
+        lines.append(f"{metric}_count{labels} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot(previous=None, interval=None):
+    """Summarise all metrics as a dict, with per-second rates if a previous snapshot is given"""
+    with _registry_lock:
+        counters = dict(_counters)
+        histograms = dict(_histograms)
+
+    data = {
+        "timestamp": time.time(),
+        "counters": counters,
+        "histograms": {},
+        "rates": {},
+    }
+    for name, hist in histograms.items():
+        data["histograms"][name] = {
+            "count": hist.count,
+            "mean": hist.sum / hist.count if hist.count else 0.0,
+            "p50": hist.quantile(0.5),
+            "p90": hist.quantile(0.9),
+            "p99": hist.quantile(0.99),
+        }
+
+    requests_total = counters.get("paraswap_requests_total", 0)
+    if requests_total:
+        data["rates"]["paraswap_429_ratio"] = (
+            counters.get("paraswap_429_total", 0) / requests_total
+        )
+        data["rates"]["paraswap_cache_hit_ratio"] = (
+            counters.get("paraswap_cache_hits_total", 0) / requests_total
+        )
+    if previous is not None and interval:
+        prev_quotes = previous["counters"].get("quotes_total", 0)
+        data["rates"]["quotes_per_second"] = (
+            counters.get("quotes_total", 0) - prev_quotes
+        ) / interval
+    return data
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        # keep scrapes out of stderr
+        pass
+
+
+def _dump_loop(path, interval):
+    previous = None
+    while True:
+        time.sleep(interval)
+        data = snapshot(previous, interval)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data, indent=2))
+        tmp.replace(path)
+        previous = data
+
+
+def start(log_dir, chain_id):
+    """Start the Prometheus endpoint and the periodic JSON dump if metrics are enabled"""
+    global _started
+    if not ENABLED or _started:
+        return
+    _started = True
+
+    server = ThreadingHTTPServer((HTTP_HOST, HTTP_PORT), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    log_dir.mkdir(parents=True, exist_ok=True)
+    dump_path = log_dir.joinpath(f"metrics-{chain_id}.json")
+    threading.Thread(
+        target=_dump_loop, args=(dump_path, DUMP_INTERVAL), daemon=True
+    ).start()
+    logger.info(
+        f"Metrics exposed on http://{HTTP_HOST}:{HTTP_PORT}/metrics, dumping to {dump_path}"
+    )
@@ -3,7 +3,7 @@ import itertools as it
 import os
 import sys
 import time
-from functools import lru_cache, partial
+from functools import lru_cache
 from pathlib import Path
 
 import numpy as np
@@ -16,7 +16,28 @@ from hexbytes import HexBytes
 from loguru import logger
 from retry import retry
 
+from scripts import (
+    cancel,
+    codec,
+    config,
+    metrics,
+    pool_math,
+    profiler,
+    quoting,
+    recorder,
+    rpc,
+    scanpool,
+    scheduler,
+    strategy,
+    surface,
+    templates,
+)
+from scripts.amounts import MAX_AMOUNT, Amounts
+from scripts.quoting import TooManyRequests
+
 ACCOUNT = accounts.add(os.getenv("PRIVATE_KEY"))
+# spread RPC calls over ARBIE_RPC_ENDPOINTS, if set, before any contract call
+rpc.install(web3)
 
 PROJECT_DIR = Path(__file__).parent.parent
 # Using tor proxies CloudFlare interrupts :/
@@ -51,19 +72,45 @@ AUGUSTUSSWAPPER = interface.IAugustusSwapper(AUGUSTUSSWAPPER_ADDR)
 CRYPTO_SWAP = interface.CryptoSwap(TRICRYPTO_SWAP_ADDR)
 CRYPTO_ZAP = interface.CryptoZap(TRICRYPTO_ZAP_ADDR)
 BASE_SWAP = interface.BaseSwap(BASE_SWAP_ADDR)
+BASE_LP_TOKEN = interface.LPToken(BASE_SWAP.lp_token())
 ARBIE = ArbieV3.at(ARBIE_ADDR)
 
 # Contract Constants
 with multicall(MULTICALL2_ADDR) as call:
-    AAVE_FLASH_LOAN_FEE = call(LENDING_POOL).FLASHLOAN_PREMIUM_TOTAL()
-AAVE_FLASH_LOAN_FEE = AAVE_FLASH_LOAN_FEE.__wrapped__ / 10_000  # .09%
+    AAVE_FLASH_LOAN_PREMIUM = call(LENDING_POOL).FLASHLOAN_PREMIUM_TOTAL()
+AAVE_FLASH_LOAN_PREMIUM = AAVE_FLASH_LOAN_PREMIUM.__wrapped__  # in bps
+AAVE_FLASH_LOAN_FEE = AAVE_FLASH_LOAN_PREMIUM / strategy.BPS  # .09%
+SLIPPAGE = 0.01
+SLIPPAGE_BPS = strategy.to_bps(SLIPPAGE)
+# sizes per coin pair priced by the local zap simulator
+GRID_SIZE = int(os.getenv("ARBIE_GRID_SIZE", "200"))
+# the simulator is float, stay a hair under the exact on-chain output
+SIM_MARGIN = 1e-6
 
 # Thread Pool initialized here to reduce overhead of constantly creating
 THREAD_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=N_THREADS)
-
-
-class TooManyRequests(Exception):
-    pass
+# cancels the work of a block as soon as a newer one is mined
+HEAD_WATCHER = cancel.HeadWatcher(lambda: web3.eth.block_number, poll_interval=0.25)
+# batches the reads made on the decision path into one round trip
+RPC_BATCH = rpc.Coalescer(web3)
+# spends the per block quote budget on the most promising grid rows
+SCHEDULER = scheduler.QuoteScheduler(scheduler.chain_budget(CHAIN_ID), N_THREADS)
+# prices the grid rows that were not quoted, from quotes of recent blocks
+QUOTE_MODEL = surface.QuoteModel()
+# raw multicalls for the per-block reads, decoded straight to ints
+MULTICALL = codec.Multicall(RPC_BATCH, MULTICALL2_ADDR)
+# strategy settings, hot reloaded from ARBIE_CONFIG and the control socket
+CONFIG = config.Config(
+    SLIPPAGE,
+    N_THREADS,
+    1 / 500,
+    1 / 100,
+    GRID_SIZE,
+    "Uniswap,Sushiswap,Aave2,Curve,Kyber,MultiPath,MegaPath,Compound,Bancor",  # noqa
+)
+CONFIG_WATCHER = config.ConfigWatcher(CONFIG)
+# simulates the zap grid on ARBIE_SCAN_PROCESSES worker processes, if set
+SCAN_POOL = scanpool.ScanPool()
 
 
 # Logger Setup
@@ -117,36 +164,28 @@ def get_prices_data(_from, to, amount, side="SELL", network=CHAIN_ID, **kwargs):
         "amount": amount,
         "side": side,
         "network": network,
-        "includeDEXS": "Uniswap,Sushiswap,Aave2,Curve,Kyber,MultiPath,MegaPath,Compound,Bancor",  # noqa
+        "includeDEXS": CONFIG.include_dexs,
     }
     query_params.update(kwargs)
-    resp = CACHED_SESSION.get(PRICES_URL, params=query_params)
-    if resp.ok:
-        return resp.json()
-    elif resp.status_code == 429:
-        raise TooManyRequests()
-    elif resp.status_code == 400:
-        return {"priceRoute": {"details": {"srcAmount": 2 ** 256 - 1, "destAmount": 0}}}
-    else:
-        raise Exception(resp.status_code)
-
-
-def unwrap_proxy(obj):
-    return getattr(obj, "__wrapped__", obj)
+    return quoting.get_prices(CACHED_SESSION, PRICES_URL, query_params)
 
 
 def color(value):
     return "<g>" if value > AAVE_FLASH_LOAN_FEE else "<y>" if value > 0 else "<r>"
 
 
-def build_paraswap_tx(data, is_sell=False):
+def build_paraswap_tx(quote, is_sell=False):
 
-    details = data["priceRoute"]["details"]
+    price_route = quote.route
+    details = price_route["details"]
 
     # means we are arbing curve and need to account for 1% slippage in
     # our return amount
     if is_sell:
-        details["destAmount"] = str(int(details["destAmount"]) * 0.99)
+        dest_amount = Amounts.from_ints([details["destAmount"]])
+        details["destAmount"] = str(
+            strategy.curve_dest_amount_exact(dest_amount, SLIPPAGE_BPS)[0]
+        )
 
     from_token = to_address(details["tokenFrom"])
     to_token = to_address(details["tokenTo"])
@@ -155,7 +194,7 @@ def build_paraswap_tx(data, is_sell=False):
         "fromDecimals": int(tokens_df.loc[from_token, "decimals"]),
         "referrer": "Arbie",
         "userAddress": ARBIE_ADDR,
-        "priceRoute": data["priceRoute"],
+        "priceRoute": price_route,
         "destAmount": details["destAmount"],  # need to account here
         "srcAmount": details["srcAmount"],
         "destToken": details["tokenTo"],
@@ -180,196 +219,346 @@ io_reverse_lookup = {
     idx: addr
     for idx, addr in zip(range(len(crypto_swap_coin_addrs)), crypto_swap_coin_addrs)
 }
+crypto_swap_symbols = [tokens_df.loc[addr, "symbol"] for addr in crypto_swap_coin_addrs]
+underlying_precisions = tuple(
+    10 ** (18 - int(tokens_df.loc[addr, "decimals"])) for addr in crypto_swap_coin_addrs
+)
+# base pool LP token followed by the crypto coins
+crypto_swap_precisions = (1,) + underlying_precisions[3:]
 
 
-def get_crypto_swap_balances():
-    """Get the token balances of the crypto swap"""
-    with multicall(MULTICALL2_ADDR) as call:
-        underlying_balances = [call(BASE_SWAP).balances(i) for i in range(3)]
-        balances = [call(CRYPTO_SWAP).balances(i) for i in range(3)]
-    return underlying_balances + balances[1:]
+def make_tx_template(key):
+    """Flash loan envelope for a (direction, i, j) with placeholder amounts"""
+    direction, i, j = key
+    is_curve = direction == recorder.CURVE
+    # i > j > i borrows coin i, j > i > j borrows coin j
+    asset = crypto_swap_coin_addrs[i if is_curve else j]
+    arbitrage = ARBIE.arbitrageCurve if is_curve else ARBIE.arbitrageParaswap
 
+    def encode_params(dx, min_dy, deadline, payload):
+        return HexBytes(arbitrage.encode_input(i, j, dx, min_dy, deadline, payload))
 
-def get_crypto_swap_io():
-    balances = get_crypto_swap_balances()
-    multicall_results = []
+    def encode_flash_loan(amount, params):
+        return codec.flash_loan(
+            ARBIE_ADDR, [asset], [amount], [0], ARBIE_ADDR, params, 0
+        )
 
-    # make calls to crypto_swap get_dy for 200 evenly spaced values
-    # between [balances[i] / 10, balances[i] / 2]
-    start_time = time.time()
-    with multicall(MULTICALL2_ADDR) as call:
-        for i, j in swap_io_pairs:
-            balance = balances[i]
-            for dx in np.linspace(balance // 500, balance // 100, 10):
-                dx = int(dx)
-                min_dy = call(CRYPTO_ZAP).get_dy_underlying(i, j, dx)
-                multicall_results.append([i, j, dx, min_dy])
-    logger.debug(f"Multicall2 response time: {time.time() - start_time:.2f}")
-    return multicall_results
-
-
-def arbitrage_curve(crypto_swap_io):
-    # buy on curve sell on quickswap
-    # aave i > curve j > paraswap i
+    return templates.build_template(key, encode_params, encode_flash_loan)
 
-    multicall_results = crypto_swap_io
 
-    # make calls to paraswap api checking for the best routes
-    # min dy is the output of the curve swap
-    df = pd.DataFrame(multicall_results, columns=["i", "j", "dx", "min_dy"]).applymap(
-        unwrap_proxy
-    )
+TX_TEMPLATES = templates.TemplateCache(make_tx_template)
+# (direction, i, j) of the last scanned block's best rows, pre-built while idle
+TOP_CANDIDATES = {}
 
-    df["from"] = df["j"].replace(io_reverse_lookup)
-    df["to"] = df["i"].replace(io_reverse_lookup)
 
-    # take a random sample of 10% since we can't ping the paraswap api for all opportunities
-    sampling_df = df.sample(frac=0.10)
+def apply_config(new, changed):
+    """Swap in a new strategy config between blocks, rebuilding only what it affects"""
+    global CONFIG, SLIPPAGE, SLIPPAGE_BPS, THREAD_POOL, swap_io_pairs
+    CONFIG, SLIPPAGE, SLIPPAGE_BPS = new, new.slippage, strategy.to_bps(new.slippage)
+    THREAD_POOL, swap_io_pairs = quoting.apply_config(
+        new,
+        changed,
+        SCHEDULER,
+        QUOTE_MODEL,
+        THREAD_POOL,
+        swap_io_pairs,
+        crypto_swap_symbols,
+        TOP_CANDIDATES,
+    )
+
 
-    logger.debug(
-        f"Calling Prices API {sampling_df.shape[0]} time(s) with {N_THREADS} threads"
+def estimate_tx(calldata):
+    """Gas limit of a flash loan tx and the chain head, in one batched round trip"""
+    tx = {"from": ACCOUNT.address, "to": LENDING_POOL.address, "data": calldata}
+    gas_limit, head = RPC_BATCH.gather(
+        ("eth_estimateGas", [tx]), ("eth_blockNumber", [])
     )
-    start_time = time.time()
-    # use threading to speed things up hopefully execution is <2-3 seconds
-    # real time: up to 10 seconds at worst
-    futures = THREAD_POOL.map(
-        get_prices_data,
-        sampling_df["from"].tolist(),
-        sampling_df["to"].tolist(),
-        sampling_df["min_dy"].tolist(),
-        timeout=10,
+    head = rpc.to_int(head)
+    HEAD_WATCHER.observe(head)
+    return rpc.to_int(gas_limit), head
+
+
+# base pool and crypto pool parameters read for the local zap simulator
+POOL_STATE_CALLS = [
+    (address, codec.encode_call(codec.selector(signature), *args))
+    for address, signature, *args in [
+        (BASE_SWAP_ADDR, "A_precise()"),
+        (BASE_SWAP_ADDR, "fee()"),
+        (BASE_SWAP_ADDR, "offpeg_fee_multiplier()"),
+        (BASE_LP_TOKEN.address, "totalSupply()"),
+        *[(BASE_SWAP_ADDR, "balances(uint256)", i) for i in range(3)],
+        (TRICRYPTO_SWAP_ADDR, "A_precise()"),
+        (TRICRYPTO_SWAP_ADDR, "gamma()"),
+        (TRICRYPTO_SWAP_ADDR, "D()"),
+        (TRICRYPTO_SWAP_ADDR, "price_scale(uint256)", 0),
+        (TRICRYPTO_SWAP_ADDR, "price_scale(uint256)", 1),
+        (TRICRYPTO_SWAP_ADDR, "mid_fee()"),
+        (TRICRYPTO_SWAP_ADDR, "out_fee()"),
+        (TRICRYPTO_SWAP_ADDR, "fee_gamma()"),
+        *[(TRICRYPTO_SWAP_ADDR, "balances(uint256)", i) for i in range(3)],
+    ]
+]
+
+
+def get_pool_states():
+    """Base pool and crypto pool state, the zap simulator's input for this block"""
+    with metrics.span("balance_fetch"):
+        _, results = MULTICALL.aggregate(POOL_STATE_CALLS)
+    values = [codec.to_int(data) for data in results]
+    base_A, fee, offpeg_fee_multiplier, lp_supply = values[:4]
+    base_pool = pool_math.StableSwapState(
+        base_A,
+        tuple(values[4:7]),
+        underlying_precisions[:3],
+        fee,
+        offpeg_fee_multiplier,
+        lp_supply,
     )
-    results = list(futures)
-    logger.debug(f"API response time: {time.time() - start_time:.2f}s")
-    sampling_df["results"] = results
-    sampling_df["dest_amount"] = sampling_df["results"].map(
-        lambda x: float(x["priceRoute"]["details"]["destAmount"])
+    A, gamma, D, *price_scale, mid_fee, out_fee, fee_gamma = values[7:15]
+    crypto_pool = pool_math.CryptoPoolState(
+        A,
+        gamma,
+        D,
+        tuple(price_scale),
+        tuple(values[15:18]),
+        crypto_swap_precisions,
+        mid_fee,
+        out_fee,
+        fee_gamma,
     )
-    sampling_df["profit"] = (
-        sampling_df["dest_amount"] - sampling_df["dx"]
-    ) / sampling_df["dx"]
-    return sampling_df
+    return base_pool, crypto_pool
 
 
-def arbitrage_paraswap(crypto_swap_io):
-    # buy on paraswap sell on curve
-    # aave j > paraswap i > curve j
+def get_crypto_swap_io():
+    base_pool, crypto_pool = get_pool_states()
+    balances = list(base_pool.balances + crypto_pool.balances[1:])
+    multicall_results = []
 
-    multicall_results = crypto_swap_io
+    # price CONFIG.grid_size evenly spaced sizes between balances[i] * CONFIG.dx_min
+    # and balances[i] * CONFIG.dx_max locally, mirroring CRYPTO_ZAP.get_dy_underlying,
+    # instead of one eth_call each
+    with metrics.span("grid_simulation") as span:
+        dx = np.floor(
+            [
+                np.linspace(
+                    balances[i] * CONFIG.dx_min,
+                    balances[i] * CONFIG.dx_max,
+                    CONFIG.grid_size,
+                )
+                for i, _ in swap_io_pairs
+            ]
+        ).reshape(-1, CONFIG.grid_size)
+        min_dy = SCAN_POOL.simulate(
+            pool_math.zap_get_dy_underlying,
+            (base_pool, crypto_pool),
+            swap_io_pairs,
+            dx,
+        )
+        min_dy = np.floor(np.clip(np.nan_to_num(min_dy) * (1 - SIM_MARGIN), 0, None))
+        for (i, j), sizes, outs in zip(swap_io_pairs, dx, min_dy):
+            multicall_results.extend(
+                [i, j, int(size), int(out)] for size, out in zip(sizes, outs)
+            )
+    logger.debug(f"Grid simulation time: {span.elapsed:.3f}s")
+    recorder.record_balances(balances)
+    recorder.record_grid(multicall_results)
+    return multicall_results, balances
 
-    # make calls to paraswap api checking for the best routes
-    # min dy is the output of the curve swap
-    df = pd.DataFrame(multicall_results, columns=["i", "j", "dx", "min_dy"]).applymap(
-        unwrap_proxy
+
+def confirm_min_dy(row):
+    """Check the simulated curve output against the zap, the chain may disagree"""
+    (min_dy,) = MULTICALL.uints(
+        [(TRICRYPTO_ZAP_ADDR, codec.get_dy_underlying(row.i, row.j, row.dx))]
+    )
+    if min_dy < row.min_dy:
+        logger.warning(f"Zap returns {min_dy} below the simulated {row.min_dy}")
+        metrics.inc("sim_mismatch_total")
+        return False
+    return True
+
+
+def request_quote(direction, i, j, dx, min_dy):
+    """Paraswap quote for one grid row, both directions trade coin j into coin i"""
+    _from, to = io_reverse_lookup[j], io_reverse_lookup[i]
+    if direction == recorder.CURVE:
+        # min dy is the output of the curve swap
+        return get_prices_data(_from, to, min_dy)
+    # slippage, don't need to account for in tx builder
+    buy_amount = strategy.paraswap_buy_amount_exact(
+        Amounts.from_ints([dx]), SLIPPAGE_BPS
     )
+    return get_prices_data(_from, to, buy_amount.to_ints()[0], side="BUY")
 
-    df["from"] = df["j"].replace(io_reverse_lookup)
-    df["to"] = df["i"].replace(io_reverse_lookup)
 
-    # take a random sample of 10% since we can't ping the paraswap api for all opportunities
-    sampling_df = df.sample(frac=0.10)
+def quote_margins(rows, results):
+    """Approximate margins of answered quotes under the current slippage"""
+    return quoting.quote_margins(rows, results, SLIPPAGE)
 
-    logger.debug(
-        f"Calling Prices API {sampling_df.shape[0]} time(s) with {N_THREADS} threads"
+
+def quote_grid(crypto_swap_io, balances, scope):
+    """Quote the grid rows worth quoting in both directions, best expected value first"""
+    grid = pd.DataFrame(crypto_swap_io, columns=["i", "j", "dx", "min_dy"])
+    grid["size"] = grid["dx"] / np.asarray(balances, dtype=np.float64)[grid["i"]]
+    candidates = pd.concat(
+        [
+            grid.assign(direction=recorder.CURVE),
+            grid.assign(direction=recorder.PARASWAP),
+        ],
+        ignore_index=True,
     )
-    start_time = time.time()
-    # use threading to speed things up hopefully execution is <2-3 seconds
-    # real time: up to 10 seconds at worst
-    func = partial(get_prices_data, side="BUY")
-    futures = THREAD_POOL.map(
-        func,
-        sampling_df["from"].tolist(),
-        sampling_df["to"].tolist(),
-        (
-            sampling_df["dx"] * 1.01
-        ).tolist(),  # 1% slippage, don't need to account for in tx builder
-        timeout=10,
+    with metrics.span("quote_fanout") as span:
+        quoted = SCHEDULER.run(
+            scope, THREAD_POOL, candidates, request_quote, quote_margins
+        )
+    logger.debug(f"API response time: {span.elapsed:.2f}s")
+    if surface.ENABLED:
+        quoted = quoting.confirm_predicted(
+            scope,
+            THREAD_POOL,
+            QUOTE_MODEL,
+            candidates,
+            quoted,
+            request_quote,
+            quote_margins,
+            AAVE_FLASH_LOAN_FEE,
+        )
+    quoted["from"] = quoted["j"].replace(io_reverse_lookup)
+    quoted["to"] = quoted["i"].replace(io_reverse_lookup)
+    return {
+        direction: quoted[quoted["direction"] == direction].drop(
+            columns=["direction", "size"]
+        )
+        for direction in (recorder.CURVE, recorder.PARASWAP)
+    }
+
+
+def arbitrage_curve(sampling_df):
+    # buy on curve sell on quickswap
+    # aave i > curve j > paraswap i
+    results = sampling_df["results"].tolist()
+    recorder.record_quotes(
+        recorder.CURVE,
+        zip(
+            sampling_df["i"],
+            sampling_df["j"],
+            sampling_df["dx"],
+            sampling_df["min_dy"],
+            [x.dest_amount for x in results],
+        ),
     )
-    results = list(futures)
-    logger.debug(f"API response time: {time.time() - start_time:.2f}s")
-    sampling_df["results"] = results
-    sampling_df["src_amount"] = sampling_df["results"].map(
-        lambda x: float(x["priceRoute"]["details"]["srcAmount"])
+    dest_amount = Amounts.from_ints([x.dest_amount for x in results])
+    sampling_df["dest_amount"] = dest_amount.to_ints()
+    dx = Amounts.from_ints(sampling_df["dx"])
+    sampling_df["profit"] = dest_amount.ratio(dx) - 1
+    return sampling_df
+
+
+def arbitrage_paraswap(sampling_df):
+    # buy on paraswap sell on curve
+    # aave j > paraswap i > curve j
+    results = sampling_df["results"].tolist()
+    recorder.record_quotes(
+        recorder.PARASWAP,
+        zip(
+            sampling_df["i"],
+            sampling_df["j"],
+            sampling_df["dx"],
+            sampling_df["min_dy"],
+            [x.src_amount for x in results],
+        ),
+    )
+    src_amount = Amounts.from_ints([x.src_amount for x in results])
+    sampling_df["src_amount"] = src_amount.to_ints()
+    min_dy = Amounts.from_ints(sampling_df["min_dy"])
+    # failed quotes can never be profitable
+    sampling_df["profit"] = np.where(
+        src_amount == MAX_AMOUNT, -np.inf, min_dy.ratio(src_amount) - 1
     )
-    sampling_df["profit"] = (
-        sampling_df["min_dy"] - sampling_df["src_amount"]
-    ) / sampling_df["src_amount"]
     return sampling_df
 
 
-def go_arbie():
-    crypto_swap_io = get_crypto_swap_io()
+def go_arbie(scope):
+    crypto_swap_io, balances = get_crypto_swap_io()
+    scope.check()
 
-    curve_df = arbitrage_curve(crypto_swap_io)
+    quoted = quote_grid(crypto_swap_io, balances, scope)
+    scope.check()
+    curve_df = arbitrage_curve(quoted[recorder.CURVE])
     curve_row_idx = np.argmax(curve_df["profit"])
     gc_profit_margin = curve_df.iloc[curve_row_idx, -1]
     logger.opt(colors=True).info(
         f"Curve Arb Profit Margin: {color(gc_profit_margin)}{gc_profit_margin:.2%} ({curve_df.iloc[curve_row_idx, 2]})</>"
     )
 
-    if gc_profit_margin > AAVE_FLASH_LOAN_FEE:
+    row = curve_df.iloc[curve_row_idx]
+    TOP_CANDIDATES[recorder.CURVE] = (recorder.CURVE, int(row.i), int(row.j))
+    quote = row.results.dest_amount
+    recorder.record_decision(
+        recorder.CURVE,
+        (row.i, row.j, row.dx, row.min_dy, quote),
+        gc_profit_margin,
+    )
+    candidate = strategy.is_candidate(gc_profit_margin, AAVE_FLASH_LOAN_FEE)
+    if candidate and confirm_min_dy(row):
         # arbing curve
-        row = curve_df.iloc[curve_row_idx]
-        paraswap_tx = build_paraswap_tx(row.results)
-        paraswap_calldata = HexBytes(paraswap_tx["data"])
-        # calldata given to arbie through the lending pool
-        params = ARBIE.arbitrageCurve.encode_input(
-            int(row.i),
-            int(row.j),
-            int(row.dx),
-            int(row.min_dy),
-            chain.time() + 120,
-            paraswap_calldata,
-        )
-        # calldata sent to lending pool
-        # i > j > i
-        calldata = LENDING_POOL.flashLoan.encode_input(
-            ARBIE_ADDR,
-            [crypto_swap_coin_addrs[row.i]],
-            [int(row.dx)],
-            [0],
-            ARBIE_ADDR,
-            params,
-            0,
-        )
-        if web3.eth.get_block_number() > row.results["priceRoute"]["blockNumber"]:
+        metrics.observe_decision()
+        with metrics.span("tx_build"):
+            paraswap_tx = scope.call(THREAD_POOL, build_paraswap_tx, row.results)
+            paraswap_calldata = HexBytes(paraswap_tx["data"])
+            # calldata sent to lending pool, wrapping the params given to arbie
+            # i > j > i
+            template = TX_TEMPLATES.get((recorder.CURVE, int(row.i), int(row.j)))
+            calldata = HexBytes(
+                template.render(
+                    int(row.dx),
+                    int(row.dx),
+                    int(row.min_dy),
+                    chain.time() + 120,
+                    paraswap_calldata,
+                )
+            ).hex()
+        with metrics.span("gas_estimation"):
+            gas_limit, head = scope.call(THREAD_POOL, estimate_tx, calldata)
+        scope.check()
+        if head > row.results.block_number:
             logger.opt(colors=True).warning("<y>Invalid block number</>")
             return
-        gas_limit = web3.eth.estimate_gas(
-            {"from": ACCOUNT.address, "to": LENDING_POOL.address, "data": calldata}
-        )
         logger.info(f"Estimated Gas Limit: {gas_limit}")
 
-    paraswap_df = arbitrage_paraswap(crypto_swap_io)
+    scope.check()
+    paraswap_df = arbitrage_paraswap(quoted[recorder.PARASWAP])
     paraswap_row_idx = np.argmax(paraswap_df["profit"])
     gp_profit_margin = paraswap_df.iloc[paraswap_row_idx, -1]
     logger.opt(colors=True).info(
         f"Paraswap Arb Profit Margin: {color(gp_profit_margin)}{gp_profit_margin:.2%} ({paraswap_df.iloc[paraswap_row_idx, -2]})</>"
     )
 
-    if gp_profit_margin > AAVE_FLASH_LOAN_FEE:
+    row = paraswap_df.iloc[paraswap_row_idx]
+    TOP_CANDIDATES[recorder.PARASWAP] = (recorder.PARASWAP, int(row.i), int(row.j))
+    quote = row.results.src_amount
+    recorder.record_decision(
+        recorder.PARASWAP,
+        (row.i, row.j, row.dx, row.min_dy, quote),
+        gp_profit_margin,
+    )
+    candidate = strategy.is_candidate(gp_profit_margin, AAVE_FLASH_LOAN_FEE)
+    if candidate and confirm_min_dy(row):
         # arbing paraswap
-        row = paraswap_df.iloc[paraswap_row_idx]
-        paraswap_tx = build_paraswap_tx(row.results)
-        paraswap_calldata = HexBytes(paraswap_tx["data"])
-        params = ARBIE.arbitrageParaswap.encode_input(
-            int(row.i),
-            int(row.j),
-            int(row.dx),
-            int(row.min_dy),
-            chain.time() + 120,
-            paraswap_calldata,
-        )
-        # j > i > j
-        calldata = LENDING_POOL.flashLoan.encode_input(
-            ARBIE_ADDR,
-            [crypto_swap_coin_addrs[row.j]],
-            [int(row.src_amount)],
-            [0],
-            ARBIE_ADDR,
-            params,
-            0,
-        )
+        metrics.observe_decision()
+        with metrics.span("tx_build"):
+            paraswap_tx = scope.call(THREAD_POOL, build_paraswap_tx, row.results)
+            paraswap_calldata = HexBytes(paraswap_tx["data"])
+            # j > i > j
+            template = TX_TEMPLATES.get((recorder.PARASWAP, int(row.i), int(row.j)))
+            calldata = HexBytes(
+                template.render(
+                    int(row.src_amount),
+                    int(row.dx),
+                    int(row.min_dy),
+                    chain.time() + 120,
+                    paraswap_calldata,
+                )
+            ).hex()
 
         if max(gc_profit_margin, gp_profit_margin) < AAVE_FLASH_LOAN_FEE:
             logger.opt(colors=True).info(
@@ -377,12 +566,12 @@ def go_arbie():
             )
             return
 
-        if web3.eth.get_block_number() > row.results["priceRoute"]["blockNumber"]:
+        with metrics.span("gas_estimation"):
+            gas_limit, head = scope.call(THREAD_POOL, estimate_tx, calldata)
+        scope.check()
+        if head > row.results.block_number:
             logger.opt(colors=True).warning("<y>Invalid block number</>")
             return
-        gas_limit = web3.eth.estimate_gas(
-            {"from": ACCOUNT.address, "to": LENDING_POOL.address, "data": calldata}
-        )
         logger.info(f"Estimated Gas Limit: {gas_limit}")
 
 
@@ -393,8 +582,37 @@ def go_arbie():
     logger=logger,
 )
 def main():
-    for block in chain.new_blocks():
-        logger.opt(colors=True).info(f"New block mined <c>{block['number']}</>")
-        go_arbie()
-        logger.debug("Sleeping for 3 seconds")
-        time.sleep(3)
+    metrics.start(PROJECT_DIR.joinpath("logs"), CHAIN_ID)
+    profiler.start(PROJECT_DIR.joinpath("logs"), CHAIN_ID)
+    recorder.start(PROJECT_DIR.joinpath(f"data/history-{CHAIN_ID}"))
+    HEAD_WATCHER.start()
+    started = CONFIG_WATCHER.start()
+    apply_config(started, config.changed_fields(CONFIG, started))
+    SCAN_POOL.start()
+    try:
+        for block in chain.new_blocks():
+            logger.opt(colors=True).info(f"New block mined <c>{block['number']}</>")
+            metrics.mark_block(block)
+            recorder.begin_block(block)
+            update = CONFIG_WATCHER.poll()
+            if update is not None:
+                apply_config(*update)
+            scope = HEAD_WATCHER.new_scope(block["number"])
+            try:
+                with profiler.block(block["number"]):
+                    go_arbie(scope)
+            except cancel.Cancelled as exc:
+                # the next block is already waiting, skip straight to it
+                logger.info(f"Abandoned {exc}")
+                metrics.inc("blocks_cancelled_total")
+                recorder.end_block()
+                continue
+            recorder.end_block()
+            # use the idle window to get the next block's transactions ready
+            idle_until = time.time() + 3
+            TX_TEMPLATES.prebuild(TOP_CANDIDATES.values())
+            logger.debug("Sleeping for 3 seconds")
+            time.sleep(max(idle_until - time.time(), 0))
+    finally:
+        recorder.flush()
+        SCAN_POOL.close()
@@ -0,0 +1,344 @@
+"""Off-chain pool math for size searches and pending transaction projection.
+
+The functions follow the on-chain implementations step by step but run in
+float64 and are vectorized over numpy arrays of trade sizes, so searching
+thousands of sizes costs a handful of numpy passes instead of thousands of
+``get_dy`` calls. Results are close approximations of the integer math on
+chain, good for ranking and projecting, not for calldata: amounts that end up in
+a transaction are still read from the chain (and a stale ``min_dy`` makes the
+final gas estimation revert rather than the trade lose money).
+
+Pool state is passed around as ``NamedTuple`` snapshots in on-chain units, a
+projected state is a new snapshot built with ``_replace``.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+# Uniswap V2
+
+
+class V2PairState(NamedTuple):
+    """Reserves of a Uniswap V2 style pair"""
+
+    address: str
+    token0: str
+    token1: str
+    reserve0: int
+    reserve1: int
+
+    def reserves(self, token_in):
+        """``(reserve_in, reserve_out)`` when selling ``token_in``"""
+        if token_in == self.token0:
+            return self.reserve0, self.reserve1
+        return self.reserve1, self.reserve0
+
+    def swap(self, token_in, amount_in, amount_out):
+        """Reserves after ``amount_in`` of ``token_in`` is swapped for ``amount_out``"""
+        if token_in == self.token0:
+            return self._replace(
+                reserve0=self.reserve0 + amount_in, reserve1=self.reserve1 - amount_out
+            )
+        return self._replace(
+            reserve0=self.reserve0 - amount_out, reserve1=self.reserve1 + amount_in
+        )
+
+
+def v2_amount_out(amount_in, reserve_in, reserve_out):
+    """``UniswapV2Library.getAmountOut``, 0.3% fee"""
+    amount_in_with_fee = amount_in * 997
+    return amount_in_with_fee * reserve_out / (reserve_in * 1000 + amount_in_with_fee)
+
+
+def v2_amount_in(amount_out, reserve_in, reserve_out):
+    """``UniswapV2Library.getAmountIn``, inf when the pair can't pay out"""
+    # a float denominator, python ints would raise on an exactly drained pair
+    denominator = np.asarray(reserve_out - amount_out, dtype=np.float64) * 997
+    with np.errstate(divide="ignore"):
+        amount_in = reserve_in * amount_out * 1000 / denominator
+    return np.where(amount_out < reserve_out, amount_in + 1, np.inf)
+
+
+# Curve crypto pool (tricrypto)
+
+N_COINS = 3
+A_MULTIPLIER = 10000
+PRECISION = 10 ** 18
+FEE_DENOMINATOR = 10 ** 10
+MAX_ITERATIONS = 255
+
+
+class CryptoPoolState(NamedTuple):
+    """Snapshot of a 3 coin curve crypto pool in on-chain units"""
+
+    A: int  # A_precise(), i.e. A * N ** N * A_MULTIPLIER
+    gamma: int
+    D: int
+    price_scale: tuple  # price of coins 1.. in coin 0, 1e18 precision
+    balances: tuple
+    precisions: tuple  # 10 ** (18 - decimals) per coin
+    mid_fee: int
+    out_fee: int
+    fee_gamma: int
+
+
+def _xp(state, balances):
+    """Balances in the pool's internal units (coin 0, 1e18 precision)"""
+    xp = np.asarray(balances, dtype=np.float64) * np.asarray(state.precisions, float)
+    prices = np.r_[1.0, np.asarray(state.price_scale, dtype=np.float64) / PRECISION]
+    return xp * prices
+
+
+def _constants(state):
+    # A and gamma as real numbers, the rest of the math stays in pool units
+    return state.A / A_MULTIPLIER, state.gamma / PRECISION
+
+
+def newton_D(ann, gamma, xp):
+    """Invariant D for ``(..., N_COINS)`` internal balances"""
+    xp = np.atleast_2d(xp)
+    S = xp.sum(axis=-1)
+    D = N_COINS * np.exp(np.log(xp).mean(axis=-1))
+    done = np.zeros(len(D), dtype=bool)
+    for _ in range(MAX_ITERATIONS):
+        D_prev = D
+        K0 = np.prod(xp * N_COINS / D[:, None], axis=-1)
+        g1k0 = np.abs(gamma + 1 - K0)
+        mul1 = D * (g1k0 / gamma) ** 2 / ann
+        mul2 = 2 * N_COINS * K0 / g1k0
+        neg_fprime = S + S * mul2 + mul1 * N_COINS / K0 - mul2 * D
+        D_plus = D * (neg_fprime + S) / neg_fprime
+        D_minus = D * D / neg_fprime + D * (mul1 / neg_fprime) * (1 - K0) / K0
+        D_new = np.where(D_plus > D_minus, D_plus - D_minus, (D_minus - D_plus) / 2)
+        D = np.where(done, D_prev, D_new)
+        done |= np.abs(D - D_prev) * 1e14 < np.maximum(1e16, D)
+        if done.all():
+            break
+    return D
+
+
+def newton_y(ann, gamma, xp, D, i):
+    """Internal balance of coin ``i`` keeping the invariant at ``D``"""
+    others = np.delete(np.atleast_2d(xp), i, axis=-1)
+    D = np.broadcast_to(np.asarray(D, dtype=np.float64), others.shape[:1])
+    # initial guess as on chain: D / N scaled by D / (x_k * N) for every other coin
+    y = D / N_COINS
+    for k in range(N_COINS - 1):
+        y = y * D / (others[:, k] * N_COINS)
+    K0_i = np.prod(others * N_COINS / D[:, None], axis=-1)
+    S_i = others.sum(axis=-1)
+    limit = np.maximum(np.maximum(others.max(axis=-1), D) / 1e14, 100)
+
+    done = np.zeros(len(y), dtype=bool)
+    for _ in range(MAX_ITERATIONS):
+        y_prev = y
+        K0 = K0_i * y * N_COINS / D
+        S = S_i + y
+        g1k0 = np.abs(gamma + 1 - K0)
+        mul1 = D * (g1k0 / gamma) ** 2 / ann
+        mul2 = 1 + 2 * K0 / g1k0
+        yfprime = y + S * mul2 + mul1 - D * mul2
+        fprime = yfprime / y
+        y_minus = mul1 / fprime
+        y_plus = (yfprime + D) / fprime + y_minus / K0
+        y_minus = y_minus + S / fprime
+        # overshoots are halved, like the on-chain solver
+        y_new = np.where(
+            (yfprime > 0) & (y_plus > y_minus), y_plus - y_minus, y_prev / 2
+        )
+        y = np.where(done, y_prev, y_new)
+        done |= np.abs(y - y_prev) < np.maximum(limit, y / 1e14)
+        if done.all():
+            break
+    return y
+
+
+def _fee(state, xp):
+    """Dynamic fee in 1e10 precision, ``mid_fee`` when balanced, ``out_fee`` when not"""
+    S = xp.sum(axis=-1)
+    K = np.prod(N_COINS * xp / S[:, None], axis=-1)
+    fee_gamma = state.fee_gamma / PRECISION
+    f = fee_gamma / (fee_gamma + 1 - K)
+    return state.mid_fee * f + state.out_fee * (1 - f)
+
+
+def get_dy(state, i, j, dx):
+    """``get_dy(i, j, dx)`` for an array of ``dx``, in coin ``j`` units"""
+    ann, gamma = _constants(state)
+    dx = np.atleast_1d(np.asarray(dx, dtype=np.float64))
+    balances = np.tile(np.asarray(state.balances, dtype=np.float64), (len(dx), 1))
+    balances[:, i] += dx
+    xp = _xp(state, balances)
+    y = newton_y(ann, gamma, xp, float(state.D), j)
+    dy = xp[:, j] - y - 1
+    xp[:, j] = y
+    if j > 0:
+        dy = dy * PRECISION / state.price_scale[j - 1]
+    dy = dy / state.precisions[j]
+    return dy - _fee(state, xp) * dy / FEE_DENOMINATOR
+
+
+def exchange(state, i, j, dx):
+    """``(dy, state)`` after swapping ``dx`` of coin ``i`` for coin ``j``
+
+    ``price_scale`` is kept as is: the repeg in ``tweak_price`` only moves it
+    when the pool has made enough profit and then only by a small step.
+    """
+    dy = int(get_dy(state, i, j, [dx])[0])
+    balances = list(state.balances)
+    balances[i] += int(dx)
+    balances[j] -= dy
+    return dy, _with_balances(state, balances)
+
+
+def add_liquidity(state, amounts):
+    """State after depositing ``amounts``, the fee stays in the pool as LP tokens"""
+    balances = [int(b) + int(a) for b, a in zip(state.balances, amounts)]
+    return _with_balances(state, balances)
+
+
+def _with_balances(state, balances):
+    ann, gamma = _constants(state)
+    D = newton_D(ann, gamma, _xp(state, balances))[0]
+    return state._replace(balances=tuple(balances), D=int(D))
+
+
+# Curve StableSwap (aave style base pool) and the crypto pool zap
+
+A_PRECISION = 100
+
+
+class StableSwapState(NamedTuple):
+    """Snapshot of a StableSwap pool holding interest bearing tokens 1:1 with underlying"""
+
+    A: int  # A_precise()
+    balances: tuple
+    precisions: tuple  # 10 ** (18 - decimals) per coin
+    fee: int
+    offpeg_fee_multiplier: int
+    lp_supply: int
+
+
+def stable_get_D(amp, xp):
+    """StableSwap invariant for ``(..., N)`` balances in 1e18 precision"""
+    xp = np.atleast_2d(xp)
+    n = xp.shape[-1]
+    S = xp.sum(axis=-1)
+    D = S
+    ann = amp * n
+    for _ in range(MAX_ITERATIONS):
+        D_P = D
+        for k in range(n):
+            D_P = D_P * D / (xp[:, k] * n)
+        D_prev = D
+        D = (
+            (ann * S / A_PRECISION + D_P * n)
+            * D
+            / ((ann - A_PRECISION) * D / A_PRECISION + (n + 1) * D_P)
+        )
+        if (np.abs(D - D_prev) <= np.maximum(1, D * 1e-15)).all():
+            break
+    return D
+
+
+def stable_get_y_D(amp, i, xp, D):
+    """Balance of coin ``i`` keeping the invariant at ``D``"""
+    xp = np.atleast_2d(xp)
+    n = xp.shape[-1]
+    others = np.delete(xp, i, axis=-1)
+    D = np.broadcast_to(np.asarray(D, dtype=np.float64), others.shape[:1])
+    ann = amp * n
+    c = D
+    for k in range(n - 1):
+        c = c * D / (others[:, k] * n)
+    c = c * D * A_PRECISION / (ann * n)
+    b = others.sum(axis=-1) + D * A_PRECISION / ann
+    y = D
+    for _ in range(MAX_ITERATIONS):
+        y_prev = y
+        y = (y * y + c) / (2 * y + b - D)
+        if (np.abs(y - y_prev) <= np.maximum(1, y * 1e-15)).all():
+            break
+    return y
+
+
+def _dynamic_fee(state, xpi, xpj):
+    if state.offpeg_fee_multiplier <= FEE_DENOMINATOR:
+        return np.full(np.shape(xpi), float(state.fee))
+    xps2 = (xpi + xpj) ** 2
+    return (state.offpeg_fee_multiplier * state.fee) / (
+        (state.offpeg_fee_multiplier - FEE_DENOMINATOR) * 4 * xpi * xpj / xps2
+        + FEE_DENOMINATOR
+    )
+
+
+def _stable_xp(state, n_rows):
+    xp = np.asarray(state.balances, dtype=np.float64) * state.precisions
+    return np.tile(xp, (n_rows, 1))
+
+
+def stable_get_dy(state, i, j, dx):
+    """Base pool ``get_dy(i, j, dx)`` for an array of ``dx``"""
+    dx = np.atleast_1d(np.asarray(dx, dtype=np.float64))
+    xp = _stable_xp(state, len(dx))
+    D = stable_get_D(state.A, xp)
+    x = xp[:, i] + dx * state.precisions[i]
+    xp_new = xp.copy()
+    xp_new[:, i] = x
+    y = stable_get_y_D(state.A, j, xp_new, D)
+    dy = xp[:, j] - y
+    fee = _dynamic_fee(state, (xp[:, i] + x) / 2, (xp[:, j] + y) / 2) * dy
+    return (dy - fee / FEE_DENOMINATOR) / state.precisions[j]
+
+
+def stable_calc_token_amount(state, i, amount):
+    """LP tokens minted for depositing ``amount`` of coin ``i`` alone (no fee, as the view)"""
+    amount = np.atleast_1d(np.asarray(amount, dtype=np.float64))
+    xp = _stable_xp(state, len(amount))
+    D0 = stable_get_D(state.A, xp)
+    xp[:, i] += amount * state.precisions[i]
+    D1 = stable_get_D(state.A, xp)
+    return (D1 - D0) * state.lp_supply / D0
+
+
+def stable_calc_withdraw_one_coin(state, token_amount, i):
+    """Coin ``i`` received for burning ``token_amount`` LP tokens"""
+    token_amount = np.atleast_1d(np.asarray(token_amount, dtype=np.float64))
+    xp = _stable_xp(state, len(token_amount))
+    D0 = stable_get_D(state.A, xp)
+    D1 = D0 - token_amount * D0 / state.lp_supply
+    new_y = stable_get_y_D(state.A, i, xp, D1)
+
+    fee = state.fee * xp.shape[-1] / (4 * (xp.shape[-1] - 1))
+    fee_state = state._replace(fee=fee)
+    xp_reduced = xp.copy()
+    for k in range(xp.shape[-1]):
+        if k == i:
+            dx_expected = xp[:, k] * D1 / D0 - new_y
+            xavg = (xp[:, k] + new_y) / 2
+        else:
+            dx_expected = xp[:, k] - xp[:, k] * D1 / D0
+            xavg = xp[:, k]
+        dynamic_fee = _dynamic_fee(fee_state, xavg, xavg)
+        xp_reduced[:, k] -= dynamic_fee * dx_expected / FEE_DENOMINATOR
+    dy = xp_reduced[:, i] - stable_get_y_D(state.A, i, xp_reduced, D1)
+    return (dy - 1) / state.precisions[i]
+
+
+def zap_get_dy_underlying(base, crypto, i, j, dx):
+    """Crypto pool zap ``get_dy_underlying(i, j, dx)`` for an array of ``dx``
+
+    Underlying coins are the base pool coins followed by the crypto pool's
+    non-LP coins. Stable to stable swaps stay in the base pool, otherwise a
+    stable input is deposited for LP tokens, swapped on the crypto pool and a
+    stable output is withdrawn from the base pool as a single coin.
+    """
+    n_stable = len(base.balances)
+    if i < n_stable and j < n_stable:
+        return stable_get_dy(base, i, j, dx)
+    if i < n_stable:
+        dx = stable_calc_token_amount(base, i, dx)
+    dy = get_dy(crypto, max(i - n_stable + 1, 0), max(j - n_stable + 1, 0), dx)
+    if j < n_stable:
+        dy = stable_calc_withdraw_one_coin(base, dy, j)
+    return dy
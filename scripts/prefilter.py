@@ -0,0 +1,64 @@
+"""Spot price prefilter run before a pair is gridded and quoted.
+
+Both arbitrage directions of an ordered pair ``(i, j)`` sell ``i`` for ``j`` on
+the crypto pool and buy ``i`` back with ``j`` through Paraswap, they only differ
+in which coin is borrowed. The round trip at marginal size is therefore
+
+    (price of i in j on curve) * (1 - curve fee) * (price of j in i on a DEX) * (1 - DEX fee)
+
+The curve side is read from the pool's ``price_oracle``/``last_prices`` and the
+DEX side from the Uniswap/Sushiswap mid-price, so one multicall prices every
+pair. Larger trades only do worse than the marginal price, so a pair whose best
+round trip cannot cover the flash loan premium and slippage is skipped.
+Paraswap may route through venues beating a V2 mid, ``SLACK`` is the allowance
+for that.
+
+With ``ARBIE_RECORD=1`` the spreads are computed and recorded even when the
+filter is off, so ``scripts.backtest`` can measure how many profitable blocks a
+threshold would have thrown away (``Params.min_spread``).
+"""
+import os
+
+import numpy as np
+
+ENABLED = os.getenv("ARBIE_PREFILTER", "0") == "1"
+# how far below the break even spread a pair is still quoted
+SLACK = float(os.getenv("ARBIE_PREFILTER_SLACK", "0.005"))
+V2_FEE = 0.003
+PRECISION = 10 ** 18
+
+
+def crypto_prices(oracle_prices):
+    """Price of every coin in coin 0, from ``price_oracle``/``last_prices`` words"""
+    return np.r_[1.0, np.asarray(oracle_prices, dtype=np.float64) / PRECISION]
+
+
+def v2_rate(reserve_in, reserve_out, precision_in, precision_out):
+    """Units of coin out per unit of coin in at the pair's mid-price, both in 18 decimals"""
+    return (reserve_out * precision_out) / (reserve_in * precision_in)
+
+
+def spreads(curve_prices, dex_rates, curve_fee, dex_fee=V2_FEE):
+    """Marginal round trip gain per ordered pair ``(i, j)``
+
+    ``curve_prices`` is a list of coin price vectors (oracle and last trade), the
+    most favourable one is used. ``dex_rates`` maps ``(j, i)`` to the best V2 rate
+    of coin ``j`` into coin ``i``. Pairs without a DEX rate are left out.
+    """
+    curve_prices = np.atleast_2d(curve_prices)
+    out = {}
+    for (j, i), rate in dex_rates.items():
+        # coin i into coin j on curve
+        curve_rate = np.max(curve_prices[:, i] / curve_prices[:, j])
+        out[(i, j)] = curve_rate * (1 - curve_fee) * rate * (1 - dex_fee) - 1
+    return out
+
+
+def threshold(flash_loan_fee, slippage, slack=SLACK):
+    """Smallest spread worth gridding and quoting"""
+    return flash_loan_fee + slippage - slack
+
+
+def select(pairs, pair_spreads, min_spread):
+    """The pairs worth quoting, pairs without a spread are always kept"""
+    return [pair for pair in pairs if pair_spreads.get(pair, np.inf) >= min_spread]
@@ -0,0 +1,114 @@
+"""Dry runs of the best few flash loan candidates of a block.
+
+By default only the best quoted row of each direction is built and its gas
+estimated, so a candidate that reverts (slippage, a stale route) wastes the
+block. With ``ARBIE_PRESIM_TOP_K=<k>`` the ``k`` best rows across both
+directions have their Paraswap transactions built concurrently, then every
+candidate's ``LENDING_POOL.flashLoan`` calldata is run against the pending
+block in a single JSON-RPC batch:
+
+- an ``eth_call`` of Multicall2 ``tryAggregate`` reading the ArbieV3 owner's
+  balance of the borrowed coin, running the flash loan and reading the balance
+  again, the difference is the profit the transaction would pay out
+- an ``eth_estimateGas`` of the flash loan from the submitting account
+
+The succeeding candidate with the highest profit net of gas is submitted.
+"""
+import os
+from typing import NamedTuple
+
+from scripts import codec, rpc
+
+TOP_K = int(os.getenv("ARBIE_PRESIM_TOP_K", "0"))
+ENABLED = TOP_K > 0
+
+
+class Candidate(NamedTuple):
+    direction: int
+    row: object  # the quoted grid row
+    asset: str  # the borrowed coin, the profit is paid in it too
+    calldata: str  # hex ``flashLoan`` calldata
+    deadline: int
+
+
+class Result(NamedTuple):
+    candidate: Candidate
+    profit: int  # owner's balance change in ``candidate.asset``
+    gas_limit: int
+    error: str = ""  # why the candidate reverts, empty if it succeeds
+
+    @property
+    def ok(self):
+        return not self.error
+
+
+def top_rows(frames, k, min_margin):
+    """The ``k`` best ``(direction, row)`` of ``{direction: rows}`` above ``min_margin``"""
+    rows = []
+    for direction, frame in frames.items():
+        above = frame[frame["profit"] > min_margin]
+        rows.extend(
+            (direction, row) for _, row in above.nlargest(k, "profit").iterrows()
+        )
+    rows.sort(key=lambda item: item[1]["profit"], reverse=True)
+    return rows[:k]
+
+
+def simulate(
+    batch, multicall, lending_pool, sender, owner, candidates, block="pending"
+):
+    """Run every candidate against ``block``, in one batch with the gas price and head
+
+    Returns ``(results, gas_price, head)``, results in candidate order.
+    """
+    pending = []
+    for candidate in candidates:
+        calls = [
+            (candidate.asset, codec.balance_of(owner)),
+            (lending_pool, bytes.fromhex(candidate.calldata[2:])),
+            (candidate.asset, codec.balance_of(owner)),
+        ]
+        call = {
+            "to": multicall,
+            "data": "0x" + codec.try_aggregate(False, calls).hex(),
+        }
+        tx = {"from": sender, "to": lending_pool, "data": candidate.calldata}
+        pending.append(
+            (
+                batch.submit("eth_call", [call, block]),
+                batch.submit("eth_estimateGas", [tx, block]),
+            )
+        )
+    gas_price = batch.submit("eth_gasPrice", [])
+    head = batch.submit("eth_blockNumber", [])
+    batch.flush()
+    results = [
+        _result(candidate, call, estimate)
+        for candidate, (call, estimate) in zip(candidates, pending)
+    ]
+    return results, rpc.to_int(gas_price.result()), rpc.to_int(head.result())
+
+
+def _result(candidate, call, estimate):
+    try:
+        (_, before), (success, _), (_, after) = codec.decode_try_aggregate(
+            bytes.fromhex(call.result()[2:])
+        )
+        if not success:
+            return Result(candidate, 0, 0, "flash loan reverted")
+        gas_limit = rpc.to_int(estimate.result())
+    except ValueError as exc:
+        return Result(candidate, 0, 0, str(exc))
+    return Result(candidate, codec.to_int(after) - codec.to_int(before), gas_limit)
+
+
+def choose(results, net_profit):
+    """The succeeding result with the highest ``net_profit(result)`` above 0, if any"""
+    best, best_net = None, 0
+    for result in results:
+        if not result.ok:
+            continue
+        net = net_profit(result)
+        if net > best_net:
+            best, best_net = result, net
+    return best
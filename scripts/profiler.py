@@ -0,0 +1,184 @@
+"""Sampling profiler for slow block scans.
+
+While a block is captured a background thread walks ``sys._current_frames()``
+every ``INTERVAL`` seconds, so the quote fan-out and RPC threads are sampled
+along with the scan loop itself. A block is captured when profiling is armed
+and either
+
+- its number is a multiple of ``ARBIE_PROFILE_EVERY``, or
+- ``ARBIE_PROFILE_THRESHOLD`` is set, the samples are then only written out if
+  the block took at least that many seconds
+
+Kept captures are written to ``logs/`` as
+``profile-<chain id>-<block>.collapsed``, one ``frame;frame;... count`` line per
+stack as read by ``flamegraph.pl`` and speedscope, and ``.txt`` with the top
+``ARBIE_PROFILE_TOP`` functions by self and cumulative samples.
+
+Profiling is armed at start with ``ARBIE_PROFILE=1`` and toggled at runtime with
+``kill -USR1 <pid>``. Disarmed, the sampler thread is parked on an event and a
+block costs one flag check.
+"""
+import collections
+import os
+import signal
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+from loguru import logger
+
+ENABLED = os.getenv("ARBIE_PROFILE", "0") == "1"
+EVERY = int(os.getenv("ARBIE_PROFILE_EVERY", "0"))
+THRESHOLD = float(os.getenv("ARBIE_PROFILE_THRESHOLD", "0"))
+INTERVAL = float(os.getenv("ARBIE_PROFILE_INTERVAL", "0.005"))
+TOP_N = int(os.getenv("ARBIE_PROFILE_TOP", "25"))
+
+# frames from these files are idle workers and timers, not scan work
+_IDLE_FILES = (
+    "threading.py",
+    "queue.py",
+    "selectors.py",
+    os.path.join("concurrent", "futures", "thread.py"),
+)
+
+
+def _frame_label(code):
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+class Sampler:
+    """Collects collapsed stacks of every thread while ``running`` is set"""
+
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.n_samples = 0
+        self.running = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def begin(self):
+        with self._lock:
+            self.stacks = collections.Counter()
+            self.n_samples = 0
+        self.running.set()
+
+    def end(self):
+        """Stop sampling, returns ``(stacks, n_samples)``"""
+        self.running.clear()
+        with self._lock:
+            return self.stacks, self.n_samples
+
+    def _loop(self):
+        own = threading.get_ident()
+        main = threading.main_thread().ident
+        while True:
+            self.running.wait()
+            started = time.perf_counter()
+            frames = sys._current_frames()
+            with self._lock:
+                self.n_samples += 1
+                for ident, frame in frames.items():
+                    if ident == own:
+                        continue
+                    if ident != main and frame.f_code.co_filename.endswith(_IDLE_FILES):
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_label(frame.f_code))
+                        frame = frame.f_back
+                    self.stacks[";".join(reversed(stack))] += 1
+            del frames
+            time.sleep(max(self.interval - (time.perf_counter() - started), 0))
+
+
+def summarize(stacks, n_samples, top_n=TOP_N):
+    """Top functions by self and cumulative samples as a text table"""
+    own, total = collections.Counter(), collections.Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    n_stacks = max(sum(stacks.values()), 1)
+    lines = [
+        f"{n_samples} samples, {n_stacks} busy thread stacks "
+        f"({len(stacks)} distinct)",
+        "",
+    ]
+    for title, counter in (("self", own), ("cumulative", total)):
+        lines.append(f"top {top_n} by {title} samples")
+        for frame, count in counter.most_common(top_n):
+            lines.append(f"{count:8d} {count / n_stacks:7.1%}  {frame}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+class Profiler:
+    """Decides which blocks are captured and writes the kept ones to ``log_dir``"""
+
+    def __init__(
+        self, log_dir, chain_id, armed=ENABLED, every=EVERY, threshold=THRESHOLD
+    ):
+        self.log_dir = Path(log_dir)
+        self.chain_id = chain_id
+        self.armed = armed
+        self.every = every
+        self.threshold = threshold
+        self._sampler = None
+
+    def toggle(self, *_):
+        self.armed = not self.armed
+        logger.info(f"Profiling {'armed' if self.armed else 'disarmed'}")
+
+    @contextmanager
+    def block(self, block_number):
+        forced = bool(self.every) and block_number % self.every == 0
+        if not self.armed or not (forced or self.threshold > 0):
+            yield
+            return
+        if self._sampler is None:
+            self._sampler = Sampler()
+        start = time.perf_counter()
+        self._sampler.begin()
+        try:
+            yield
+        finally:
+            stacks, n_samples = self._sampler.end()
+            elapsed = time.perf_counter() - start
+            if forced or (self.threshold and elapsed >= self.threshold):
+                self.write(block_number, stacks, n_samples, elapsed)
+
+    def write(self, block_number, stacks, n_samples, elapsed):
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        stem = self.log_dir.joinpath(f"profile-{self.chain_id}-{block_number}")
+        stem.with_suffix(".collapsed").write_text(
+            "".join(f"{stack} {count}\n" for stack, count in stacks.items())
+        )
+        stem.with_suffix(".txt").write_text(
+            f"block {block_number} took {elapsed:.3f}s\n" + summarize(stacks, n_samples)
+        )
+        logger.info(f"Profiled block {block_number} ({elapsed:.2f}s) to {stem}.*")
+
+
+_profiler = None
+
+
+def start(log_dir, chain_id):
+    """Set up block profiling, ``SIGUSR1`` toggles it"""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(log_dir, chain_id)
+        signal.signal(signal.SIGUSR1, _profiler.toggle)
+
+
+def block(block_number):
+    """Context manager around one block's scan"""
+    if _profiler is None:
+        return nullcontext()
+    return _profiler.block(block_number)
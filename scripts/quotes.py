@@ -0,0 +1,86 @@
+"""Compact Paraswap quotes decoded only as far as the scan needs.
+
+A ``/v2/prices`` answer is mostly the ``priceRoute.bestRoute`` tree, yet for
+every sampled row the scan only reads ``srcAmount``, ``destAmount`` and
+``blockNumber``, the route itself is only posted back to the tx builder for the
+winning row of a direction. ``Quote.from_bytes`` pulls the three fields out of
+the raw body with a regex over ``priceRoute.details`` and keeps the body as
+bytes, ``Quote.route`` decodes it on first access. Bodies the regex does not
+match are fully decoded right away.
+
+Decoding uses ``orjson`` when it is installed, the standard library otherwise.
+"""
+import re
+
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+# srcAmount placeholder of a failed quote, it can never look profitable
+FAILED_SRC_AMOUNT = 2 ** 256 - 1
+
+# ``details`` is a flat object, unlike ``bestRoute`` whose swaps carry their own
+# srcAmount/destAmount
+_DETAILS = re.compile(rb'"details"\s*:\s*\{([^{}]*)\}')
+_SRC_AMOUNT = re.compile(rb'"srcAmount"\s*:\s*"?(\d+)')
+_DEST_AMOUNT = re.compile(rb'"destAmount"\s*:\s*"?(\d+)')
+_BLOCK_NUMBER = re.compile(rb'"blockNumber"\s*:\s*"?(\d+)')
+
+
+def loads(data):
+    return _json.loads(data)
+
+
+class Quote:
+    """The amounts of a Paraswap price route, the route decoded on demand"""
+
+    __slots__ = ("src_amount", "dest_amount", "block_number", "_raw", "_route")
+
+    def __init__(self, src_amount, dest_amount, block_number=0, raw=None, route=None):
+        self.src_amount = int(src_amount)
+        self.dest_amount = int(dest_amount)
+        self.block_number = int(block_number)
+        self._raw = raw
+        self._route = route
+
+    @classmethod
+    def from_bytes(cls, raw):
+        """Quote from a raw ``/v2/prices`` response body"""
+        details = _DETAILS.search(raw)
+        if details is not None:
+            src = _SRC_AMOUNT.search(details.group(1))
+            dest = _DEST_AMOUNT.search(details.group(1))
+            block = _BLOCK_NUMBER.search(raw)
+            if src and dest and block:
+                return cls(src.group(1), dest.group(1), block.group(1), raw=raw)
+        return cls.from_route(loads(raw)["priceRoute"])
+
+    @classmethod
+    def from_route(cls, route):
+        details = route["details"]
+        return cls(
+            details["srcAmount"],
+            details["destAmount"],
+            route.get("blockNumber", 0),
+            route=route,
+        )
+
+    @classmethod
+    def failed(cls):
+        """Placeholder for a pair/amount Paraswap could not route"""
+        return cls(FAILED_SRC_AMOUNT, 0)
+
+    @property
+    def route(self):
+        """The full ``priceRoute``, decoded from the raw body on first access"""
+        if self._route is None and self._raw is not None:
+            self._route = loads(self._raw)["priceRoute"]
+            self._raw = None
+        return self._route
+
+    def __repr__(self):
+        return (
+            f"<Quote src={self.src_amount} dest={self.dest_amount} "
+            f"block={self.block_number}>"
+        )
@@ -0,0 +1,142 @@
+"""Paraswap quoting steps shared by the mainnet and Polygon bots.
+
+Both bots quote the same kind of grid, ``(direction, i, j, dx, min_dy)`` rows of
+a tricrypto pool, they only differ in how the grid is simulated and how a
+winning row becomes a transaction. Everything that depends on the running
+config (slippage, thread pool, the quote scheduler) is passed in, the bots keep
+owning that state and rebinding it on a config change.
+"""
+import concurrent.futures
+import itertools as it
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from scripts import metrics, quotes, recorder, scheduler, strategy, surface
+
+
+class TooManyRequests(Exception):
+    pass
+
+
+def get_prices(session, url, params):
+    """Quote from Paraswap's ``/v2/prices``, a failed quote if it cannot route"""
+    resp = session.get(url, params=params)
+    metrics.inc("paraswap_requests_total")
+    if getattr(resp, "from_cache", False):
+        metrics.inc("paraswap_cache_hits_total")
+    if resp.ok:
+        metrics.inc("quotes_total")
+        return quotes.Quote.from_bytes(resp.content)
+    elif resp.status_code == 429:
+        metrics.inc("paraswap_429_total")
+        raise TooManyRequests()
+    elif resp.status_code == 400:
+        return quotes.Quote.failed()
+    else:
+        raise Exception(resp.status_code)
+
+
+def quote_margins(rows, results, slippage):
+    """Approximate margins of answered quotes, for the scheduler's surface"""
+    is_curve = rows["direction"].to_numpy() == recorder.CURVE
+    quote = np.array(
+        [
+            float(x.dest_amount if curve else x.src_amount)
+            for x, curve in zip(results, is_curve)
+        ]
+    )
+    dx = rows["dx"].to_numpy(dtype=np.float64)
+    min_dy = rows["min_dy"].to_numpy(dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(
+            is_curve,
+            strategy.curve_margin(dx, quote, slippage),
+            strategy.paraswap_margin(min_dy, quote),
+        )
+
+
+def confirm_predicted(
+    scope, pool, model, candidates, quoted, request_quote, margins, flash_loan_fee
+):
+    """Quote each direction's predicted best row if it was not quoted and could win
+
+    ``margins(rows, results)`` prices answers the way the scheduler does, the
+    returned frame holds ``quoted`` and the confirmed rows with their results.
+    """
+    model.observe(scope.block_number, quoted, quoted["results"].tolist())
+    unquoted = candidates.drop(index=quoted.index)
+    if not len(unquoted) or not len(quoted):
+        return quoted
+    prediction = model.predict(scope.block_number, unquoted)
+    margin, low, high = (
+        margins(unquoted, surface.as_quotes(unquoted, answer)) for answer in prediction
+    )
+    quoted_margins = margins(quoted, quoted["results"].tolist())
+    directions = quoted["direction"].to_numpy()
+    quoted_best = {
+        direction: np.nanmax(quoted_margins[directions == direction], initial=-np.inf)
+        for direction in np.unique(directions)
+    }
+    picked = surface.best_unquoted(
+        unquoted, margin, np.fmax(low, high), quoted_best, flash_loan_fee
+    )
+    if not picked:
+        return quoted
+    positions = list(picked.values())
+    rows = unquoted.iloc[positions]
+    results = scope.map(
+        pool,
+        request_quote,
+        rows["direction"].tolist(),
+        rows["i"].tolist(),
+        rows["j"].tolist(),
+        rows["dx"].tolist(),
+        rows["min_dy"].tolist(),
+    )
+    metrics.inc("surface_confirmations_total", len(rows))
+    confirmed = margins(rows, results)
+    for (_, row), predicted, actual in zip(
+        rows.iterrows(), margin[positions], confirmed
+    ):
+        logger.debug(
+            f"Confirmed predicted row {row.direction} {row.i} > {row.j} dx {row.dx}: "
+            f"margin {predicted:.2%} predicted, {actual:.2%} quoted"
+        )
+    rows = rows.assign(results=results)
+    model.observe(scope.block_number, rows, results)
+    return pd.concat([quoted, rows])
+
+
+def trading_pairs(symbols, coins):
+    """Ordered coin index pairs to scan, only between ``coins`` symbols if given"""
+    unknown = set(coins) - set(symbols)
+    if unknown:
+        logger.warning(f"Not in the pool, ignored: {', '.join(sorted(unknown))}")
+    keep = [n for n, symbol in enumerate(symbols) if not coins or symbol in coins]
+    return list(it.permutations(keep, r=2))
+
+
+def apply_config(
+    new, changed, quote_scheduler, model, pool, pairs, symbols, top_candidates
+):
+    """Rebuild what a new strategy config affects, returns ``(pool, pairs)`` to use
+
+    ``pool`` is replaced when the thread count changed, ``pairs`` when the coins
+    did, ``top_candidates`` loses the entries of pairs no longer scanned.
+    """
+    if changed & {"slippage", "include_dexs"}:
+        # the observed margins were priced under the old settings
+        quote_scheduler.surface = scheduler.Surface()
+        model.reset()
+    if "n_threads" in changed:
+        pool.shutdown(wait=False)
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=new.n_threads)
+        quote_scheduler.wave_size = new.n_threads
+    if "coins" in changed:
+        pairs = trading_pairs(symbols, new.coins)
+        for direction, (_, i, j) in list(top_candidates.items()):
+            if (i, j) not in pairs:
+                del top_candidates[direction]
+    return pool, pairs
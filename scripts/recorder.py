@@ -0,0 +1,330 @@
+"""Append-only per-block history of pool state, quotes and decisions.
+
+Each scanned block contributes rows to six tables:
+
+- ``blocks``: block number, timestamp and pool balances
+- ``grid``: every ``(i, j, dx, min_dy)`` row priced on the crypto pool
+- ``quotes``: the sampled Paraswap quotes for both arbitrage directions
+- ``decisions``: the best row per direction, its margin, gas and tx outcome
+- ``prefilter``: the spot spread of every pair and whether it was quoted
+- ``outcomes``: submitted txs that were mined or cancelled by that block, keyed
+  by the decision's ``tx_hash``
+
+Rows are buffered in memory and written out as a segment directory holding one
+``.npy`` file per column once ``BLOCKS_PER_SEGMENT`` blocks have been collected.
+Segments are written to a temporary directory and renamed into place, so readers
+only ever see complete segments, and are opened with ``mmap_mode="r"`` so weeks
+of history can be scanned without loading it into RAM.
+
+Token amounts are stored as ``(n, 2)`` uint64 ``[hi, lo]`` limbs, values that do
+not fit in 128 bits (e.g. the ``2 ** 256 - 1`` srcAmount placeholder for failed
+quotes) are clamped to ``amounts.MAX_AMOUNT``. Transaction hashes are stored as
+``(n, 32)`` uint8 rows, all zeros for decisions that were not submitted.
+"""
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+
+from scripts.amounts import to_limbs
+
+ENABLED = os.getenv("ARBIE_RECORD", "0") == "1"
+BLOCKS_PER_SEGMENT = int(os.getenv("ARBIE_RECORD_BLOCKS_PER_SEGMENT", "256"))
+
+# arbitrage directions
+CURVE = 0  # aave i > curve j > paraswap i
+PARASWAP = 1  # aave j > paraswap i > curve j
+
+# outcome of a decision
+NOT_SUBMITTED = -1
+REVERTED = 0
+SUCCEEDED = 1
+CANCELLED = 2
+# submitted without waiting, the outcome lands in the outcomes table
+PENDING = 3
+
+SCHEMA = {
+    "blocks": {
+        "block_number": np.int64,
+        "timestamp": np.int64,
+        "balances": "amounts",
+    },
+    "grid": {
+        "block_number": np.int64,
+        "i": np.uint8,
+        "j": np.uint8,
+        "dx": "amount",
+        "min_dy": "amount",
+    },
+    "quotes": {
+        "block_number": np.int64,
+        "direction": np.uint8,
+        "i": np.uint8,
+        "j": np.uint8,
+        "dx": "amount",
+        "min_dy": "amount",
+        # destAmount for CURVE quotes, srcAmount for PARASWAP quotes
+        "quote": "amount",
+    },
+    "decisions": {
+        "block_number": np.int64,
+        "direction": np.uint8,
+        "i": np.uint8,
+        "j": np.uint8,
+        "dx": "amount",
+        "min_dy": "amount",
+        "quote": "amount",
+        "margin": np.float64,
+        "gas_limit": np.int64,
+        "gas_cost": "amount",
+        "outcome": np.int8,
+        "tx_hash": "hash",
+    },
+    "prefilter": {
+        "block_number": np.int64,
+        "i": np.uint8,
+        "j": np.uint8,
+        "spread": np.float64,
+        "passed": np.bool_,
+    },
+    "outcomes": {
+        "block_number": np.int64,
+        "tx_hash": "hash",
+        "outcome": np.int8,
+    },
+}
+
+
+def unwrap(obj):
+    return getattr(obj, "__wrapped__", obj)
+
+
+def _column(values, kind):
+    if kind == "hash":
+        # decisions that were not submitted have an empty hash
+        data = b"".join(bytes(value) or bytes(32) for value in values)
+        return np.frombuffer(data, dtype=np.uint8).reshape(-1, 32)
+    if kind == "amount":
+        return to_limbs(values)
+    if kind == "amounts":
+        return np.stack([to_limbs(row) for row in values])
+    return np.asarray(values, dtype=kind)
+
+
+class SegmentWriter:
+    """Buffers table rows and flushes them as column segments under ``root``"""
+
+    def __init__(self, root, blocks_per_segment=BLOCKS_PER_SEGMENT):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.blocks_per_segment = blocks_per_segment
+        self._rows = {table: [] for table in SCHEMA}
+        self._block = None
+        self._n_blocks = 0
+
+    def begin_block(self, block_number, timestamp):
+        self._block = {
+            "block_number": int(block_number),
+            "timestamp": int(timestamp),
+            "balances": None,
+            "grid": [],
+            "quotes": [],
+            "decisions": [],
+            "prefilter": [],
+            "outcomes": [],
+        }
+
+    def record_balances(self, balances):
+        if self._block is not None:
+            self._block["balances"] = [unwrap(b) for b in balances]
+
+    def record_grid(self, rows):
+        if self._block is not None:
+            self._block["grid"].extend(rows)
+
+    def record_quotes(self, direction, rows):
+        if self._block is not None:
+            self._block["quotes"].extend([direction, *row] for row in rows)
+
+    def record_decision(
+        self,
+        direction,
+        row,
+        margin,
+        gas_limit=0,
+        gas_cost=0,
+        outcome=NOT_SUBMITTED,
+        tx_hash=b"",
+    ):
+        if self._block is not None:
+            self._block["decisions"].append(
+                [direction, *row, margin, gas_limit, gas_cost, outcome, bytes(tx_hash)]
+            )
+
+    def record_prefilter(self, rows):
+        if self._block is not None:
+            self._block["prefilter"].extend(rows)
+
+    def record_outcome(self, tx_hash, outcome):
+        if self._block is not None:
+            self._block["outcomes"].append([bytes(tx_hash), outcome])
+
+    def end_block(self):
+        """Commit the current block, rotating the segment if it is full"""
+        block, self._block = self._block, None
+        if block is None or block["balances"] is None:
+            return
+        number = block["block_number"]
+        self._rows["blocks"].append([number, block["timestamp"], block["balances"]])
+        for table in ("grid", "quotes", "decisions", "prefilter", "outcomes"):
+            self._rows[table].extend([number, *row] for row in block[table])
+        self._n_blocks += 1
+        if self._n_blocks >= self.blocks_per_segment:
+            self.flush()
+
+    def flush(self):
+        if not self._rows["blocks"]:
+            return
+        first = self._rows["blocks"][0][0]
+        last = self._rows["blocks"][-1][0]
+        name = f"seg-{first:012d}-{last:012d}"
+        tmp = self.root.joinpath(f".{name}.tmp")
+        if tmp.exists():
+            shutil.rmtree(tmp)
+
+        for table, columns in SCHEMA.items():
+            rows = self._rows[table]
+            table_dir = tmp.joinpath(table)
+            table_dir.mkdir(parents=True)
+            for n, (column, kind) in enumerate(columns.items()):
+                values = [row[n] for row in rows]
+                if not values and kind in ("amount", "amounts"):
+                    array = np.empty((0, 2), dtype=np.uint64)
+                else:
+                    array = _column(values, kind)
+                np.save(table_dir.joinpath(f"{column}.npy"), array)
+
+        tmp.rename(self.root.joinpath(name))
+        logger.debug(f"Recorded history segment {name}")
+        self._rows = {table: [] for table in SCHEMA}
+        self._n_blocks = 0
+
+
+class Segment:
+    """A flushed segment whose columns are memory-mapped on first access"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        _, first, last = self.path.name.split("-")
+        self.first_block = int(first)
+        self.last_block = int(last)
+        self._cache = {}
+
+    def column(self, table, column):
+        key = (table, column)
+        if key not in self._cache:
+            path = self.path.joinpath(table, f"{column}.npy")
+            self._cache[key] = np.load(path, mmap_mode="r")
+        return self._cache[key]
+
+    def table(self, table, columns=None):
+        """Return ``{column: memmap}`` for the requested columns of a table"""
+        columns = columns or list(SCHEMA[table])
+        return {column: self.column(table, column) for column in columns}
+
+    def __repr__(self):
+        return f"<Segment {self.first_block}-{self.last_block}>"
+
+
+class HistoryReader:
+    """Lazily iterates recorded segments, optionally restricted to a block range"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def segments(self, start_block=None, end_block=None):
+        paths = sorted(p for p in self.root.glob("seg-*") if p.is_dir())
+        for path in paths:
+            segment = Segment(path)
+            if start_block is not None and segment.last_block < start_block:
+                continue
+            if end_block is not None and segment.first_block > end_block:
+                continue
+            yield segment
+
+    def iter_table(self, table, columns=None, start_block=None, end_block=None):
+        """Yield one ``{column: array}`` chunk per segment, trimmed to the block range"""
+        columns = columns or list(SCHEMA[table])
+        for segment in self.segments(start_block, end_block):
+            chunk = segment.table(table, ["block_number", *columns])
+            yield trim(chunk, start_block, end_block)
+
+
+def trim(chunk, start_block=None, end_block=None):
+    """Slice a ``{column: array}`` chunk, sorted by block, to the block range"""
+    blocks = chunk["block_number"]
+    lo = 0 if start_block is None else np.searchsorted(blocks, start_block)
+    hi = (
+        len(blocks)
+        if end_block is None
+        else np.searchsorted(blocks, end_block, side="right")
+    )
+    return {column: chunk[column][lo:hi] for column in chunk}
+
+
+_writer = None
+
+
+def start(root):
+    """Start recording history under ``root`` if recording is enabled"""
+    global _writer
+    if ENABLED and _writer is None:
+        _writer = SegmentWriter(root)
+        logger.info(f"Recording block history to {root}")
+
+
+def begin_block(block):
+    if _writer is not None:
+        _writer.begin_block(block["number"], block["timestamp"])
+
+
+def record_balances(balances):
+    if _writer is not None:
+        _writer.record_balances(balances)
+
+
+def record_grid(rows):
+    if _writer is not None:
+        _writer.record_grid(rows)
+
+
+def record_quotes(direction, rows):
+    if _writer is not None:
+        _writer.record_quotes(direction, rows)
+
+
+def record_decision(direction, row, margin, **kwargs):
+    if _writer is not None:
+        _writer.record_decision(direction, row, margin, **kwargs)
+
+
+def record_prefilter(rows):
+    if _writer is not None:
+        _writer.record_prefilter(rows)
+
+
+def record_outcome(tx_hash, outcome):
+    if _writer is not None:
+        _writer.record_outcome(tx_hash, outcome)
+
+
+def end_block():
+    if _writer is not None:
+        _writer.end_block()
+
+
+def flush():
+    if _writer is not None:
+        _writer.flush()
@@ -0,0 +1,284 @@
+"""JSON-RPC transport spreading brownie's calls over several nodes.
+
+Brownie talks to a single endpoint, so one slow node response stalls the whole
+scan. ``HedgedProvider`` is a drop-in web3 provider over every endpoint listed
+in ``ARBIE_RPC_ENDPOINTS`` (comma separated). Each endpoint keeps a pooled
+``requests.Session`` and a window of recent latencies. Requests go to the
+endpoint with the lowest p90, read-only calls on the hot path are hedged: if the
+primary has not answered within its p90 the same request is fired at the next
+best endpoint and whichever answers first wins. Writes are never hedged, they
+only fail over when the connection itself fails.
+
+``Coalescer`` collects reads issued within a short window, from any thread, and
+sends them as a single JSON-RPC batch, so the decision path (gas estimate, gas
+price, head block) costs one round trip instead of one per call.
+
+Any set of HTTP nodes works, e.g. a few local dev chains forked from the same
+block: ``ARBIE_RPC_ENDPOINTS=http://127.0.0.1:8545,http://127.0.0.1:8546``.
+"""
+import collections
+import concurrent.futures
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from loguru import logger
+from requests.adapters import HTTPAdapter
+from web3.providers.base import JSONBaseProvider
+
+from scripts import metrics
+
+ENDPOINTS = [url for url in os.getenv("ARBIE_RPC_ENDPOINTS", "").split(",") if url]
+POOL_SIZE = int(os.getenv("ARBIE_RPC_POOL_SIZE", "32"))
+REQUEST_TIMEOUT = float(os.getenv("ARBIE_RPC_TIMEOUT", "10"))
+# how long the coalescer waits for more reads before sending a batch
+BATCH_WINDOW = float(os.getenv("ARBIE_RPC_BATCH_WINDOW", "0.002"))
+MAX_BATCH_SIZE = 100
+
+# latency critical reads worth paying for a duplicate request
+HEDGED_METHODS = frozenset(
+    {
+        "eth_blockNumber",
+        "eth_call",
+        "eth_estimateGas",
+        "eth_gasPrice",
+        "eth_getBlockByNumber",
+        "eth_getTransactionCount",
+    }
+)
+# hedge delay used until an endpoint has enough samples for a p90
+DEFAULT_HEDGE_DELAY = 0.25
+MIN_SAMPLES = 8
+# how long an endpoint that failed to answer is tried last
+COOLDOWN = 5.0
+
+
+class Endpoint:
+    """An RPC node with a pooled session and a rolling window of latencies"""
+
+    def __init__(self, url, pool_size=POOL_SIZE, window=128):
+        self.url = url
+        self.name = urlparse(url).netloc or url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+        self.failed_until = 0.0
+        self._latencies = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def post(self, data):
+        start = time.perf_counter()
+        try:
+            resp = self.session.post(self.url, data=data, timeout=REQUEST_TIMEOUT)
+            resp.raise_for_status()
+        except requests.RequestException:
+            self.failed_until = time.monotonic() + COOLDOWN
+            metrics.inc(f"rpc_errors_total:{self.name}")
+            raise
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._latencies.append(elapsed)
+        metrics.observe(f"rpc_seconds:{self.name}", elapsed)
+        return resp.content
+
+    def p90(self):
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return None
+        return samples[int(0.9 * (len(samples) - 1))]
+
+    def hedge_delay(self):
+        """How long to wait on this endpoint before racing another one"""
+        with self._lock:
+            enough = len(self._latencies) >= MIN_SAMPLES
+        return self.p90() if enough else DEFAULT_HEDGE_DELAY
+
+    def rank(self):
+        """Sort key, healthy endpoints first then fastest p90 (unmeasured ones first)"""
+        return (self.failed_until > time.monotonic(), self.p90() or 0.0)
+
+    def __repr__(self):
+        return f"<Endpoint {self.name} p90={self.p90()}>"
+
+
+class HedgedProvider(JSONBaseProvider):
+    """web3 provider with latency-aware endpoint selection and hedged reads"""
+
+    def __init__(self, endpoints, hedged_methods=HEDGED_METHODS):
+        super().__init__()
+        if not endpoints:
+            raise ValueError("HedgedProvider needs at least one endpoint")
+        self.endpoints = [Endpoint(url) for url in endpoints]
+        self.hedged_methods = hedged_methods
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=2 * POOL_SIZE, thread_name_prefix="rpc"
+        )
+
+    def __str__(self):
+        return f"HedgedProvider({', '.join(e.name for e in self.endpoints)})"
+
+    def ranked(self):
+        return sorted(self.endpoints, key=Endpoint.rank)
+
+    def make_request(self, method, params):
+        data = self.encode_rpc_request(method, params)
+        return self.decode_rpc_response(self.post(data, method in self.hedged_methods))
+
+    def post(self, data, hedge=False):
+        """Send an encoded request (or batch) and return the raw response body"""
+        endpoints = self.ranked()
+        if hedge and len(endpoints) > 1:
+            return self._hedged_post(data, endpoints)
+        return self._post(data, endpoints)
+
+    def _post(self, data, endpoints):
+        """Try endpoints in order, moving on only when the connection fails"""
+        for endpoint in endpoints[:-1]:
+            try:
+                return endpoint.post(data)
+            except requests.RequestException as exc:
+                logger.warning(f"RPC {endpoint.name} failed, failing over: {exc!r}")
+        return endpoints[-1].post(data)
+
+    def _hedged_post(self, data, endpoints):
+        primary, backups = endpoints[0], endpoints[1:]
+        pending = {self._executor.submit(primary.post, data)}
+        delay = primary.hedge_delay()
+        error = None
+        while True:
+            done, pending = concurrent.futures.wait(
+                pending,
+                timeout=delay if backups else None,
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            for future in done:
+                try:
+                    raw = future.result()
+                except requests.RequestException as exc:
+                    error = exc
+                    continue
+                # the losing request finishes in the background and still
+                # feeds its endpoint's latency window
+                return raw
+            if not pending and not backups:
+                raise error
+            if backups:
+                # slow or failed primary, race the next endpoint
+                backup = backups.pop(0)
+                metrics.inc("rpc_hedged_total")
+                pending.add(self._executor.submit(backup.post, data))
+                delay = backup.hedge_delay()
+
+
+def install(web3, endpoints=None):
+    """Point brownie's web3 at every configured endpoint, returns the provider"""
+    endpoints = ENDPOINTS if endpoints is None else endpoints
+    if not endpoints:
+        return None
+    provider = HedgedProvider(endpoints)
+    web3.provider = provider
+    logger.info(f"Using {provider}")
+    return provider
+
+
+_batch_session = requests.Session()
+_batch_session.headers.update({"Content-Type": "application/json"})
+
+
+def send_batch(provider, calls):
+    """Send ``(method, params)`` pairs as one JSON-RPC batch, responses in call order"""
+    payload = [
+        {"jsonrpc": "2.0", "id": n, "method": method, "params": list(params)}
+        for n, (method, params) in enumerate(calls)
+    ]
+    data = json.dumps(payload).encode()
+    if isinstance(provider, HedgedProvider):
+        hedge = all(method in provider.hedged_methods for method, _ in calls)
+        raw = provider.post(data, hedge)
+    elif getattr(provider, "endpoint_uri", "").startswith("http"):
+        resp = _batch_session.post(
+            provider.endpoint_uri, data=data, timeout=REQUEST_TIMEOUT
+        )
+        resp.raise_for_status()
+        raw = resp.content
+    else:
+        # ipc/websocket providers, no batching but callers still work
+        return [provider.make_request(method, params) for method, params in calls]
+    responses = json.loads(raw)
+    if isinstance(responses, dict):
+        # some nodes answer a rejected batch with a single error object
+        raise ValueError(responses.get("error", responses))
+    by_id = {response.get("id"): response for response in responses}
+    missing = {"error": {"code": -32603, "message": "missing from batch response"}}
+    return [by_id.get(n, missing) for n in range(len(calls))]
+
+
+class Coalescer:
+    """Batches JSON-RPC reads issued within ``window`` seconds of each other"""
+
+    def __init__(self, web3, window=BATCH_WINDOW, max_batch_size=MAX_BATCH_SIZE):
+        self._web3 = web3
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._queue = []
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def submit(self, method, params=()):
+        """Queue a read, the returned future resolves to the raw ``result`` field"""
+        future = concurrent.futures.Future()
+        with self._lock:
+            self._queue.append((method, params, future))
+            full = len(self._queue) >= self.max_batch_size
+            if len(self._queue) == 1 and not full:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+        return future
+
+    def call(self, method, params=()):
+        return self.submit(method, params).result()
+
+    def gather(self, *calls):
+        """Send ``(method, params)`` pairs, plus anything queued, without waiting"""
+        futures = [self.submit(method, params) for method, params in calls]
+        self.flush()
+        return [future.result() for future in futures]
+
+    def flush(self):
+        with self._lock:
+            batch, self._queue = self._queue, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not batch:
+            return
+        try:
+            responses = send_batch(
+                self._web3.provider, [(method, params) for method, params, _ in batch]
+            )
+        except Exception as exc:
+            for _, _, future in batch:
+                future.set_exception(exc)
+            return
+        metrics.inc("rpc_batches_total")
+        metrics.inc("rpc_batched_calls_total", len(batch))
+        for (_, _, future), response in zip(batch, responses):
+            if "error" in response:
+                # same exception web3 raises for an RPC error
+                future.set_exception(ValueError(response["error"]))
+            else:
+                future.set_result(response["result"])
+
+
+def to_int(value):
+    """Decode a hex quantity from a raw JSON-RPC result"""
+    return int(value, 16)
@@ -0,0 +1,163 @@
+"""Local grid simulation fanned out over worker processes.
+
+The simulators in ``scripts.pool_math`` are numpy but still run one pair at a
+time on the scan loop's core, next to the quote and RPC threads fighting for the
+GIL. With ``ARBIE_SCAN_PROCESSES=<n>`` a ``ScanPool`` hands the pairs of a block
+to ``n`` worker processes instead:
+
+- the sizes to price, an ``(n_pairs, n_sizes)`` float64 array, are written to a
+  shared memory buffer and the output lands in a second one, so only the pool
+  state (a few ints) and the buffer names are pickled per task
+- each worker attaches to the buffers once and keeps them mapped across blocks
+- the pairs are split into one contiguous chunk per worker, every worker writes
+  its own rows of the output, the coordinator just waits for all of them
+
+Workers are spawned rather than forked, the scan process runs threads holding
+sockets and locks that a forked child would inherit half-way. Without
+``ARBIE_SCAN_PROCESSES`` everything runs in process, as before.
+"""
+import concurrent.futures
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+from loguru import logger
+
+PROCESSES = int(os.getenv("ARBIE_SCAN_PROCESSES", "0"))
+
+
+class SharedArray:
+    """A numpy array over a named shared memory block"""
+
+    def __init__(self, shape, dtype=np.float64, name=None):
+        dtype = np.dtype(dtype)
+        size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        create = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        self.owner = create
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf)
+
+    @property
+    def spec(self):
+        """What a worker needs to attach: ``(name, shape, dtype)``"""
+        return self.shm.name, self.array.shape, self.array.dtype.str
+
+    @classmethod
+    def attach(cls, spec):
+        name, shape, dtype = spec
+        return cls(shape, dtype, name)
+
+    def close(self):
+        del self.array
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def simulate(fn, state, pairs, dx):
+    """``fn(*state, i, j, dx[n])`` for the n-th pair, stacked into one array"""
+    out = np.empty(dx.shape, dtype=np.float64)
+    _simulate_rows(fn, state, pairs, dx, out, 0, len(pairs))
+    return out
+
+
+def _simulate_rows(fn, state, pairs, dx, out, start, stop):
+    for n in range(start, stop):
+        i, j = pairs[n]
+        out[n] = fn(*state, i, j, dx[n])
+
+
+# worker side, buffers attached by name and kept for the life of the worker
+_attached = {}
+
+
+def _attached_array(spec):
+    array = _attached.get(spec)
+    if array is None:
+        array = _attached[spec] = SharedArray.attach(spec)
+    return array.array
+
+
+def _worker(fn, state, pairs, dx_spec, out_spec, start, stop):
+    _simulate_rows(
+        fn,
+        state,
+        pairs,
+        _attached_array(dx_spec),
+        _attached_array(out_spec),
+        start,
+        stop,
+    )
+    return stop - start
+
+
+def _ping(_):
+    return os.getpid()
+
+
+class ScanPool:
+    """Runs ``simulate`` across ``processes`` workers over shared memory buffers"""
+
+    def __init__(self, processes=PROCESSES):
+        self.processes = processes
+        self._executor = None
+        # the chunks of the grid being simulated, to cancel on close
+        self._futures = []
+        # (n_pairs, n_sizes) -> (dx, out), the grid shape rarely changes
+        self._buffers = {}
+
+    def start(self):
+        """Spawn the workers now rather than on the first block"""
+        if self.processes <= 0 or self._executor is not None:
+            return
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+        )
+        # pay for the spawn and the imports before the first block
+        list(self._executor.map(_ping, range(self.processes)))
+        logger.info(f"Scanning with {self.processes} worker process(es)")
+
+    def simulate(self, fn, state, pairs, dx):
+        """Same as the module level ``simulate``, ``fn`` must be importable"""
+        if self._executor is None:
+            return simulate(fn, state, pairs, dx)
+        dx_buf, out_buf = self._get_buffers(dx.shape)
+        dx_buf.array[:] = dx
+        bounds = np.linspace(0, len(pairs), min(self.processes, len(pairs)) + 1)
+        bounds = bounds.astype(int)
+        self._futures = [
+            self._executor.submit(
+                _worker,
+                fn,
+                state,
+                pairs,
+                dx_buf.spec,
+                out_buf.spec,
+                start,
+                stop,
+            )
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+        for future in self._futures:
+            future.result()
+        self._futures = []
+        return out_buf.array.copy()
+
+    def _get_buffers(self, shape):
+        if shape not in self._buffers:
+            self._buffers[shape] = (SharedArray(shape), SharedArray(shape))
+        return self._buffers[shape]
+
+    def close(self):
+        if self._executor is not None:
+            # Executor.shutdown(cancel_futures=True) needs python 3.9
+            for future in self._futures:
+                future.cancel()
+            self._futures = []
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        for buffers in self._buffers.values():
+            for buffer in buffers:
+                buffer.close()
+        self._buffers = {}
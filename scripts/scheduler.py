@@ -0,0 +1,207 @@
+"""Quote scheduling under an API and a block time budget.
+
+Paraswap quotes are the scarce resource of a scan: the API is rate limited and
+every quote has to land well before the next block. Instead of a uniform random
+sample of the grid, ``QuoteScheduler`` ranks every ``(direction, i, j, dx)``
+candidate by expected profit and issues quotes in waves of ``wave_size``:
+
+- the expected margin of a row is interpolated from the margins observed for
+  the same direction and pair, at nearby sizes, in the latest block it was
+  quoted in (the "surface"); quotes landing during the current block refine it
+  between waves
+- pairs without a surface fall back to a prior, e.g. the prefilter spread
+- expected profit is margin times size, sizes being a fraction of the pool
+  balance of the input coin so rows of different coins compare
+- a share of every wave (``EXPLORE``) goes to random rows so pairs that looked
+  bad keep being re-checked
+
+Issuing stops when the quote budget is spent, when the next wave would not
+finish before the deadline, or when the best remaining row is not expected to
+reach ``floor``.
+"""
+import os
+import time
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from scripts import metrics
+
+
+class Budget(NamedTuple):
+    quotes: int  # quotes per block, both directions
+    seconds: float  # from the start of quoting to the last answer
+
+
+# roughly what the old 10% sample cost, leaving time for tx build and submission
+CHAIN_BUDGETS = {1: Budget(120, 8.0), 137: Budget(40, 1.2)}
+EXPLORE = float(os.getenv("ARBIE_SCHED_EXPLORE", "0.2"))
+# rows predicted below this margin are not worth a quote
+FLOOR = float(os.getenv("ARBIE_SCHED_FLOOR", "-0.02"))
+WAVE_TIMEOUT = 10
+
+
+def chain_budget(chain_id):
+    """Per chain budget, overridable with ``ARBIE_QUOTE_BUDGET``/``ARBIE_QUOTE_SECONDS``"""
+    quotes, seconds = CHAIN_BUDGETS.get(chain_id, Budget(60, 4.0))
+    return Budget(
+        int(os.getenv("ARBIE_QUOTE_BUDGET", quotes)),
+        float(os.getenv("ARBIE_QUOTE_SECONDS", seconds)),
+    )
+
+
+class Surface:
+    """Observed margin against size per ``(direction, i, j)``"""
+
+    def __init__(self):
+        # key -> (block number, sizes, margins) of the latest block it was quoted in
+        self._points = {}
+
+    def update(self, block_number, keys, sizes, margins):
+        for key, size, margin in zip(keys, sizes, margins):
+            if not np.isfinite(margin):
+                continue
+            block, key_sizes, key_margins = self._points.get(key, (None, [], []))
+            if block != block_number:
+                # a newer block replaces the old observations
+                block, key_sizes, key_margins = block_number, [], []
+            key_sizes.append(size)
+            key_margins.append(margin)
+            self._points[key] = (block, key_sizes, key_margins)
+
+    def predict(self, keys, codes, sizes, prior):
+        """Interpolated margin per row, ``prior`` where the key was never quoted
+
+        ``keys`` are the distinct keys and ``codes`` the index of each row's key.
+        """
+        predicted = np.array(prior, dtype=np.float64)
+        for code, key in enumerate(keys):
+            if key not in self._points:
+                continue
+            _, key_sizes, key_margins = self._points[key]
+            order = np.argsort(key_sizes)
+            mask = codes == code
+            predicted[mask] = np.interp(
+                sizes[mask],
+                np.asarray(key_sizes)[order],
+                np.asarray(key_margins)[order],
+            )
+        return predicted
+
+
+class QuoteScheduler:
+    """Issues the quotes of a block in expected value order within a budget"""
+
+    def __init__(self, budget, wave_size, floor=FLOOR, explore=EXPLORE, seed=42):
+        self.budget = budget
+        self.wave_size = wave_size
+        self.floor = floor
+        self.explore = explore
+        self.surface = Surface()
+        self._rng = np.random.default_rng(seed)
+        # running estimate of a wave's wall time, to stop before the deadline
+        self._wave_seconds = None
+
+    def run(
+        self, scope, executor, candidates, fetch, margins, prior=None, quote_all=False
+    ):
+        """Quote the most promising candidates, returns the quoted rows with ``results``
+
+        ``candidates`` has ``direction``, ``i``, ``j``, ``dx``, ``min_dy`` and
+        ``size`` columns. ``fetch(direction, i, j, dx, min_dy)`` requests one quote
+        and ``margins(rows, results)`` turns answered quotes into margins. Every
+        direction gets its best row quoted. With ``quote_all`` every candidate is
+        quoted regardless of budget, deadline and floor.
+        """
+        start = time.monotonic()
+        deadline = start + self.budget.seconds
+        limit = len(candidates) if quote_all else self.budget.quotes
+        codes, keys = pd.factorize(
+            pd.Series(zip(candidates["direction"], candidates["i"], candidates["j"]))
+        )
+        sizes = candidates["size"].to_numpy(dtype=np.float64)
+        directions = candidates["direction"].to_numpy()
+        prior = np.full(len(candidates), self.floor) if prior is None else prior
+        remaining = np.ones(len(candidates), dtype=bool)
+        quoted, n_quoted = [], 0
+
+        while remaining.any() and n_quoted < limit:
+            if (
+                not quote_all
+                and quoted
+                and time.monotonic() + self._wave_seconds > deadline
+            ):
+                metrics.inc("quote_deadline_stops_total")
+                break
+            predicted = self.surface.predict(keys, codes, sizes, prior)
+            wave = self._next_wave(
+                predicted, sizes, directions, remaining, limit - n_quoted, quote_all
+            )
+            if not len(wave):
+                break
+            remaining[wave] = False
+            rows = candidates.iloc[wave]
+
+            wave_start = time.monotonic()
+            results = scope.map(
+                executor,
+                fetch,
+                rows["direction"].tolist(),
+                rows["i"].tolist(),
+                rows["j"].tolist(),
+                rows["dx"].tolist(),
+                rows["min_dy"].tolist(),
+                timeout=WAVE_TIMEOUT,
+            )
+            self._observe_wave(time.monotonic() - wave_start)
+            rows = rows.assign(results=results)
+            self.surface.update(
+                scope.block_number,
+                [keys[code] for code in codes[wave]],
+                sizes[wave],
+                margins(rows, results),
+            )
+            quoted.append(rows)
+            n_quoted += len(wave)
+
+        metrics.inc("quotes_skipped_total", int(remaining.sum()))
+        logger.debug(
+            f"Scheduled {n_quoted}/{len(candidates)} quote(s) "
+            f"in {time.monotonic() - start:.2f}s"
+        )
+        if not quoted:
+            return candidates.iloc[:0].assign(results=[])
+        return pd.concat(quoted)
+
+    def _next_wave(self, predicted, sizes, directions, remaining, limit, quote_all):
+        idx = np.flatnonzero(remaining)
+        order = idx[np.argsort(-(predicted[idx] * sizes[idx]), kind="stable")]
+        size = min(self.wave_size, limit)
+        wave = []
+        if remaining.all():
+            # first wave, every direction gets its best row quoted
+            wave = [order[directions[order] == d][0] for d in np.unique(directions)]
+        if quote_all:
+            fill = [n for n in order if n not in wave]
+            return np.array(wave + fill[: size - len(wave)], dtype=np.int64)
+
+        eligible = [n for n in order if predicted[n] >= self.floor and n not in wave]
+        if not eligible:
+            # the rest is not expected to pay off, exploring alone is not worth it
+            return np.array(wave, dtype=np.int64)
+        n_explore = int(round((size - len(wave)) * self.explore))
+        wave += eligible[: max(size - len(wave) - n_explore, 0)]
+        rest = np.setdiff1d(order, wave, assume_unique=True)
+        n_explore = min(size - len(wave), len(rest))
+        if n_explore > 0:
+            wave += self._rng.choice(rest, n_explore, replace=False).tolist()
+        return np.array(wave, dtype=np.int64)
+
+    def _observe_wave(self, seconds):
+        if self._wave_seconds is None:
+            self._wave_seconds = seconds
+        else:
+            self._wave_seconds = 0.8 * self._wave_seconds + 0.2 * seconds
+        metrics.observe("quote_wave_seconds", seconds)
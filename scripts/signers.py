@@ -0,0 +1,268 @@
+"""A pool of signer keys submitting transactions in parallel.
+
+A single key can only have one arbitrage in flight at a time: a second tx either
+waits behind the first nonce or has to replace it. ``SignerPool`` holds every key
+listed in ``PRIVATE_KEYS`` (comma separated, ``PRIVATE_KEY`` alone otherwise)
+with a locally tracked nonce, so each opportunity goes out from an idle signer
+without a ``eth_getTransactionCount`` round trip and independent opportunities
+never contend for a nonce. Throughput scales with the number of keys.
+
+Transactions are signed locally and sent with ``eth_sendRawTransaction``, the
+caller does not wait for them to be mined. A watcher thread polls the receipts
+of every in-flight tx in one batch and releases its signer once it is mined:
+
+- a tx still pending after ``REPLACE_AFTER`` seconds is re-sent with the same
+  nonce and a gas price bumped by ``GAS_BUMP``, the node only accepts the
+  replacement with a bump of at least 10%
+- once the tx's own deadline has passed it can only revert, the nonce is then
+  taken back with a zero value self transfer
+- a ``nonce too low`` answer, e.g. after the key was used elsewhere, resyncs the
+  signer from the node
+
+Outcomes are queued and handed to the scan loop through ``outcomes()`` so they
+are recorded from the main thread.
+"""
+import os
+import queue
+import threading
+import time
+
+from eth_account import Account
+from loguru import logger
+
+from scripts import metrics, rpc
+
+KEYS = [
+    key
+    for key in os.getenv("PRIVATE_KEYS", os.getenv("PRIVATE_KEY", "")).split(",")
+    if key
+]
+REPLACE_AFTER = float(os.getenv("ARBIE_REPLACE_AFTER", "30"))
+GAS_BUMP = 1.125
+POLL_INTERVAL = 1.0
+CANCEL_GAS = 21000
+
+# outcome of a submitted tx, matches recorder's decision outcomes
+REVERTED = 0
+SUCCEEDED = 1
+CANCELLED = 2
+
+
+def require_keys(keys):
+    """``keys``, raises ``ValueError`` if there are none"""
+    if not keys:
+        raise ValueError("No signer keys, set PRIVATE_KEYS or PRIVATE_KEY")
+    return keys
+
+
+class Pending:
+    """A tx in flight and every hash sent for its nonce"""
+
+    __slots__ = ("tx", "tx_hash", "hashes", "sent_at", "deadline", "cancelled")
+
+    def __init__(self, tx, tx_hash, deadline):
+        self.tx = tx
+        # the hash the opportunity was recorded under
+        self.tx_hash = tx_hash
+        self.hashes = [tx_hash]
+        self.sent_at = time.monotonic()
+        self.deadline = deadline
+        # index in ``hashes`` of the first cancellation
+        self.cancelled = None
+
+
+class Signer:
+    """A key with a local nonce and at most one tx in flight"""
+
+    __slots__ = ("account", "nonce", "pending", "reserved")
+
+    def __init__(self, key):
+        self.account = Account.from_key(key)
+        self.nonce = None
+        self.pending = None
+        self.reserved = False
+
+    @property
+    def address(self):
+        return self.account.address
+
+    @property
+    def idle(self):
+        return self.pending is None and not self.reserved
+
+    def __repr__(self):
+        return f"<Signer {self.address} nonce={self.nonce}>"
+
+
+class SignerPool:
+    """Assigns submissions to idle signers and follows them until they are mined"""
+
+    def __init__(self, keys, batch, chain_id, poll_interval=POLL_INTERVAL):
+        self.signers = [Signer(key) for key in keys]
+        self._batch = batch
+        self.chain_id = chain_id
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._outcomes = queue.SimpleQueue()
+        self._thread = None
+
+    def __len__(self):
+        return len(self.signers)
+
+    def start(self):
+        """Sync every nonce and start following in-flight transactions"""
+        require_keys(self.signers)
+        self.sync()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, daemon=True)
+            self._thread.start()
+        logger.info(f"Submitting from {len(self.signers)} signer(s)")
+
+    def sync(self, signers=None):
+        """Reload nonces from the node, including txs sitting in its mempool"""
+        signers = self.signers if signers is None else signers
+        nonces = self._batch.gather(
+            *[("eth_getTransactionCount", [s.address, "pending"]) for s in signers]
+        )
+        for signer, nonce in zip(signers, nonces):
+            signer.nonce = rpc.to_int(nonce)
+
+    def acquire(self):
+        """Reserve an idle signer, ``None`` while every signer has a tx in flight"""
+        with self._lock:
+            for signer in self.signers:
+                if signer.idle:
+                    signer.reserved = True
+                    return signer
+        metrics.inc("signers_exhausted_total")
+        return None
+
+    def release(self, signer):
+        """Give back a reserved signer that did not submit"""
+        with self._lock:
+            signer.reserved = False
+
+    def submit(self, signer, to, data, gas_limit, gas_price, deadline):
+        """Sign and send a tx from a reserved signer, returns its hash
+
+        ``deadline`` is the unix time after which the tx reverts anyway and its
+        nonce is better spent on a cancellation.
+        """
+        tx = {
+            "to": to,
+            "data": data,
+            "value": 0,
+            "gas": gas_limit,
+            "gasPrice": gas_price,
+            "nonce": signer.nonce,
+            "chainId": self.chain_id,
+        }
+        try:
+            try:
+                tx_hash = self._send(signer, tx)
+            except ValueError as exc:
+                if "nonce too low" not in str(exc):
+                    raise
+                # the key was used outside the pool
+                self.sync([signer])
+                tx["nonce"] = signer.nonce
+                tx_hash = self._send(signer, tx)
+        except BaseException:
+            # whatever failed, e.g. a timeout, the signer has nothing in flight
+            self.release(signer)
+            raise
+        with self._lock:
+            signer.pending = Pending(tx, tx_hash, deadline)
+            signer.nonce += 1
+            signer.reserved = False
+        metrics.inc("txs_submitted_total")
+        logger.info(f"Submitted {tx_hash} from {signer.address} nonce {tx['nonce']}")
+        return tx_hash
+
+    def outcomes(self):
+        """``(tx_hash, outcome)`` of every tx resolved since the last call"""
+        resolved = []
+        while True:
+            try:
+                resolved.append(self._outcomes.get_nowait())
+            except queue.Empty:
+                return resolved
+
+    def in_flight(self):
+        return sum(signer.pending is not None for signer in self.signers)
+
+    def _send(self, signer, tx):
+        signed = signer.account.sign_transaction(tx)
+        self._batch.call("eth_sendRawTransaction", [signed.rawTransaction.hex()])
+        return signed.hash.hex()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self._poll()
+            except Exception as exc:
+                logger.warning(f"Signer pool poll failed: {exc!r}")
+
+    def _poll(self):
+        busy = [s for s in self.signers if s.pending is not None]
+        if not busy:
+            return
+        calls = [
+            ("eth_getTransactionReceipt", [tx_hash])
+            for signer in busy
+            for tx_hash in signer.pending.hashes
+        ]
+        receipts = iter(self._batch.gather(*calls))
+        for signer in busy:
+            pending = signer.pending
+            mined = [r for r in (next(receipts) for _ in pending.hashes) if r]
+            if mined:
+                self._resolve(signer, mined[0])
+            elif time.monotonic() - pending.sent_at >= REPLACE_AFTER:
+                self._replace(signer)
+
+    def _resolve(self, signer, receipt):
+        pending = signer.pending
+        if (
+            pending.cancelled is not None
+            and receipt["transactionHash"] in pending.hashes[pending.cancelled :]
+        ):
+            outcome = CANCELLED
+        else:
+            outcome = rpc.to_int(receipt["status"])
+        with self._lock:
+            signer.pending = None
+        self._outcomes.put((pending.tx_hash, outcome))
+        metrics.inc(
+            {REVERTED: "txs_reverted_total", SUCCEEDED: "txs_succeeded_total"}.get(
+                outcome, "txs_cancelled_total"
+            )
+        )
+        logger.info(f"{pending.tx_hash} from {signer.address} resolved: {outcome}")
+
+    def _replace(self, signer):
+        """Re-send the in-flight nonce with a higher gas price, or cancel it"""
+        pending = signer.pending
+        tx = dict(pending.tx)
+        tx["gasPrice"] = int(tx["gasPrice"] * GAS_BUMP) + 1
+        cancel = pending.cancelled is None and time.time() >= pending.deadline
+        if cancel:
+            tx.update(to=signer.address, data=b"", gas=CANCEL_GAS)
+        try:
+            tx_hash = self._send(signer, tx)
+        except ValueError as exc:
+            if "nonce too low" in str(exc):
+                # one of the sent txs was mined in the meantime, the next poll
+                # picks its receipt up
+                return
+            logger.warning(f"Replacing {pending.tx_hash} failed: {exc}")
+            pending.sent_at = time.monotonic()
+            return
+        if cancel:
+            pending.cancelled = len(pending.hashes)
+        pending.tx = tx
+        pending.hashes.append(tx_hash)
+        pending.sent_at = time.monotonic()
+        metrics.inc("txs_cancelled_sent_total" if cancel else "txs_replaced_total")
+        logger.info(f"Replaced {pending.tx_hash} with {tx_hash}")
@@ -0,0 +1,446 @@
+"""Offline end-to-end run of the mainnet bot against mock contracts.
+
+``deploy()`` sets up a local dev chain the way ``scripts/arbie.py`` expects
+mainnet to look: the mocks under ``contracts/mocks`` are deployed and their
+runtime code is copied (``anvil_setCode``/``hardhat_setCode``/
+``evm_setAccountCode``) to the addresses the bot and ``ArbieV3`` hardcode:
+
+- USDT, WBTC and WETH as ``MockERC20``s
+- the TriCrypto pool as ``MockCryptoSwap``
+- the AAVE lending pool addresses provider, pointing at a ``MockLendingPool``
+  holding every coin for flash loans
+- Uniswap and Sushiswap factories with a funded pair per coin pair
+- Augustus and its token transfer proxy, swapping through those pairs
+- Multicall2
+
+``FakeParaswap`` serves the token list, ``/v2/prices`` quoted from the pairs'
+reserves and ``/v2/transactions`` building ``swapOnUniswap``/``buyOnUniswap``
+calldata, plus CoinGecko's ETH price from the pool's oracle. ``main`` starts
+it, then shocks the pool or a pair with a random trade every
+``ARBIE_SIM_BLOCK_TIME`` seconds and runs ``scripts.arbie`` against all of it:
+
+    anvil &
+    brownie run simulate --network development
+
+The dev chain must support one of the setCode methods (anvil, hardhat or
+ganache >= 7) and must not be a mainnet fork.
+"""
+import itertools as it
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple
+from urllib.parse import parse_qs, urlparse
+
+from brownie import (
+    ArbieV3,
+    MockAugustusSwapper,
+    MockCryptoSwap,
+    MockERC20,
+    MockLendingPool,
+    MockLendingPoolAddressesProvider,
+    MockMulticall2,
+    MockTokenTransferProxy,
+    MockUniswapV2Factory,
+    MockUniswapV2Pair,
+    accounts,
+    web3,
+)
+from eth_abi import abi
+from loguru import logger
+
+from scripts import codec
+
+BLOCK_TIME = float(os.getenv("ARBIE_SIM_BLOCK_TIME", "12"))
+# std dev of a shock, as a fraction of the input reserve
+SHOCK_SCALE = float(os.getenv("ARBIE_SIM_SHOCK", "0.02"))
+HTTP_HOST = "127.0.0.1"
+HTTP_PORT = int(os.getenv("ARBIE_SIM_PORT", "9185"))
+SEED = int(os.getenv("ARBIE_SIM_SEED", "42"))
+
+SET_CODE_METHODS = ("anvil_setCode", "hardhat_setCode", "evm_setAccountCode")
+
+# mainnet addresses the bot and ArbieV3 use, see scripts/arbie.py
+TOKENS = (
+    ("Tether USD", "USDT", 6, "0xdAC17F958D2ee523a2206206994597C13D831ec7"),
+    ("Wrapped BTC", "WBTC", 8, "0x2260FAC5E5542a773Aa44fBCfeDf7C193bc2C599"),
+    ("Wrapped Ether", "WETH", 18, "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"),
+)
+TRICRYPTO_SWAP_ADDR = "0x80466c64868E1ab14a1Ddf27A676C3fcBE638Fe5"
+MULTICALL2_ADDR = "0x5BA1e12693Dc8F9c48aAD8770482f4739bEeD696"
+AUGUSTUSSWAPPER_ADDR = "0x1bD435F3C054b6e901B7b108a0ab7617C808677b"
+TOKEN_TRANSFER_PROXY_ADDR = "0xb70Bc06D2c9Bf03b3373799606dc7d39346c06B3"
+LENDING_POOL_ADDR_PROVIDER_ADDR = "0xB53C1a33016B2DC2fF3653530bfF1848a515c8c5"
+# paraswap exchange name -> factory
+FACTORIES = {
+    "Uniswap": "0x5C69bEe701ef814a2B6a3EDD4B1652CB9cc5aA6f",
+    "SushiSwap": "0xC0AEe478e3658e2610c5F7A4A2E1777cE9e4f2Ac",
+}
+
+# starting prices in USD and liquidity per coin, in USD
+PRICES = {"USDT": 1, "WBTC": 40_000, "WETH": 3_000}
+POOL_LIQUIDITY = 30_000_000
+PAIR_LIQUIDITY = 5_000_000
+LENDING_LIQUIDITY = 100_000_000
+TRADER_LIQUIDITY = 1_000_000_000
+POOL_FEE = 3_000_000  # 0.03%, 1e10 precision
+
+
+class Deployment(NamedTuple):
+    tokens: tuple  # USDT, WBTC, WETH, the pool's coin order
+    crypto_swap: object
+    lending_pool: object
+    augustus: object
+    factories: dict  # paraswap exchange name -> factory
+    pairs: dict  # (factory, a, b) -> pair, both token orders
+    multicall: object
+    arbie: object
+
+
+def to_amount(symbol, decimals, usd):
+    return int(usd / PRICES[symbol] * 10 ** decimals)
+
+
+def set_code(address, code):
+    """Replace the code at ``address`` with whichever method the dev chain has"""
+    for method in SET_CODE_METHODS:
+        resp = web3.provider.make_request(method, [address, code])
+        if "error" not in resp:
+            return
+    raise RuntimeError(
+        f"The dev chain supports none of {', '.join(SET_CODE_METHODS)}, "
+        "use anvil, hardhat or ganache >= 7"
+    )
+
+
+def place(container, address, deployer):
+    """Deploy ``container`` and copy its runtime code to ``address``
+
+    Constructors do not run at ``address``, the mocks are set up with
+    ``initialize`` instead.
+    """
+    template = container.deploy({"from": deployer})
+    set_code(address, web3.eth.get_code(template.address).hex())
+    return container.at(address)
+
+
+def deploy(deployer):
+    """Mock mainnet at its addresses, then an ``ArbieV3`` owned by ``deployer``"""
+    tx_params = {"from": deployer}
+    tokens = []
+    for name, symbol, decimals, address in TOKENS:
+        token = place(MockERC20, address, deployer)
+        token.initialize(name, symbol, decimals, tx_params)
+        tokens.append(token)
+    symbols = [symbol for _, symbol, _, _ in TOKENS]
+    decimals = [token_decimals for _, _, token_decimals, _ in TOKENS]
+
+    multicall = place(MockMulticall2, MULTICALL2_ADDR, deployer)
+
+    crypto_swap = place(MockCryptoSwap, TRICRYPTO_SWAP_ADDR, deployer)
+    crypto_swap.initialize(
+        tokens,
+        [10 ** (18 - d) for d in decimals],
+        [PRICES[symbol] * 10 ** 18 for symbol in symbols[1:]],
+        POOL_FEE,
+        tx_params,
+    )
+    amounts = [to_amount(s, d, POOL_LIQUIDITY) for s, d in zip(symbols, decimals)]
+    for token, amount in zip(tokens, amounts):
+        token.mint(deployer, amount, tx_params)
+        token.approve(crypto_swap, amount, tx_params)
+    crypto_swap.add_liquidity(amounts, 0, tx_params)
+
+    lending_pool = MockLendingPool.deploy(tx_params)
+    provider = place(
+        MockLendingPoolAddressesProvider, LENDING_POOL_ADDR_PROVIDER_ADDR, deployer
+    )
+    provider.initialize(lending_pool, tx_params)
+    for token, symbol, d in zip(tokens, symbols, decimals):
+        token.mint(lending_pool, to_amount(symbol, d, LENDING_LIQUIDITY), tx_params)
+
+    factories, pairs = {}, {}
+    for exchange, address in FACTORIES.items():
+        factory = factories[exchange] = place(MockUniswapV2Factory, address, deployer)
+        for a, b in it.combinations(range(len(tokens)), 2):
+            factory.createPair(tokens[a], tokens[b], tx_params)
+            pair = MockUniswapV2Pair.at(factory.getPair(tokens[a], tokens[b]))
+            for k in (a, b):
+                amount = to_amount(symbols[k], decimals[k], PAIR_LIQUIDITY)
+                tokens[k].mint(pair, amount, tx_params)
+            pair.sync(tx_params)
+            pairs[(address, tokens[a].address, tokens[b].address)] = pair
+            pairs[(address, tokens[b].address, tokens[a].address)] = pair
+
+    proxy = place(MockTokenTransferProxy, TOKEN_TRANSFER_PROXY_ADDR, deployer)
+    augustus = place(MockAugustusSwapper, AUGUSTUSSWAPPER_ADDR, deployer)
+    proxy.initialize(augustus, tx_params)
+    augustus.initialize(proxy, FACTORIES["Uniswap"], tx_params)
+
+    arbie = ArbieV3.deploy(tokens, tx_params)
+    logger.info(f"Deployed the mocks and ArbieV3 at {arbie.address}")
+    return Deployment(
+        tuple(tokens),
+        crypto_swap,
+        lending_pool,
+        augustus,
+        factories,
+        pairs,
+        multicall,
+        arbie,
+    )
+
+
+class FakeParaswap:
+    """Paraswap and CoinGecko's HTTP APIs over the mock pairs and pool"""
+
+    def __init__(self, deployment, host=HTTP_HOST, port=HTTP_PORT):
+        self.deployment = deployment
+        self.host = host
+        self.port = port
+        self.tokens = {token.address: token for token in deployment.tokens}
+        self._server = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), _FakeHandler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logger.info(f"Fake Paraswap API listening on {self.url}")
+        return self
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def token_list(self):
+        return {
+            "tokens": [
+                {
+                    "symbol": token.symbol(),
+                    "address": address,
+                    "decimals": token.decimals(),
+                }
+                for address, token in self.tokens.items()
+            ]
+        }
+
+    def price_route(self, src, dest, amount, side, include_dexs=None):
+        """Best single pair route, ``None`` if no pair can fill ``amount``"""
+        allowed = (
+            {dex.lower() for dex in include_dexs.split(",")} if include_dexs else None
+        )
+        best = None
+        for exchange, factory in self.deployment.factories.items():
+            if allowed is not None and exchange.lower() not in allowed:
+                continue
+            pair = self.deployment.pairs.get((factory.address, src, dest))
+            if pair is None:
+                continue
+            reserve0, reserve1, _ = pair.getReserves()
+            if int(src, 16) < int(dest, 16):
+                reserve_in, reserve_out = reserve0, reserve1
+            else:
+                reserve_in, reserve_out = reserve1, reserve0
+            if side == "SELL":
+                src_amount = amount
+                dest_amount = (
+                    amount * 997 * reserve_out // (reserve_in * 1000 + amount * 997)
+                )
+                better = best is None or dest_amount > best[2]
+            else:
+                if amount >= reserve_out:
+                    continue
+                dest_amount = amount
+                src_amount = (
+                    reserve_in * amount * 1000 // ((reserve_out - amount) * 997) + 1
+                )
+                better = best is None or src_amount < best[1]
+            if better:
+                best = (exchange, src_amount, dest_amount, factory.address)
+        if best is None:
+            return None
+        exchange, src_amount, dest_amount, factory = best
+        return {
+            "blockNumber": web3.eth.block_number,
+            "network": 1,
+            "side": side,
+            "details": {
+                "tokenFrom": src,
+                "tokenTo": dest,
+                "srcAmount": str(src_amount),
+                "destAmount": str(dest_amount),
+            },
+            "bestRoute": [
+                {
+                    "exchange": exchange,
+                    "percent": 100,
+                    "srcAmount": str(src_amount),
+                    "destAmount": str(dest_amount),
+                    "data": {"factory": factory, "path": [src, dest]},
+                }
+            ],
+        }
+
+    def transaction(self, body):
+        """``swapOnUniswap``/``buyOnUniswap`` calldata for a price route"""
+        route = body["priceRoute"]
+        data = route["bestRoute"][0]["data"]
+        amounts = [int(body["srcAmount"]), int(body["destAmount"])]
+        name = "swap" if route["side"] == "SELL" else "buy"
+        if data["factory"] == FACTORIES["Uniswap"]:
+            signature = f"{name}OnUniswap(uint256,uint256,address[],uint8)"
+            types, args = ["uint256", "uint256", "address[]", "uint8"], []
+        else:
+            signature = (
+                f"{name}OnUniswapFork(address,bytes32,uint256,uint256,address[],uint8)"
+            )
+            types = ["address", "bytes32", "uint256", "uint256", "address[]", "uint8"]
+            args = [data["factory"], b"\x00" * 32]
+        calldata = codec.selector(signature) + abi.encode_abi(
+            types, args + amounts + [data["path"], 0]
+        )
+        return {
+            "from": body["userAddress"],
+            "to": self.deployment.augustus.address,
+            "value": "0",
+            "data": "0x" + calldata.hex(),
+            "chainId": 1,
+        }
+
+    def eth_price(self, currency):
+        """ETH priced from the pool's oracle, in USD (USDT) or BTC (WBTC)"""
+        pool = self.deployment.crypto_swap
+        eth_usd = pool.price_oracle(1) / 10 ** 18
+        if currency == "btc":
+            return eth_usd / (pool.price_oracle(0) / 10 ** 18)
+        return eth_usd
+
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        fake = self.server.fake
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path.startswith("/v2/tokens"):
+            self._reply(200, fake.token_list())
+        elif url.path == "/v2/prices":
+            route = fake.price_route(
+                web3.toChecksumAddress(query["from"]),
+                web3.toChecksumAddress(query["to"]),
+                int(query["amount"]),
+                query.get("side", "SELL"),
+                query.get("includeDEXS"),
+            )
+            if route is None:
+                self._reply(400, {"error": "No route"})
+            else:
+                self._reply(200, {"priceRoute": route})
+        elif url.path == "/api/v3/simple/price":
+            currency = query["vs_currencies"]
+            self._reply(200, {"ethereum": {currency: fake.eth_price(currency)}})
+        else:
+            self._reply(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if not urlparse(self.path).path.startswith("/v2/transactions"):
+            self._reply(404, {"error": "Not found"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length))
+        self._reply(200, self.server.fake.transaction(body))
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        # the bot polls this every block
+        pass
+
+
+def shock(deployment, trader, rng, scale=SHOCK_SCALE):
+    """One random trade on the pool or a pair, a lognormal fraction of the input"""
+    tokens = deployment.tokens
+    i, j = rng.sample(range(len(tokens)), 2)
+    venues = ["Curve"] + list(deployment.factories)
+    venue = rng.choice(venues)
+    fraction = min(abs(rng.gauss(0, scale)), 0.5)
+    tx_params = {"from": trader}
+    if venue == "Curve":
+        dx = int(deployment.crypto_swap.balances(i) * fraction)
+        if dx > 0:
+            deployment.crypto_swap.exchange(i, j, dx, 0, tx_params)
+    else:
+        factory = deployment.factories[venue].address
+        pair = deployment.pairs[(factory, tokens[i].address, tokens[j].address)]
+        reserves = pair.getReserves()[:2]
+        reserve_in = (
+            reserves[0] if tokens[i].address < tokens[j].address else reserves[1]
+        )
+        dx = int(reserve_in * fraction)
+        if dx > 0:
+            deployment.augustus.swapOnUniswapFork(
+                factory, b"\x00" * 32, dx, 0, [tokens[i], tokens[j]], 0, tx_params
+            )
+    logger.debug(f"Shocked {venue} {i} -> {j} by {fraction:.2%}")
+
+
+def shock_loop(deployment, trader, block_time=BLOCK_TIME, seed=SEED):
+    """Mine a block with a random shock in it every ``block_time`` seconds"""
+    rng = random.Random(seed)
+    tx_params = {"from": trader}
+    for token in deployment.tokens:
+        token.mint(
+            trader,
+            to_amount(token.symbol(), token.decimals(), TRADER_LIQUIDITY),
+            tx_params,
+        )
+        token.approve(deployment.crypto_swap, 2 ** 256 - 1, tx_params)
+        token.approve(
+            deployment.augustus.getTokenTransferProxy(), 2 ** 256 - 1, tx_params
+        )
+    while True:
+        time.sleep(block_time)
+        try:
+            shock(deployment, trader, rng)
+        except Exception as exc:
+            logger.warning(f"Shock failed: {exc!r}")
+
+
+def main():
+    deployer, trader = accounts[0], accounts[1]
+    deployment = deploy(deployer)
+    fake = FakeParaswap(deployment).start()
+
+    signer = accounts.add()
+    deployer.transfer(signer, "100 ether")
+    os.environ.update(
+        ARBIE_PARASWAP_API=fake.url,
+        ARBIE_COINGECKO_API=fake.url,
+        ARBIE_ADDR=deployment.arbie.address,
+        PRIVATE_KEYS=signer.private_key,
+    )
+    threading.Thread(target=shock_loop, args=(deployment, trader), daemon=True).start()
+
+    # the bot reads its environment and the chain at import time, so only
+    # import it once everything above is in place
+    from scripts import arbie
+
+    try:
+        arbie.main()
+    finally:
+        fake.close()
@@ -0,0 +1,90 @@
+"""Profit math shared by the live bot and the backtester.
+
+The float functions work elementwise on scalars, pandas Series or numpy arrays
+so the same code ranks a handful of rows in ``go_arbie`` and millions of
+recorded quotes in the backtester. The ``*_exact`` functions take
+``amounts.Amounts`` and fractions in basis points and produce the integer
+amounts that end up in calldata. Nothing here touches the network.
+"""
+import numpy as np
+
+from scripts.amounts import MAX_AMOUNT
+
+BPS = 10_000
+
+
+def to_bps(fraction):
+    """Convert a fraction such as ``SLIPPAGE = 0.01`` to integer basis points"""
+    return int(round(fraction * BPS))
+
+
+def curve_dest_amount(dest_amount, slippage):
+    """Paraswap output we can count on after buying on curve and selling on paraswap"""
+    return dest_amount * (1 - slippage)
+
+
+def curve_dest_amount_exact(dest_amount, slippage_bps):
+    """Exact minimum paraswap output after slippage, rounded down"""
+    return dest_amount.mul_div(BPS - slippage_bps, BPS)
+
+
+def curve_margin(dx, dest_amount, slippage):
+    """Profit ratio of aave i > curve j > paraswap i"""
+    return (curve_dest_amount(dest_amount, slippage) - dx) / dx
+
+
+def curve_net_profit(dx, dest_amount, slippage, flash_loan_fee, gas_cost):
+    """Profit in coin i after repaying the flash loan premium and paying for gas"""
+    return (
+        curve_dest_amount(dest_amount, slippage) - dx * (1 + flash_loan_fee) - gas_cost
+    )
+
+
+def paraswap_buy_amount(dx, slippage):
+    """Amount of coin i requested from paraswap so that the curve leg can swap dx"""
+    return dx * (1 + slippage)
+
+
+def paraswap_buy_amount_exact(dx, slippage_bps):
+    """Exact amount of coin i requested from paraswap, rounded down"""
+    return dx.mul_div(BPS + slippage_bps, BPS)
+
+
+def flash_loan_repayment_exact(amount, premium_bps):
+    """Amount owed to the lending pool, AAVE rounds the premium down
+
+    Saturated amounts, e.g. the srcAmount placeholder of a failed quote, owe
+    ``MAX_AMOUNT`` instead of overflowing.
+    """
+    saturated = amount == MAX_AMOUNT
+    amount = amount.where(saturated, 0)
+    return (amount + amount.mul_div(premium_bps, BPS)).where(saturated, MAX_AMOUNT)
+
+
+def paraswap_margin(min_dy, src_amount):
+    """Profit ratio of aave j > paraswap i > curve j"""
+    return (min_dy - src_amount) / src_amount
+
+
+def paraswap_net_profit(min_dy, src_amount, flash_loan_fee, gas_cost):
+    """Profit in coin j after repaying the flash loan premium and paying for gas"""
+    return min_dy - src_amount * (1 + flash_loan_fee) - gas_cost
+
+
+def is_candidate(margin, flash_loan_fee):
+    """Only opportunities beating the flash loan premium are worth building a tx for"""
+    return margin > flash_loan_fee
+
+
+def best_per_group(groups, values):
+    """Index of the maximum value within each group, groups need not be sorted
+
+    Returns ``(unique_groups, argmax_indices)``; NaN values never win.
+    """
+    values = np.where(np.isnan(values), -np.inf, values)
+    order = np.lexsort((values, groups))
+    sorted_groups = groups[order]
+    if not len(sorted_groups):
+        return sorted_groups, order
+    last = np.r_[sorted_groups[1:] != sorted_groups[:-1], True]
+    return sorted_groups[last], order[last]
@@ -0,0 +1,222 @@
+"""Monotone model of Paraswap's answers, to price grid rows that were not quoted.
+
+Within a block the scheduler only interpolates margins between rows quoted in
+that block. ``QuoteModel`` keeps every answered quote of the last
+``ARBIE_SURFACE_MAX_AGE`` blocks per ``(direction, i, j)`` and fits the quoted
+rate (answer / amount) against the log of the amount:
+
+- the fit is monotone, a sell's rate can only fall with its size and a buy's
+  price can only rise, enforced with a weighted isotonic regression
+- older quotes weigh less, halving every ``ARBIE_SURFACE_HALF_LIFE`` blocks
+- between quoted sizes the fit is interpolated linearly, beyond them it is held
+  flat
+
+Predictions come with a band of ``Z`` times the weighted relative residual of
+the fit, widened by the age of the freshest quote and by how far a size lies
+outside the quoted range.
+
+With ``ARBIE_SURFACE=1`` the scan prices every grid row with the model after
+the scheduler's quotes are in, and the predicted best row of each direction, if
+it was not quoted and beats the best quoted one, is confirmed with a real quote.
+"""
+import os
+from typing import NamedTuple
+
+import numpy as np
+
+from scripts import recorder
+
+ENABLED = os.getenv("ARBIE_SURFACE", "0") == "1"
+HALF_LIFE = float(os.getenv("ARBIE_SURFACE_HALF_LIFE", "5"))
+MAX_AGE = int(os.getenv("ARBIE_SURFACE_MAX_AGE", "50"))
+MAX_POINTS = 200
+# width of the band in residual standard deviations
+Z = 2.0
+MIN_SIGMA = 0.001
+# band widening per block since the freshest quote, and per unit of log size
+# outside the quoted range, both relative to the answer
+DRIFT = 0.0005
+EXTRAPOLATION = 0.05
+
+# placeholder amounts of failed quotes are at least this large
+_FAILED = 2 ** 255
+
+
+class Prediction(NamedTuple):
+    answer: np.ndarray  # NaN for rows of pairs that were never quoted
+    low: np.ndarray
+    high: np.ndarray
+
+
+class Predicted(NamedTuple):
+    """Stands in for a ``Quote`` where margins are computed from a prediction"""
+
+    src_amount: float
+    dest_amount: float
+
+
+class Fit(NamedTuple):
+    log_amounts: np.ndarray
+    rates: np.ndarray
+    sigma: float  # weighted relative residual
+    age: int  # blocks since the freshest quote
+
+
+def isotonic(values, weights):
+    """Weighted least squares non-decreasing fit, pool adjacent violators"""
+    means, totals, counts = [], [], []
+    for value, weight in zip(values, weights):
+        means.append(value)
+        totals.append(weight)
+        counts.append(1)
+        while len(means) > 1 and means[-2] > means[-1]:
+            mean, total, count = means.pop(), totals.pop(), counts.pop()
+            merged = totals[-1] + total
+            means[-1] = (means[-1] * totals[-1] + mean * total) / merged
+            totals[-1] = merged
+            counts[-1] += count
+    return np.repeat(means, counts)
+
+
+def amounts(rows):
+    """What each row asks Paraswap to price
+
+    The curve direction sells ``min_dy``, the paraswap direction buys ``dx`` plus
+    slippage, ``dx`` stands in for it as slippage only changes with the config.
+    """
+    is_curve = rows["direction"].to_numpy() == recorder.CURVE
+    return np.where(
+        is_curve,
+        rows["min_dy"].to_numpy(dtype=np.float64),
+        rows["dx"].to_numpy(dtype=np.float64),
+    )
+
+
+def answers(rows, results):
+    """Paraswap's answer per row, the ``destAmount`` of a sell, ``srcAmount`` of a buy"""
+    is_curve = rows["direction"].to_numpy() == recorder.CURVE
+    return np.array(
+        [
+            float(x.dest_amount if curve else x.src_amount)
+            for x, curve in zip(results, is_curve)
+        ]
+    )
+
+
+def as_quotes(rows, answer):
+    """``Predicted`` quotes answering each row with ``answer``"""
+    is_curve = rows["direction"].to_numpy() == recorder.CURVE
+    return [
+        Predicted(np.nan, value) if curve else Predicted(value, np.nan)
+        for value, curve in zip(answer, is_curve)
+    ]
+
+
+def row_keys(rows):
+    return [
+        (int(direction), int(i), int(j))
+        for direction, i, j in zip(rows["direction"], rows["i"], rows["j"])
+    ]
+
+
+class QuoteModel:
+    """Answered quotes per ``(direction, i, j)`` across blocks and their monotone fit"""
+
+    def __init__(self, half_life=HALF_LIFE, max_age=MAX_AGE, max_points=MAX_POINTS):
+        self.half_life = half_life
+        self.max_age = max_age
+        self.max_points = max_points
+        # key -> (block numbers, log amounts, rates), oldest first
+        self._points = {}
+
+    def reset(self):
+        self._points = {}
+
+    def observe(self, block_number, rows, results):
+        """Add the answered quotes of ``rows``, failed quotes are ignored"""
+        if not len(rows):
+            return
+        x = amounts(rows)
+        y = answers(rows, results)
+        valid = (x > 0) & (y > 0) & (y < _FAILED)
+        keys = row_keys(rows)
+        for key in set(keys):
+            mask = valid & np.array([k == key for k in keys])
+            if not mask.any():
+                continue
+            blocks, log_amounts, rates = self._points.get(key, ((), (), ()))
+            blocks = np.append(blocks, np.full(mask.sum(), block_number))
+            log_amounts = np.append(log_amounts, np.log(x[mask]))
+            rates = np.append(rates, y[mask] / x[mask])
+            keep = blocks > block_number - self.max_age
+            # over the cap, the oldest of the points still kept go first
+            kept = np.flatnonzero(keep)
+            keep[kept[: max(len(kept) - self.max_points, 0)]] = False
+            self._points[key] = (blocks[keep], log_amounts[keep], rates[keep])
+
+    def fit(self, block_number, key):
+        """Monotone fit of ``key``'s quotes, ``None`` if it has none"""
+        if key not in self._points:
+            return None
+        blocks, log_amounts, rates = self._points[key]
+        age = block_number - blocks
+        # stale quotes are only dropped when the key is next observed
+        fresh = age < self.max_age
+        if not fresh.any():
+            return None
+        order = np.argsort(log_amounts[fresh], kind="stable")
+        log_amounts = log_amounts[fresh][order]
+        rates = rates[fresh][order]
+        age = age[fresh][order]
+        weights = 0.5 ** (age / self.half_life)
+        # a sell's rate falls with size, a buy's price rises
+        sign = -1.0 if key[0] == recorder.CURVE else 1.0
+        fitted = sign * isotonic(sign * rates, weights)
+        residual = (rates - fitted) / fitted
+        sigma = np.sqrt(np.sum(weights * residual ** 2) / np.sum(weights))
+        return Fit(log_amounts, fitted, max(float(sigma), MIN_SIGMA), int(age.min()))
+
+    def predict(self, block_number, rows):
+        """``Prediction`` of Paraswap's answer for every row"""
+        x = amounts(rows)
+        answer = np.full(len(rows), np.nan)
+        low, high = answer.copy(), answer.copy()
+        keys = row_keys(rows)
+        for key in set(keys):
+            fit = self.fit(block_number, key)
+            if fit is None:
+                continue
+            mask = np.array([k == key for k in keys]) & (x > 0)
+            log_x = np.log(x[mask])
+            rate = np.interp(log_x, fit.log_amounts, fit.rates)
+            outside = np.maximum(fit.log_amounts[0] - log_x, 0) + np.maximum(
+                log_x - fit.log_amounts[-1], 0
+            )
+            band = Z * fit.sigma + DRIFT * fit.age + EXTRAPOLATION * outside
+            answer[mask] = rate * x[mask]
+            low[mask] = answer[mask] * np.maximum(1 - band, 0)
+            high[mask] = answer[mask] * (1 + band)
+        return Prediction(answer, low, high)
+
+
+def best_unquoted(rows, margin, optimistic, quoted_best, threshold):
+    """Position in ``rows`` of the row to confirm per direction
+
+    Per direction the row with the highest predicted ``margin`` is picked if it
+    beats ``quoted_best[direction]``, the best margin actually quoted, and its
+    ``optimistic`` margin, at the favourable end of the band, clears
+    ``threshold``.
+    """
+    directions = rows["direction"].to_numpy()
+    picked = {}
+    for direction in np.unique(directions):
+        positions = np.flatnonzero((directions == direction) & np.isfinite(margin))
+        if not len(positions):
+            continue
+        best = positions[np.argmax(margin[positions])]
+        if (
+            margin[best] > quoted_best.get(direction, -np.inf)
+            and optimistic[best] > threshold
+        ):
+            picked[int(direction)] = int(best)
+    return picked
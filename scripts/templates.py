@@ -0,0 +1,144 @@
+"""Pre-encoded flash loan calldata templates.
+
+The ``LENDING_POOL.flashLoan`` envelope for a given direction and pair only
+changes in a handful of 32 byte words between blocks: the borrowed amount,
+``dx``, ``min_dy``, the deadline and the trailing paraswap payload. A template
+is built once by encoding the call with sentinel values through the regular
+encoders, recording where each sentinel landed, and keeping everything before
+the variable-length payload as raw bytes. Rendering is then a few slice
+assignments and a concatenation instead of a full ABI encode.
+
+Templates are built speculatively between blocks for the previous block's top
+candidates, so the next block only pays for ``render``.
+"""
+from loguru import logger
+
+_SENTINELS = {
+    "amount": 2 ** 255 + 0xA1,
+    "dx": 2 ** 255 + 0xA2,
+    "min_dy": 2 ** 255 + 0xA3,
+    "deadline": 2 ** 255 + 0xA4,
+}
+# values used to check a freshly built template against the real encoders
+_CHECK_VALUES = {
+    "amount": 10 ** 20,
+    "dx": 10 ** 20,
+    "min_dy": 3 * 10 ** 8,
+    "deadline": 2 ** 32,
+}
+_CHECK_PAYLOAD = bytes(range(70))
+
+
+def _word(value):
+    return int(value).to_bytes(32, "big")
+
+
+def _pad(length):
+    return b"\x00" * (-length % 32)
+
+
+def _find_word(data, name):
+    word = _word(_SENTINELS[name])
+    offset = data.find(word)
+    if offset == -1 or data.find(word, offset + 1) != -1:
+        raise ValueError(
+            f"Could not locate a unique {name} word while building template"
+        )
+    return offset
+
+
+class TxTemplate:
+    """Flash loan calldata with patchable words and a variable-length paraswap tail"""
+
+    __slots__ = ("key", "prefix", "amount_offset", "params_head", "field_offsets")
+
+    def __init__(self, key, prefix, amount_offset, params_head, field_offsets):
+        self.key = key
+        self.prefix = bytes(prefix)
+        self.amount_offset = amount_offset
+        self.params_head = bytes(params_head)
+        self.field_offsets = field_offsets
+
+    def render(self, amount, dx, min_dy, deadline, payload):
+        """Calldata for ``LENDING_POOL.flashLoan`` with the given values patched in"""
+        calldata = bytearray(self.prefix)
+        calldata[self.amount_offset : self.amount_offset + 32] = _word(amount)
+
+        params = bytearray(self.params_head)
+        for name, value in (("dx", dx), ("min_dy", min_dy), ("deadline", deadline)):
+            offset = self.field_offsets[name]
+            params[offset : offset + 32] = _word(value)
+        payload = bytes(payload)
+        params += _word(len(payload)) + payload + _pad(len(payload))
+
+        calldata += _word(len(params)) + params + _pad(len(params))
+        return bytes(calldata)
+
+
+def build_template(key, encode_params, encode_flash_loan):
+    """Build a template from the regular encoders
+
+    ``encode_params(dx, min_dy, deadline, payload)`` returns the bytes handed to
+    ``ArbieV3`` through the lending pool and ``encode_flash_loan(amount, params)``
+    returns the full ``flashLoan`` calldata. Both must encode the paraswap payload
+    as the trailing dynamic ``bytes`` argument.
+    """
+    sentinels = {name: _SENTINELS[name] for name in ("dx", "min_dy", "deadline")}
+    params = _to_bytes(encode_params(payload=b"", **sentinels))
+    calldata = _to_bytes(encode_flash_loan(amount=_SENTINELS["amount"], params=params))
+
+    # an empty payload encodes as a single zero length word at the end of params
+    params_head = params[:-32]
+    params_start = calldata.rfind(params)
+    if params_start < 32:
+        raise ValueError("Could not locate params while building template")
+    prefix = calldata[: params_start - 32]
+
+    template = TxTemplate(
+        key,
+        prefix,
+        _find_word(prefix, "amount"),
+        params_head,
+        {name: _find_word(params_head, name) for name in sentinels},
+    )
+
+    check = {name: _CHECK_VALUES[name] for name in sentinels}
+    expected = encode_flash_loan(
+        amount=_CHECK_VALUES["amount"],
+        params=encode_params(payload=_CHECK_PAYLOAD, **check),
+    )
+    rendered = template.render(_CHECK_VALUES["amount"], payload=_CHECK_PAYLOAD, **check)
+    if rendered != _to_bytes(expected):
+        raise ValueError(f"Template for {key} does not match the reference encoding")
+    return template
+
+
+def _to_bytes(data):
+    # brownie's encode_input returns hex strings, eth_abi returns bytes
+    if isinstance(data, str):
+        return bytes.fromhex(data[2:] if data.startswith("0x") else data)
+    return bytes(data)
+
+
+class TemplateCache:
+    """Templates keyed by ``(direction, i, j)``, built on first use or ahead of time"""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._templates = {}
+
+    def get(self, key):
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates[key] = self._factory(key)
+        return template
+
+    def prebuild(self, keys):
+        """Build any missing templates, called while waiting for the next block"""
+        for key in keys:
+            if key not in self._templates:
+                self.get(key)
+                logger.debug(f"Pre-built tx template for {key}")
+
+    def clear(self):
+        self._templates.clear()
@@ -0,0 +1,156 @@
+import random
+
+import numpy as np
+import pytest
+
+from scripts import strategy
+from scripts.amounts import MAX_AMOUNT, Amounts, from_limbs, to_limbs
+from scripts.quotes import FAILED_SRC_AMOUNT
+
+VALUES = [
+    0,
+    1,
+    2 ** 32 - 1,
+    2 ** 32,
+    2 ** 64 - 1,
+    2 ** 64,
+    10 ** 18,
+    123 * 10 ** 24 + 7,
+    2 ** 127 + 2 ** 63 + 1,
+    MAX_AMOUNT,
+]
+
+
+def random_values(n, bits=128, seed=0):
+    rng = random.Random(seed)
+    return [rng.getrandbits(bits) for _ in range(n)]
+
+
+def test_limb_round_trip():
+    values = VALUES + random_values(100)
+
+    assert from_limbs(to_limbs(values)) == values
+    assert Amounts.from_limbs(to_limbs(values)).to_ints() == values
+    assert to_limbs(values).shape == (len(values), 2)
+
+
+def test_from_ints_accepts_strings_and_wrapped():
+    class Wrapped:
+        __wrapped__ = 10 ** 20
+
+    assert Amounts.from_ints(["42", Wrapped(), np.int64(7)]).to_ints() == [
+        42,
+        10 ** 20,
+        7,
+    ]
+
+
+@pytest.mark.parametrize("value", [2 ** 128, 2 ** 200, FAILED_SRC_AMOUNT])
+def test_from_ints_saturates(value):
+    assert Amounts.from_ints([value]).to_ints() == [MAX_AMOUNT]
+
+
+def test_add():
+    a, b = random_values(100, 127, 1), random_values(100, 127, 2)
+
+    assert (Amounts.from_ints(a) + Amounts.from_ints(b)).to_ints() == [
+        x + y for x, y in zip(a, b)
+    ]
+
+
+def test_add_carries_into_hi():
+    result = Amounts.from_ints([2 ** 64 - 1]) + 1
+
+    assert result.to_ints() == [2 ** 64]
+
+
+@pytest.mark.parametrize(
+    "a,b", [(MAX_AMOUNT, 1), (2 ** 127, 2 ** 127), (MAX_AMOUNT - 2 ** 64 + 1, 2 ** 64)]
+)
+def test_add_overflow_raises(a, b):
+    with pytest.raises(OverflowError):
+        Amounts.from_ints([a]) + Amounts.from_ints([b])
+
+
+def test_sub():
+    a, b = random_values(100, 128, 3), random_values(100, 128, 4)
+    a, b = zip(*((max(x, y), min(x, y)) for x, y in zip(a, b)))
+
+    assert (Amounts.from_ints(a) - Amounts.from_ints(b)).to_ints() == [
+        x - y for x, y in zip(a, b)
+    ]
+
+
+def test_sub_underflow_raises():
+    with pytest.raises(OverflowError):
+        Amounts.from_ints([2 ** 64]) - (2 ** 64 + 1)
+
+
+def test_compare():
+    a, b = VALUES, VALUES[::-1]
+    left, right = Amounts.from_ints(a), Amounts.from_ints(b)
+
+    assert (left < right).tolist() == [x < y for x, y in zip(a, b)]
+    assert (left >= right).tolist() == [x >= y for x, y in zip(a, b)]
+    assert (left == MAX_AMOUNT).tolist() == [x == MAX_AMOUNT for x in a]
+
+
+@pytest.mark.parametrize(
+    "numerator,denominator", [(1, 1), (9, 10_000), (10_100, 10_000), (2 ** 32 - 1, 3)]
+)
+def test_mul_div(numerator, denominator):
+    values = VALUES[:-2] + random_values(100, 96, 5)
+
+    result = Amounts.from_ints(values).mul_div(numerator, denominator)
+
+    assert result.to_ints() == [x * numerator // denominator for x in values]
+
+
+def test_mul_div_full_width():
+    values = random_values(100, 128, 6)
+
+    result = Amounts.from_ints(values).mul_div(9, 10_000)
+
+    assert result.to_ints() == [x * 9 // 10_000 for x in values]
+
+
+def test_mul_div_overflow_raises():
+    with pytest.raises(OverflowError):
+        Amounts.from_ints([MAX_AMOUNT]).mul_div(2, 1)
+
+
+@pytest.mark.parametrize("numerator,denominator", [(2 ** 32, 1), (1, 0), (1, 2 ** 32)])
+def test_mul_div_rejects_wide_fractions(numerator, denominator):
+    with pytest.raises(ValueError):
+        Amounts.from_ints([1]).mul_div(numerator, denominator)
+
+
+def test_where():
+    values = Amounts.from_ints([1, 2, 3])
+
+    result = values.where(np.array([True, False, True]), MAX_AMOUNT)
+
+    assert result.to_ints() == [MAX_AMOUNT, 2, MAX_AMOUNT]
+
+
+def test_flash_loan_repayment():
+    values = random_values(100, 120, 7)
+
+    repay = strategy.flash_loan_repayment_exact(Amounts.from_ints(values), 9)
+
+    assert repay.to_ints() == [x + x * 9 // 10_000 for x in values]
+
+
+def test_flash_loan_repayment_of_failed_quote_saturates():
+    src_amount = Amounts.from_ints([10 ** 18, FAILED_SRC_AMOUNT])
+
+    repay = strategy.flash_loan_repayment_exact(src_amount, 9)
+
+    assert repay.to_ints() == [10 ** 18 + 9 * 10 ** 14, MAX_AMOUNT]
+
+
+def test_ratio():
+    a = Amounts.from_ints([3 * 10 ** 18, 10 ** 30])
+    b = Amounts.from_ints([10 ** 18, 4 * 10 ** 30])
+
+    assert a.ratio(b).tolist() == pytest.approx([3.0, 0.25])
@@ -0,0 +1,170 @@
+import numpy as np
+import pytest
+
+from scripts import backtest, recorder, strategy
+
+BALANCES = [10 ** 12, 10 ** 12, 10 ** 12]
+# 10 units of coin per unit of gas
+GAS_LIMIT = 500_000
+GAS_COST = 10 * GAS_LIMIT
+TX_HASH = bytes(31) + b"\x01"
+
+# (direction, i, j, dx, min_dy, quote), dx within the default size range
+CURVE_WIN = (recorder.CURVE, 0, 1, 3 * 10 ** 9, 10 ** 9, 31 * 10 ** 8)
+CURVE_LOSS = (recorder.CURVE, 0, 1, 25 * 10 ** 8, 10 ** 9, 251 * 10 ** 7)
+PARASWAP_WIN = (recorder.PARASWAP, 0, 1, 3 * 10 ** 9, 2 * 10 ** 9, 19 * 10 ** 8)
+PARASWAP_FAILED = (recorder.PARASWAP, 0, 1, 35 * 10 ** 8, 2 * 10 ** 9, 2 ** 256 - 1)
+
+
+def write_history(root, quotes, outcome=recorder.NOT_SUBMITTED, resolved=None):
+    writer = recorder.SegmentWriter(root)
+    writer.begin_block(100, 0)
+    writer.record_balances(BALANCES)
+    for direction, *row in quotes:
+        writer.record_quotes(direction, [row])
+    for direction, *row in quotes:
+        if row[-1] < 2 ** 128:
+            # gas is only known for rows a tx was built for
+            writer.record_decision(
+                direction,
+                row,
+                0.0,
+                gas_limit=GAS_LIMIT,
+                gas_cost=GAS_COST,
+                outcome=outcome,
+                tx_hash=TX_HASH if outcome == recorder.PENDING else b"",
+            )
+    writer.end_block()
+    if resolved is not None:
+        writer.begin_block(101, 12)
+        writer.record_balances(BALANCES)
+        writer.record_outcome(TX_HASH, resolved)
+        writer.end_block()
+    writer.flush()
+
+
+def curve_net(row, params=backtest.Params()):
+    _, _, _, dx, _, quote = row
+    return strategy.curve_net_profit(
+        dx, quote, params.slippage, params.flash_loan_fee, GAS_COST
+    )
+
+
+def paraswap_net(row, params=backtest.Params()):
+    _, _, _, _, min_dy, quote = row
+    src_amount = quote * (1 + params.slippage) / (1 + params.quote_slippage)
+    return strategy.paraswap_net_profit(
+        min_dy, src_amount, params.flash_loan_fee, GAS_COST
+    )
+
+
+def test_replay_matches_strategy(tmp_path):
+    write_history(tmp_path, [CURVE_WIN, CURVE_LOSS, PARASWAP_WIN, PARASWAP_FAILED])
+
+    report = backtest.run(tmp_path)
+
+    assert report["blocks"] == 1
+    assert report["trades"] == 2
+    # curve profit is in coin i, paraswap profit in coin j
+    assert report["realized"][0] == pytest.approx(curve_net(CURVE_WIN))
+    assert report["realized"][1] == pytest.approx(paraswap_net(PARASWAP_WIN))
+    assert report["missed"] == {0: 0.0, 1: 0.0}
+
+
+def test_replay_reprices_slippage(tmp_path):
+    write_history(tmp_path, [PARASWAP_WIN])
+    params = backtest.Params(slippage=0.02)
+
+    report = backtest.run(tmp_path, params)
+
+    assert report["realized"][1] == pytest.approx(paraswap_net(PARASWAP_WIN, params))
+    assert report["realized"][1] < paraswap_net(PARASWAP_WIN)
+
+
+def test_margin_threshold_counts_as_missed(tmp_path):
+    write_history(tmp_path, [CURVE_WIN])
+
+    report = backtest.run(tmp_path, backtest.Params(min_margin=0.5))
+
+    assert report["trades"] == 0
+    assert report["missed"][0] == pytest.approx(curve_net(CURVE_WIN))
+
+
+def test_size_range_excludes_rows(tmp_path):
+    write_history(tmp_path, [CURVE_WIN])
+
+    report = backtest.run(tmp_path, backtest.Params(size_range=(1 / 100, 1 / 50)))
+
+    assert report["trades"] == 0
+    assert report["profitable"] == 1
+
+
+def test_reverted_trade_realizes_nothing(tmp_path):
+    write_history(
+        tmp_path, [CURVE_WIN], outcome=recorder.PENDING, resolved=recorder.REVERTED
+    )
+
+    report = backtest.run(tmp_path)
+
+    assert report["trades"] == 1
+    assert report["reverted"] == 1
+    assert report["realized"][0] == 0.0
+
+
+def test_succeeded_pending_trade_is_kept(tmp_path):
+    write_history(
+        tmp_path, [CURVE_WIN], outcome=recorder.PENDING, resolved=recorder.SUCCEEDED
+    )
+
+    report = backtest.run(tmp_path)
+
+    assert report["reverted"] == 0
+    assert report["realized"][0] == pytest.approx(curve_net(CURVE_WIN))
+
+
+def test_replay_a_block_range_within_a_segment(tmp_path):
+    writer = recorder.SegmentWriter(tmp_path)
+    for block_number in (100, 101, 102):
+        writer.begin_block(block_number, 0)
+        writer.record_balances(BALANCES)
+        direction, *row = CURVE_WIN
+        writer.record_quotes(direction, [row])
+        writer.record_decision(
+            direction, row, 0.0, gas_limit=GAS_LIMIT, gas_cost=GAS_COST
+        )
+        writer.end_block()
+    writer.flush()
+
+    report = backtest.run(tmp_path, start_block=101, end_block=101)
+
+    # one segment holds all three blocks, only block 101 is replayed
+    assert report["blocks"] == 1
+    assert report["trades"] == 1
+    assert report["realized"][0] == pytest.approx(curve_net(CURVE_WIN))
+
+
+def test_param_grid():
+    grid = backtest.param_grid(slippage=[0.005, 0.01], gas_limit=[1, 2])
+
+    assert [(p.slippage, p.gas_limit) for p in grid] == [
+        (0.005, 1),
+        (0.005, 2),
+        (0.01, 1),
+        (0.01, 2),
+    ]
+
+
+def test_best_per_group():
+    groups = np.array([3, 1, 3, 1, 2])
+    values = np.array([0.1, np.nan, 0.3, -1.0, np.nan])
+
+    unique, best = strategy.best_per_group(groups, values)
+
+    assert unique.tolist() == [1, 2, 3]
+    assert best.tolist() == [3, 4, 2]
+
+
+def test_best_per_group_empty():
+    unique, best = strategy.best_per_group(np.array([], dtype=np.int64), np.array([]))
+
+    assert len(unique) == len(best) == 0
@@ -0,0 +1,113 @@
+import concurrent.futures
+import threading
+
+import pytest
+
+from scripts import cancel
+
+
+@pytest.fixture
+def executor():
+    with concurrent.futures.ThreadPoolExecutor(1) as pool:
+        yield pool
+
+
+@pytest.fixture
+def release():
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def cancel_soon(scope, head=101):
+    timer = threading.Timer(0.05, scope.cancel, [head])
+    timer.start()
+    return timer
+
+
+def test_cancel_drops_queued_calls(executor, release):
+    scope = cancel.CancelScope(100)
+    running = scope.submit(executor, release.wait)
+    # the single worker is busy, these stay queued
+    queued = [scope.submit(executor, lambda: 1) for _ in range(3)]
+
+    scope.cancel(101)
+
+    assert all(future.cancelled() for future in queued)
+    assert not running.cancelled()
+    assert scope.cancelled and scope.head == 101
+    with pytest.raises(cancel.Cancelled):
+        scope.check()
+    with pytest.raises(cancel.Cancelled):
+        scope.submit(executor, lambda: 1)
+
+
+def test_call_gives_up_on_a_running_call(executor, release):
+    scope = cancel.CancelScope(100)
+    timer = cancel_soon(scope)
+
+    with pytest.raises(cancel.Cancelled) as exc:
+        scope.call(executor, release.wait)
+
+    timer.join()
+    assert exc.value.block_number == 100 and exc.value.head == 101
+
+
+def test_map_gives_up_and_drops_the_rest(executor, release):
+    scope = cancel.CancelScope(100)
+    started = []
+
+    def wait(n):
+        started.append(n)
+        release.wait()
+
+    timer = cancel_soon(scope)
+
+    with pytest.raises(cancel.Cancelled):
+        scope.map(executor, wait, range(3))
+
+    timer.join()
+    release.set()
+    executor.shutdown()
+    # the calls still queued behind the first were never run
+    assert started == [0]
+
+
+def test_map_results(executor):
+    scope = cancel.CancelScope(100)
+
+    assert scope.map(executor, pow, [2, 3], [3, 2]) == [8, 9]
+
+
+def test_map_timeout(executor, release):
+    scope = cancel.CancelScope(100)
+
+    with pytest.raises(concurrent.futures.TimeoutError):
+        scope.map(executor, lambda n: release.wait(), range(2), timeout=0.05)
+
+    # a timeout is not a newer block
+    assert not scope.cancelled
+
+
+def test_head_watcher_cancels_older_scopes():
+    watcher = cancel.HeadWatcher(lambda: 0)
+    scope = watcher.new_scope(100)
+
+    watcher.observe(99)
+    watcher.observe(100)
+    assert not scope.cancelled and watcher.head == 100
+
+    watcher.observe(101)
+    assert scope.cancelled and scope.head == 101
+
+
+def test_new_scope_cancels_the_previous_one():
+    watcher = cancel.HeadWatcher(lambda: 0)
+    first = watcher.new_scope(100)
+
+    second = watcher.new_scope(101)
+    # a head the current scope already covers
+    watcher.observe(101)
+
+    assert first.cancelled and first.head == 101
+    assert not second.cancelled
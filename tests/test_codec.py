@@ -0,0 +1,202 @@
+import random
+
+import pytest
+from eth_abi import abi
+from eth_utils import keccak, to_checksum_address
+
+from scripts import codec
+
+
+def address(rng):
+    return to_checksum_address(bytes(rng.getrandbits(8) for _ in range(20)))
+
+
+def calls(n, seed):
+    """``(target, calldata)`` pairs with calldata lengths around word boundaries"""
+    rng = random.Random(seed)
+    lengths = [0, 4, 31, 32, 33, 36, 68, 100]
+    return [
+        (address(rng), bytes(rng.getrandbits(8) for _ in range(rng.choice(lengths))))
+        for _ in range(n)
+    ]
+
+
+@pytest.mark.parametrize(
+    "signature",
+    [
+        "get_dy(uint256,uint256,uint256)",
+        "balances(uint256)",
+        "getReserves()",
+        "flashLoan(address,address[],uint256[],uint256[],address,bytes,uint16)",
+        "tryAggregate(bool,(address,bytes)[])",
+    ],
+)
+def test_selector(signature):
+    assert codec.selector(signature) == keccak(text=signature)[:4]
+
+
+@pytest.mark.parametrize(
+    "args", [(0, 1, 10 ** 6), (2, 0, 2 ** 256 - 1), (1, 2, 123456789 * 10 ** 18)]
+)
+def test_get_dy(args):
+    expected = codec.GET_DY + abi.encode_abi(["uint256"] * 3, list(args))
+
+    assert codec.get_dy(*args) == expected
+    assert codec.encode_call(codec.GET_DY, *args) == expected
+    assert codec.get_dy_underlying(*args)[4:] == expected[4:]
+
+
+def test_balances_and_balance_of():
+    owner = address(random.Random(0))
+
+    assert codec.balances(2) == codec.BALANCES + abi.encode_abi(["uint256"], [2])
+    assert codec.balance_of(owner) == codec.BALANCE_OF + abi.encode_abi(
+        ["address"], [owner]
+    )
+
+
+@pytest.mark.parametrize("n", [0, 1, 3, 8])
+def test_aggregate(n):
+    batch = calls(n, n)
+
+    assert codec.aggregate(batch) == codec.AGGREGATE + abi.encode_abi(
+        ["(address,bytes)[]"], [batch]
+    )
+
+
+@pytest.mark.parametrize("n", [0, 1, 3, 8])
+@pytest.mark.parametrize("require_success", [False, True])
+def test_try_aggregate(n, require_success):
+    batch = calls(n, n + 100)
+
+    assert codec.try_aggregate(
+        require_success, batch
+    ) == codec.TRY_AGGREGATE + abi.encode_abi(
+        ["bool", "(address,bytes)[]"], [require_success, batch]
+    )
+
+
+@pytest.mark.parametrize("n_assets", [1, 2, 3])
+@pytest.mark.parametrize("params_length", [0, 1, 32, 33, 4 + 32 * 9 + 5])
+def test_flash_loan(n_assets, params_length):
+    rng = random.Random(n_assets * 1000 + params_length)
+    receiver, on_behalf_of = address(rng), address(rng)
+    assets = [address(rng) for _ in range(n_assets)]
+    amounts = [rng.getrandbits(256) for _ in range(n_assets)]
+    modes = [rng.choice([0, 1, 2]) for _ in range(n_assets)]
+    params = bytes(rng.getrandbits(8) for _ in range(params_length))
+    referral = rng.getrandbits(16)
+
+    expected = codec.FLASH_LOAN + abi.encode_abi(
+        [
+            "address",
+            "address[]",
+            "uint256[]",
+            "uint256[]",
+            "address",
+            "bytes",
+            "uint16",
+        ],
+        [receiver, assets, amounts, modes, on_behalf_of, params, referral],
+    )
+
+    assert (
+        codec.flash_loan(
+            receiver, assets, amounts, modes, on_behalf_of, params, referral
+        )
+        == expected
+    )
+
+
+@pytest.mark.parametrize("values", [[0], [1, 2 ** 256 - 1], [10 ** 18, 3, 7]])
+def test_to_int(values):
+    data = abi.encode_abi(["uint256"] * len(values), values)
+
+    assert [codec.to_int(data, n) for n in range(len(values))] == values
+    assert [codec.to_int(memoryview(data), n) for n in range(len(values))] == values
+
+
+def test_reserves():
+    data = abi.encode_abi(
+        ["uint112", "uint112", "uint32"], [2 ** 112 - 1, 12345 * 10 ** 18, 1630000000]
+    )
+
+    assert codec.reserves(data) == (2 ** 112 - 1, 12345 * 10 ** 18)
+
+
+def test_to_address():
+    rng = random.Random(1)
+    owner, other = address(rng), address(rng)
+    data = abi.encode_abi(["address", "address"], [owner, other])
+
+    assert codec.to_address(data) == owner
+    assert codec.to_address(data, 1) == other
+
+
+@pytest.mark.parametrize("n", [0, 1, 4])
+def test_address_array(n):
+    rng = random.Random(n)
+    path = [address(rng) for _ in range(n)]
+    # swapExactTokensForTokens(amountIn, amountOutMin, path, to, deadline) args
+    data = abi.encode_abi(
+        ["uint256", "uint256", "address[]", "address", "uint256"],
+        [10 ** 18, 0, path, address(rng), 2 ** 32],
+    )
+
+    assert codec.address_array(data, 2) == path
+
+
+@pytest.mark.parametrize("n", [0, 1, 3, 8])
+def test_decode_aggregate(n):
+    results = [data for _, data in calls(n, n + 200)]
+    data = abi.encode_abi(["uint256", "bytes[]"], [14_000_000 + n, results])
+
+    block_number, decoded = codec.decode_aggregate(data)
+
+    assert block_number == 14_000_000 + n
+    assert [bytes(item) for item in decoded] == results
+
+
+@pytest.mark.parametrize("n", [0, 1, 3, 8])
+def test_decode_try_aggregate(n):
+    rng = random.Random(n)
+    results = [(rng.random() < 0.7, data) for _, data in calls(n, n + 300)]
+    data = abi.encode_abi(["(bool,bytes)[]"], [results])
+
+    decoded = codec.decode_try_aggregate(data)
+
+    assert [(success, bytes(item)) for success, item in decoded] == results
+
+
+class FakeBatch:
+    """Answers ``eth_call`` with canned return data and records the request"""
+
+    def __init__(self, result):
+        self.result = result
+        self.requests = []
+
+    def call(self, method, params):
+        self.requests.append((method, params))
+        return "0x" + self.result.hex()
+
+
+def test_multicall_uints():
+    rng = random.Random(2)
+    multicall_addr = address(rng)
+    batch = calls(3, 400)
+    results = [
+        (True, abi.encode_abi(["uint256"], [42])),
+        (False, b""),
+        (True, b"\x01"),
+    ]
+    fake = FakeBatch(abi.encode_abi(["(bool,bytes)[]"], [results]))
+
+    values = codec.Multicall(fake, multicall_addr).uints(batch, block=123, default=-1)
+
+    assert values == [42, -1, -1]
+    ((method, (tx, block)),) = fake.requests
+    assert method == "eth_call" and block == 123
+    assert tx == {
+        "to": multicall_addr,
+        "data": "0x" + codec.try_aggregate(False, batch).hex(),
+    }
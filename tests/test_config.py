@@ -0,0 +1,154 @@
+import json
+import os
+import socket
+
+import pytest
+
+from scripts import config
+
+DEFAULTS = config.Config(0.01, 20, 1 / 500, 1 / 250, 100, "Uniswap,Sushiswap")
+
+
+def test_parse_updates_the_base():
+    parsed = config.parse(
+        {"slippage": 0, "n_threads": 40, "coins": ["WBTC", "WETH"]}, DEFAULTS
+    )
+
+    assert parsed == DEFAULTS._replace(
+        slippage=0.0, n_threads=40, coins=("WBTC", "WETH")
+    )
+    assert isinstance(parsed.slippage, float)
+
+
+@pytest.mark.parametrize(
+    "values,match",
+    [
+        ({"slipage": 0.01}, "Unknown config field"),
+        ({"slippage": "0.02"}, "slippage must be of type float"),
+        ({"slippage": [0.02]}, "slippage must be of type float"),
+        ({"n_threads": 4.5}, "n_threads must be of type int"),
+        ({"n_threads": True}, "n_threads must be of type int"),
+        ({"grid_size": {"n": 10}}, "grid_size must be of type int"),
+        ({"include_dexs": ["Uniswap"]}, "include_dexs must be of type str"),
+        ({"coins": "WBTC,WETH"}, "coins must be a list"),
+        ({"coins": ["WBTC", 1]}, "coins must be a list"),
+        ({"coins": ["WBTC"]}, "at least two coins"),
+        ({"slippage": 1}, r"slippage must be in \[0, 1\)"),
+        ({"n_threads": 0}, "at least 1"),
+        ({"dx_min": 0.1, "dx_max": 0.05}, "dx_min <= dx_max"),
+    ],
+)
+def test_parse_rejects(values, match):
+    with pytest.raises(ValueError, match=match):
+        config.parse(values, DEFAULTS)
+
+
+def write(path, values, mtime_ns):
+    path.write_text(json.dumps(values))
+    # mtimes can be coarser than the test is fast
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_poll_reloads_the_file_when_it_changes(tmp_path):
+    path = tmp_path / "config.json"
+    write(path, {"slippage": 0.02}, 10 ** 9)
+    watcher = config.ConfigWatcher(DEFAULTS, path, None)
+
+    assert watcher.start() == DEFAULTS._replace(slippage=0.02)
+    assert watcher.poll() is None
+
+    write(path, {"slippage": 0.02, "n_threads": 8}, 2 * 10 ** 9)
+    assert watcher.poll() == (
+        DEFAULTS._replace(slippage=0.02, n_threads=8),
+        {"n_threads"},
+    )
+
+    # an invalid file keeps the running config
+    write(path, {"n_threads": "8"}, 3 * 10 ** 9)
+    assert watcher.poll() is None
+    assert watcher.current.n_threads == 8
+
+
+def test_poll_applies_overrides_over_the_file(tmp_path):
+    path = tmp_path / "config.json"
+    write(path, {"slippage": 0.02}, 10 ** 9)
+    watcher = config.ConfigWatcher(DEFAULTS, path, None)
+    watcher.start()
+
+    watcher.command({"cmd": "set", "values": {"slippage": 0.03}})
+    # applied between blocks
+    assert watcher.current.slippage == 0.02
+    assert watcher.poll() == (DEFAULTS._replace(slippage=0.03), {"slippage"})
+
+    # the override still wins over a file change
+    write(path, {"slippage": 0.04, "grid_size": 50}, 2 * 10 ** 9)
+    assert watcher.poll() == (
+        DEFAULTS._replace(slippage=0.03, grid_size=50),
+        {"grid_size"},
+    )
+
+    watcher.command({"cmd": "reload"})
+    assert watcher.poll() == (
+        DEFAULTS._replace(slippage=0.04, grid_size=50),
+        {"slippage"},
+    )
+
+
+def as_json(values):
+    # coins come back as a list
+    return json.loads(json.dumps(values._asdict()))
+
+
+@pytest.fixture
+def control(tmp_path):
+    watcher = config.ConfigWatcher(DEFAULTS, None, str(tmp_path / "arbie.sock"))
+    watcher.start()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(watcher.socket_path)
+        replies = sock.makefile("rb")
+
+        def send(request):
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            return json.loads(replies.readline())
+
+        yield watcher, send
+    watcher._server.shutdown()
+    watcher._server.server_close()
+
+
+def test_control_socket_get_and_set(control):
+    watcher, send = control
+
+    assert send({"cmd": "get"}) == {"ok": True, "config": as_json(DEFAULTS)}
+
+    reply = send({"cmd": "set", "values": {"n_threads": 4}})
+    # answers with the running config, the new one applies at the next poll
+    assert reply == {"ok": True, "config": as_json(DEFAULTS)}
+    assert watcher.poll() == (DEFAULTS._replace(n_threads=4), {"n_threads"})
+    assert send({"cmd": "get"})["config"]["n_threads"] == 4
+
+
+@pytest.mark.parametrize(
+    "request_,error",
+    [
+        ({"cmd": "set", "values": {"n_threads": [4]}}, "n_threads must be of type int"),
+        ({"cmd": "set", "values": {"threads": 4}}, "Unknown config field"),
+        ({"cmd": "restart"}, "Unknown command 'restart'"),
+    ],
+)
+def test_control_socket_reports_errors(control, request_, error):
+    watcher, send = control
+
+    reply = send(request_)
+
+    assert not reply["ok"] and error in reply["error"]
+    assert watcher.poll() is None
+
+
+def test_control_socket_reload_drops_overrides(control):
+    watcher, send = control
+    send({"cmd": "set", "values": {"slippage": 0.05}})
+    watcher.poll()
+
+    assert send({"cmd": "reload"})["ok"]
+    assert watcher.poll() == (DEFAULTS, {"slippage"})
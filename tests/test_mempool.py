@@ -0,0 +1,156 @@
+import threading
+from types import SimpleNamespace
+
+import requests
+
+from scripts import codec, config, mempool, pool_math, recorder
+
+CRYPTO_POOL = "0x80466c64868E1ab14a1Ddf27A676C3fcBE638Fe5"
+PAIR = "0xA478c2975Ab1Ea89e8196811F51A7B7Ade33eB11"
+
+
+class FakeBatch:
+    """Answers the watcher's reads, filter ids and errors are scripted"""
+
+    def __init__(self, new_filter, expired=()):
+        # eth_newPendingTransactionFilter answers, in order, exceptions are raised
+        self.new_filter = list(new_filter)
+        self.expired = set(expired)
+        self.polled = []
+        self.polled_live_filter = threading.Event()
+
+    def call(self, method, params=()):
+        if method == "eth_newPendingTransactionFilter":
+            result = self.new_filter.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        assert method == "eth_getFilterChanges"
+        filter_id = params[0]
+        self.polled.append(filter_id)
+        if filter_id in self.expired:
+            raise ValueError({"code": -32000, "message": "filter not found"})
+        self.polled_live_filter.set()
+        return []
+
+    def gather(self, *calls):
+        return [None for _ in calls]
+
+
+def start_watcher(batch):
+    return mempool.PendingWatcher(batch, CRYPTO_POOL, {}, poll_interval=0.001).start()
+
+
+def test_expired_filter_is_recreated_after_a_failed_attempt():
+    batch = FakeBatch(
+        ["0x1", requests.ConnectionError("node restarting"), "0x2"], expired={"0x1"}
+    )
+
+    watcher = start_watcher(batch)
+
+    assert batch.polled_live_filter.wait(2)
+    assert watcher._thread.is_alive()
+    assert batch.polled[0] == "0x1" and batch.polled[-1] == "0x2"
+
+
+def test_filter_is_retried_when_the_first_attempt_fails():
+    batch = FakeBatch([requests.ConnectionError("node down"), "0x2"])
+
+    watcher = start_watcher(batch)
+
+    assert batch.polled_live_filter.wait(2)
+    assert watcher._thread.is_alive()
+
+
+def test_watcher_stops_when_the_node_has_no_pending_filter():
+    batch = FakeBatch([ValueError({"code": -32601, "message": "method not found"})])
+
+    watcher = start_watcher(batch)
+    watcher._thread.join(2)
+
+    assert not watcher._thread.is_alive()
+    assert batch.polled == []
+
+
+class TxBatch:
+    """Answers ``eth_getTransactionByHash`` from ``txs``, None for unknown hashes"""
+
+    def __init__(self):
+        self.txs = {}
+
+    def gather(self, *calls):
+        assert all(method == "eth_getTransactionByHash" for method, _ in calls)
+        return [self.txs.get(tx_hash) for _, (tx_hash,) in calls]
+
+
+def pair_snapshot(block_number, reserve1):
+    pair = pool_math.V2PairState(PAIR, "A", "B", 10 ** 24, reserve1)
+    return mempool.PoolSnapshot(block_number, None, {PAIR: pair})
+
+
+def pair_swap(tx_hash, amount1_out):
+    data = mempool.PAIR_SWAP + codec.word(0) + codec.word(amount1_out)
+    return {"hash": tx_hash, "to": PAIR, "input": "0x" + data.hex()}
+
+
+def drain(watcher):
+    projections = []
+    while not watcher.projections.empty():
+        projections.append(watcher.projections.get_nowait())
+    return projections
+
+
+def test_still_pending_txs_are_reapplied_to_the_next_block():
+    batch = TxBatch()
+    watcher = mempool.PendingWatcher(batch, CRYPTO_POOL, {})
+    watcher.update(pair_snapshot(1, 10 ** 21), {})
+    mined, pending = pair_swap("0x01", 10 ** 18), pair_swap("0x02", 2 * 10 ** 18)
+    watcher._on_pending(mined)
+    watcher._on_pending(pending)
+    assert [p.tx_hash for p in drain(watcher)] == ["0x01", "0x02"]
+
+    batch.txs = {"0x01": {"blockNumber": "0x2"}, "0x02": {"blockNumber": None}}
+    fresh = pair_snapshot(2, 10 ** 21 - 10 ** 18)
+    watcher.update(fresh, {})
+
+    (projection,) = drain(watcher)
+    assert projection == mempool.Projection("0x02", watcher.apply(fresh, pending))
+    # the filter will not report it again, nor is it projected twice
+    watcher._on_pending(pending)
+    assert drain(watcher) == []
+
+    # dropped from the node's mempool
+    batch.txs = {}
+    watcher.update(pair_snapshot(3, 10 ** 21), {})
+    assert drain(watcher) == []
+
+
+def search_snapshot():
+    """Two coin pool and a single Uniswap pair between its coins"""
+    pool = SimpleNamespace(balances=(1_000_000 * 10 ** 6, 500 * 10 ** 18))
+    pair = pool_math.V2PairState("0xpair", "A", "B", 10 ** 24, 505 * 10 ** 18)
+    pair_index = {("uni", "B", "A"): "0xpair", ("uni", "A", "B"): "0xpair"}
+    return mempool.PoolSnapshot(1, pool, {"0xpair": pair}), pair_index
+
+
+def test_search_uses_the_config_grid():
+    snapshot, pair_index = search_snapshot()
+    settings = config.Config(0.005, 1, 1 / 1000, 1 / 100, 7, "Uniswap")
+    simulated = []
+
+    def simulate(fn, state, pairs, dx):
+        simulated.append((pairs, dx))
+        return dx * 0.99
+
+    best = mempool.search(
+        snapshot, ["A", "B"], pair_index, ["uni"], settings, top_k=3, simulate=simulate
+    )
+
+    ((pairs, dx),) = simulated
+    assert pairs == [(0, 1), (1, 0)] and dx.shape == (2, 7)
+    for (i, _), sizes in zip(pairs, dx):
+        balance = snapshot.crypto_pool.balances[i]
+        assert sizes[0] == balance // 1000 and sizes[-1] == balance // 100
+    grid = {(i, j, int(size)) for (i, j), sizes in zip(pairs, dx) for size in sizes}
+    for direction in (recorder.CURVE, recorder.PARASWAP):
+        assert len(best[direction]) == 3 and set(best[direction]) <= grid
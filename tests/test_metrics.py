@@ -0,0 +1,111 @@
+import pytest
+
+from scripts import metrics
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    monkeypatch.setattr(metrics, "_histograms", {})
+    monkeypatch.setattr(metrics, "_counters", {})
+
+
+@pytest.mark.parametrize(
+    "value,bucket",
+    [(0.0, 0), (0.001, 0), (0.0011, 1), (0.3, 7), (30, 13), (31, 14)],
+)
+def test_histogram_bucket(value, bucket):
+    hist = metrics.Histogram()
+
+    hist.observe(value)
+
+    assert hist.counts[bucket] == 1 and hist.count == 1 and hist.sum == value
+
+
+def test_histogram_quantiles():
+    hist = metrics.Histogram()
+    assert hist.quantile(0.5) == 0.0
+
+    for value in [0.002] * 50 + [0.02] * 40 + [0.2] * 9 + [60]:
+        hist.observe(value)
+
+    assert hist.quantile(0.5) == 0.005
+    assert hist.quantile(0.9) == 0.025
+    assert hist.quantile(0.99) == 0.25
+    assert hist.quantile(1.0) == float("inf")
+
+
+def test_span_records_its_stage(enabled):
+    with metrics.span("grid_multicall") as span:
+        pass
+    with metrics.span("paraswap_quotes"):
+        pass
+
+    hist = metrics._histograms["stage_seconds:grid_multicall"]
+    assert hist.count == 1 and hist.sum == span.elapsed > 0
+    assert metrics._histograms["stage_seconds:paraswap_quotes"].count == 1
+
+
+def test_span_is_only_timed_when_disabled(monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", False)
+    monkeypatch.setattr(metrics, "_histograms", {})
+
+    with metrics.span("grid_multicall") as span:
+        pass
+
+    assert span.elapsed > 0
+    assert "stage_seconds:grid_multicall" not in metrics._histograms
+
+
+def test_render_prometheus(enabled):
+    metrics.inc("quotes_total", 3)
+    metrics.inc("quotes_total")
+    metrics.observe("stage_seconds:tx_build", 0.003)
+    metrics.observe("stage_seconds:tx_build", 45.0)
+    metrics.observe("block_to_decision_seconds", 2.5)
+
+    lines = metrics.render_prometheus().splitlines()
+
+    assert lines[:2] == ["# TYPE arbie_quotes_total counter", "arbie_quotes_total 4"]
+    assert lines.count("# TYPE arbie_stage_seconds histogram") == 1
+    assert 'arbie_stage_seconds_bucket{stage="tx_build",le="0.001"} 0' in lines
+    assert 'arbie_stage_seconds_bucket{stage="tx_build",le="0.005"} 1' in lines
+    assert 'arbie_stage_seconds_bucket{stage="tx_build",le="30"} 1' in lines
+    assert 'arbie_stage_seconds_bucket{stage="tx_build",le="+Inf"} 2' in lines
+    assert 'arbie_stage_seconds_sum{stage="tx_build"} 45.003' in lines
+    assert 'arbie_stage_seconds_count{stage="tx_build"} 2' in lines
+    assert 'arbie_block_to_decision_seconds_bucket{le="2"} 0' in lines
+    assert 'arbie_block_to_decision_seconds_bucket{le="4"} 1' in lines
+    assert "arbie_block_to_decision_seconds_count 1" in lines
+
+
+def test_snapshot_rates(enabled):
+    metrics.inc("paraswap_requests_total", 20)
+    metrics.inc("paraswap_429_total", 2)
+    metrics.inc("paraswap_cache_hits_total", 5)
+    metrics.inc("quotes_total", 100)
+    previous = metrics.snapshot()
+    metrics.inc("quotes_total", 30)
+
+    data = metrics.snapshot(previous, interval=10)
+
+    assert previous["rates"] == {
+        "paraswap_429_ratio": 0.1,
+        "paraswap_cache_hit_ratio": 0.25,
+    }
+    assert data["rates"]["quotes_per_second"] == 3.0
+
+
+def test_snapshot_without_requests(enabled):
+    metrics.observe("stage_seconds:tx_build", 0.02)
+
+    data = metrics.snapshot()
+
+    assert data["rates"] == {}
+    assert data["histograms"]["stage_seconds:tx_build"] == {
+        "count": 1,
+        "mean": 0.02,
+        "p50": 0.025,
+        "p90": 0.025,
+        "p99": 0.025,
+    }
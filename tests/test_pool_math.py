@@ -0,0 +1,484 @@
+"""The float ports in ``scripts.pool_math`` against the on-chain integer math.
+
+The reference functions below are line by line ports of the Vyper sources
+(tricrypto ``CurveCryptoSwap.vy``, ``StableSwapAave.vy`` and UniswapV2Library)
+in python ints, so they round exactly like the contracts do.
+"""
+import numpy as np
+import pytest
+
+from scripts import pool_math
+
+# the slack the Polygon scan allows between the local and on-chain get_dy
+SIM_MARGIN = 1e-6
+N = 3
+A_MULTIPLIER = 10000
+PRECISION = 10 ** 18
+
+
+# Vyper reference, tricrypto
+
+
+def ref_newton_D(ANN, gamma, x_unsorted):
+    x = sorted(x_unsorted, reverse=True)
+    D = N * ref_geometric_mean(x)
+    S = sum(x)
+    for _ in range(255):
+        D_prev = D
+        K0 = 10 ** 18
+        for _x in x:
+            K0 = K0 * _x * N // D
+        _g1k0 = gamma + 10 ** 18
+        _g1k0 = _g1k0 - K0 + 1 if _g1k0 > K0 else K0 - _g1k0 + 1
+        mul1 = 10 ** 18 * D // gamma * _g1k0 // gamma * _g1k0 * A_MULTIPLIER // ANN
+        mul2 = (2 * 10 ** 18) * N * K0 // _g1k0
+        neg_fprime = (S + S * mul2 // 10 ** 18) + mul1 * N // K0 - mul2 * D // 10 ** 18
+        D_plus = D * (neg_fprime + S) // neg_fprime
+        D_minus = D * D // neg_fprime
+        if 10 ** 18 > K0:
+            D_minus += D * (mul1 // neg_fprime) // 10 ** 18 * (10 ** 18 - K0) // K0
+        else:
+            D_minus -= D * (mul1 // neg_fprime) // 10 ** 18 * (K0 - 10 ** 18) // K0
+        D = D_plus - D_minus if D_plus > D_minus else (D_minus - D_plus) // 2
+        if abs(D - D_prev) * 10 ** 14 < max(10 ** 16, D):
+            return D
+    raise ValueError("Did not converge")
+
+
+def ref_geometric_mean(x):
+    D = x[0]
+    for _ in range(255):
+        D_prev = D
+        tmp = 10 ** 18
+        for _x in x:
+            tmp = tmp * _x // D
+        D = D * ((N - 1) * 10 ** 18 + tmp) // (N * 10 ** 18)
+        diff = abs(D - D_prev)
+        if diff <= 1 or diff * 10 ** 18 < D:
+            return D
+    raise ValueError("Did not converge")
+
+
+def ref_newton_y(ANN, gamma, x, D, i):
+    y = D // N
+    K0_i = 10 ** 18
+    S_i = 0
+    x_sorted = list(x)
+    x_sorted[i] = 0
+    x_sorted = sorted(x_sorted, reverse=True)
+    convergence_limit = max(max(x_sorted[0] // 10 ** 14, D // 10 ** 14), 100)
+    for j in range(2, N + 1):
+        _x = x_sorted[N - j]
+        y = y * D // (_x * N)
+        S_i += _x
+    for j in range(N - 1):
+        K0_i = K0_i * x_sorted[j] * N // D
+    for _ in range(255):
+        y_prev = y
+        K0 = K0_i * y * N // D
+        S = S_i + y
+        _g1k0 = gamma + 10 ** 18
+        _g1k0 = _g1k0 - K0 + 1 if _g1k0 > K0 else K0 - _g1k0 + 1
+        mul1 = 10 ** 18 * D // gamma * _g1k0 // gamma * _g1k0 * A_MULTIPLIER // ANN
+        mul2 = 10 ** 18 + (2 * 10 ** 18) * K0 // _g1k0
+        yfprime = 10 ** 18 * y + S * mul2 + mul1
+        _dyfprime = D * mul2
+        if yfprime < _dyfprime:
+            y = y_prev // 2
+            continue
+        yfprime -= _dyfprime
+        fprime = yfprime // y
+        y_minus = mul1 // fprime
+        y_plus = (yfprime + 10 ** 18 * D) // fprime + y_minus * 10 ** 18 // K0
+        y_minus += 10 ** 18 * S // fprime
+        y = y_prev // 2 if y_plus < y_minus else y_plus - y_minus
+        if abs(y - y_prev) < max(convergence_limit, y // 10 ** 14):
+            return y
+    raise ValueError("Did not converge")
+
+
+def ref_xp(state, balances):
+    xp = [balances[0] * state.precisions[0]]
+    for k in range(N - 1):
+        xp.append(
+            balances[k + 1]
+            * state.price_scale[k]
+            * state.precisions[k + 1]
+            // PRECISION
+        )
+    return xp
+
+
+def ref_fee(state, xp):
+    f = sum(xp)
+    f = (
+        state.fee_gamma
+        * 10 ** 18
+        // (
+            state.fee_gamma
+            + 10 ** 18
+            - (10 ** 18 * N ** N) * xp[0] // f * xp[1] // f * xp[2] // f
+        )
+    )
+    return (state.mid_fee * f + state.out_fee * (10 ** 18 - f)) // 10 ** 18
+
+
+def ref_get_dy(state, i, j, dx):
+    balances = list(state.balances)
+    balances[i] += dx
+    xp = ref_xp(state, balances)
+    y = ref_newton_y(state.A, state.gamma, xp, state.D, j)
+    dy = xp[j] - y - 1
+    xp[j] = y
+    if j > 0:
+        dy = dy * PRECISION // state.price_scale[j - 1]
+    dy //= state.precisions[j]
+    dy -= ref_fee(state, xp) * dy // 10 ** 10
+    return dy
+
+
+# Vyper reference, aave StableSwap
+
+A_PRECISION = 100
+FEE_DENOMINATOR = 10 ** 10
+
+
+def ref_get_D(xp, amp):
+    n = len(xp)
+    S = sum(xp)
+    D = S
+    Ann = amp * n
+    for _ in range(255):
+        D_P = D
+        for _x in xp:
+            D_P = D_P * D // (_x * n + 1)
+        Dprev = D
+        D = (
+            (Ann * S // A_PRECISION + D_P * n)
+            * D
+            // ((Ann - A_PRECISION) * D // A_PRECISION + (n + 1) * D_P)
+        )
+        if abs(D - Dprev) <= 1:
+            return D
+    raise ValueError("Did not converge")
+
+
+def ref_get_y_D(amp, i, xp, D):
+    n = len(xp)
+    Ann = amp * n
+    c = D
+    S_ = 0
+    for k, _x in enumerate(xp):
+        if k == i:
+            continue
+        S_ += _x
+        c = c * D // (_x * n)
+    c = c * D * A_PRECISION // (Ann * n)
+    b = S_ + D * A_PRECISION // Ann
+    y = D
+    for _ in range(255):
+        y_prev = y
+        y = (y * y + c) // (2 * y + b - D)
+        if abs(y - y_prev) <= 1:
+            return y
+    raise ValueError("Did not converge")
+
+
+def ref_dynamic_fee(xpi, xpj, fee, feemul):
+    if feemul <= FEE_DENOMINATOR:
+        return fee
+    xps2 = (xpi + xpj) ** 2
+    return (feemul * fee) // (
+        (feemul - FEE_DENOMINATOR) * 4 * xpi * xpj // xps2 + FEE_DENOMINATOR
+    )
+
+
+def ref_stable_xp(state):
+    return [b * p for b, p in zip(state.balances, state.precisions)]
+
+
+def ref_stable_get_dy(state, i, j, dx):
+    xp = ref_stable_xp(state)
+    x = xp[i] + dx * state.precisions[i]
+    D = ref_get_D(xp, state.A)
+    xp_new = list(xp)
+    xp_new[i] = x
+    y = ref_get_y_D(state.A, j, xp_new, D)
+    dy = (xp[j] - y) // state.precisions[j]
+    fee = ref_dynamic_fee(
+        (xp[i] + x) // 2, (xp[j] + y) // 2, state.fee, state.offpeg_fee_multiplier
+    )
+    return dy - fee * dy // FEE_DENOMINATOR
+
+
+def ref_calc_token_amount(state, i, amount):
+    xp = ref_stable_xp(state)
+    D0 = ref_get_D(xp, state.A)
+    xp[i] += amount * state.precisions[i]
+    D1 = ref_get_D(xp, state.A)
+    return (D1 - D0) * state.lp_supply // D0
+
+
+def ref_calc_withdraw_one_coin(state, token_amount, i):
+    n = len(state.balances)
+    xp = ref_stable_xp(state)
+    D0 = ref_get_D(xp, state.A)
+    D1 = D0 - token_amount * D0 // state.lp_supply
+    new_y = ref_get_y_D(state.A, i, xp, D1)
+    fee = state.fee * n // (4 * (n - 1))
+    xp_reduced = list(xp)
+    for k in range(n):
+        if k == i:
+            dx_expected = xp[k] * D1 // D0 - new_y
+            xavg = (xp[k] + new_y) // 2
+        else:
+            dx_expected = xp[k] - xp[k] * D1 // D0
+            xavg = xp[k]
+        xp_reduced[k] -= (
+            ref_dynamic_fee(xavg, xavg, fee, state.offpeg_fee_multiplier)
+            * dx_expected
+            // FEE_DENOMINATOR
+        )
+    dy = xp_reduced[i] - ref_get_y_D(state.A, i, xp_reduced, D1)
+    return (dy - 1) // state.precisions[i]
+
+
+def ref_zap_get_dy_underlying(base, crypto, i, j, dx):
+    n_stable = len(base.balances)
+    if i < n_stable and j < n_stable:
+        return ref_stable_get_dy(base, i, j, dx)
+    if i < n_stable:
+        dx = ref_calc_token_amount(base, i, dx)
+    dy = ref_get_dy(crypto, max(i - n_stable + 1, 0), max(j - n_stable + 1, 0), dx)
+    if j < n_stable:
+        dy = ref_calc_withdraw_one_coin(base, dy, j)
+    return dy
+
+
+# pool states
+
+
+def crypto_state(balances, price_scale, precisions=(10 ** 12, 10 ** 10, 1)):
+    """Tricrypto parameters with ``D`` computed by the reference invariant"""
+    state = pool_math.CryptoPoolState(
+        A=1707629,
+        gamma=11809167828997,
+        D=0,
+        price_scale=tuple(price_scale),
+        balances=tuple(balances),
+        precisions=tuple(precisions),
+        mid_fee=3000000,
+        out_fee=30000000,
+        fee_gamma=500000000000000,
+    )
+    D = ref_newton_D(state.A, state.gamma, ref_xp(state, state.balances))
+    return state._replace(D=D)
+
+
+CRYPTO_STATES = {
+    # usdt/wbtc/weth balanced at the price scale
+    "balanced": crypto_state(
+        [60_000_000 * 10 ** 6, 1_500 * 10 ** 8, 24_000 * 10 ** 18],
+        [40_000 * 10 ** 18, 2_500 * 10 ** 18],
+    ),
+    # wbtc dumped into the pool
+    "imbalanced": crypto_state(
+        [45_000_000 * 10 ** 6, 2_300 * 10 ** 8, 17_500 * 10 ** 18],
+        [41_234 * 10 ** 18, 2_612 * 10 ** 18],
+    ),
+    "small": crypto_state(
+        [300_000 * 10 ** 6, 7 * 10 ** 8, 130 * 10 ** 18],
+        [39_876 * 10 ** 18, 2_456 * 10 ** 18],
+    ),
+}
+
+BASE_STATES = {
+    # dai/usdc/usdt aave pool on polygon
+    "balanced": pool_math.StableSwapState(
+        A=200_000,
+        balances=(30_000_000 * 10 ** 18, 31_000_000 * 10 ** 6, 29_500_000 * 10 ** 6),
+        precisions=(1, 10 ** 12, 10 ** 12),
+        fee=3000000,
+        offpeg_fee_multiplier=20000000000,
+        lp_supply=89_000_000 * 10 ** 18,
+    ),
+    "offpeg": pool_math.StableSwapState(
+        A=200_000,
+        balances=(10_000_000 * 10 ** 18, 55_000_000 * 10 ** 6, 25_000_000 * 10 ** 6),
+        precisions=(1, 10 ** 12, 10 ** 12),
+        fee=3000000,
+        offpeg_fee_multiplier=20000000000,
+        lp_supply=88_500_000 * 10 ** 18,
+    ),
+}
+
+# trade sizes as fractions of the input coin's balance, the grid uses 1/500-1/250
+FRACTIONS = [1e-6, 1e-4, 1 / 500, 1 / 250, 1 / 50]
+
+
+def assert_close(actual, expected, rtol=1e-8, atol=1.5):
+    """Within ``rtol``, or ``atol`` units where on-chain rounding dominates"""
+    actual, expected = np.asarray(actual, dtype=np.float64), np.asarray(expected, float)
+    error = np.abs(actual - expected)
+    assert (error <= np.maximum(rtol * expected, atol)).all(), (
+        f"relative error {(error / expected).max():.3g}, "
+        f"absolute error {error.max():.3g}"
+    )
+
+
+@pytest.mark.parametrize("name", CRYPTO_STATES)
+def test_newton_D(name):
+    state = CRYPTO_STATES[name]
+    ann, gamma = pool_math._constants(state)
+
+    D = pool_math.newton_D(ann, gamma, pool_math._xp(state, state.balances))
+
+    assert_close(D, [state.D], rtol=1e-12)
+
+
+@pytest.mark.parametrize("name", CRYPTO_STATES)
+@pytest.mark.parametrize("i,j", [(0, 1), (1, 0), (0, 2), (2, 1)])
+def test_newton_y(name, i, j):
+    state = CRYPTO_STATES[name]
+    ann, gamma = pool_math._constants(state)
+    balances = list(state.balances)
+    balances[i] += state.balances[i] // 300
+    xp = ref_xp(state, balances)
+
+    y = pool_math.newton_y(ann, gamma, np.array([xp], dtype=np.float64), state.D, j)
+
+    assert_close(y, [ref_newton_y(state.A, state.gamma, xp, state.D, j)], rtol=1e-12)
+
+
+@pytest.mark.parametrize("name", CRYPTO_STATES)
+@pytest.mark.parametrize("i,j", [(i, j) for i in range(3) for j in range(3) if i != j])
+def test_crypto_get_dy(name, i, j):
+    state = CRYPTO_STATES[name]
+    dx = [int(state.balances[i] * fraction) for fraction in FRACTIONS]
+
+    dy = pool_math.get_dy(state, i, j, dx)
+
+    assert_close(dy, [ref_get_dy(state, i, j, x) for x in dx])
+
+
+@pytest.mark.parametrize("name", CRYPTO_STATES)
+@pytest.mark.parametrize("i,j", [(i, j) for i in range(3) for j in range(3) if i != j])
+def test_crypto_get_dy_within_sim_margin_on_the_grid(name, i, j):
+    state = CRYPTO_STATES[name]
+    # 1/500 to 1/250 of the input balance
+    dx = [state.balances[i] * k // 5000 for k in range(10, 21)]
+
+    dy = pool_math.get_dy(state, i, j, dx)
+
+    expected = [ref_get_dy(state, i, j, x) for x in dx]
+    assert_close(dy, expected, rtol=SIM_MARGIN, atol=0)
+
+
+def test_exchange_and_add_liquidity_keep_the_invariant():
+    state = CRYPTO_STATES["balanced"]
+    dx = state.balances[0] // 400
+
+    dy, after = pool_math.exchange(state, 0, 1, dx)
+
+    assert_close([dy], [ref_get_dy(state, 0, 1, dx)])
+    assert after.balances == (
+        state.balances[0] + dx,
+        state.balances[1] - dy,
+        state.balances[2],
+    )
+    expected_D = ref_newton_D(state.A, state.gamma, ref_xp(state, after.balances))
+    assert_close([after.D], [expected_D], rtol=1e-12)
+
+    deposited = pool_math.add_liquidity(after, [10 ** 12, 0, 10 ** 20])
+    expected_D = ref_newton_D(state.A, state.gamma, ref_xp(state, deposited.balances))
+    assert_close([deposited.D], [expected_D], rtol=1e-12)
+
+
+@pytest.mark.parametrize("name", BASE_STATES)
+def test_stable_get_D(name):
+    state = BASE_STATES[name]
+    xp = ref_stable_xp(state)
+
+    D = pool_math.stable_get_D(state.A, np.array([xp], dtype=np.float64))
+
+    assert_close(D, [ref_get_D(xp, state.A)], rtol=1e-12)
+
+
+@pytest.mark.parametrize("name", BASE_STATES)
+@pytest.mark.parametrize("i,j", [(0, 1), (1, 2), (2, 0)])
+def test_stable_get_dy(name, i, j):
+    state = BASE_STATES[name]
+    dx = [int(state.balances[i] * fraction) for fraction in FRACTIONS]
+
+    dy = pool_math.stable_get_dy(state, i, j, dx)
+
+    assert_close(dy, [ref_stable_get_dy(state, i, j, x) for x in dx])
+
+
+@pytest.mark.parametrize("name", BASE_STATES)
+@pytest.mark.parametrize("i", range(3))
+def test_stable_deposit_and_withdraw(name, i):
+    state = BASE_STATES[name]
+    amounts = [int(state.balances[i] * fraction) for fraction in FRACTIONS]
+    lp_amounts = [int(state.lp_supply * fraction) for fraction in FRACTIONS]
+
+    minted = pool_math.stable_calc_token_amount(state, i, amounts)
+    withdrawn = pool_math.stable_calc_withdraw_one_coin(state, lp_amounts, i)
+
+    assert_close(minted, [ref_calc_token_amount(state, i, x) for x in amounts])
+    assert_close(
+        withdrawn, [ref_calc_withdraw_one_coin(state, x, i) for x in lp_amounts]
+    )
+
+
+# atricrypto underlying coins: dai, usdc, usdt, wbtc, weth, the crypto pool's
+# coin 0 is the base pool's LP token
+ZAP_CRYPTO = crypto_state(
+    [60_000_000 * 10 ** 18, 1_500 * 10 ** 8, 24_000 * 10 ** 18],
+    [40_000 * 10 ** 18, 2_500 * 10 ** 18],
+    precisions=(1, 10 ** 10, 1),
+)
+UNDERLYING_BALANCES = [
+    30_000_000 * 10 ** 18,
+    31_000_000 * 10 ** 6,
+    29_500_000 * 10 ** 6,
+    1_500 * 10 ** 8,
+    24_000 * 10 ** 18,
+]
+
+
+@pytest.mark.parametrize("i,j", [(0, 3), (4, 1), (3, 4), (1, 2), (2, 4), (4, 0)])
+def test_zap_get_dy_underlying(i, j):
+    base = BASE_STATES["balanced"]
+    dx = [int(UNDERLYING_BALANCES[i] * fraction) for fraction in FRACTIONS[1:]]
+
+    dy = pool_math.zap_get_dy_underlying(base, ZAP_CRYPTO, i, j, dx)
+
+    expected = [ref_zap_get_dy_underlying(base, ZAP_CRYPTO, i, j, x) for x in dx]
+    assert_close(dy, expected)
+
+
+def ref_v2_amount_out(amount_in, reserve_in, reserve_out):
+    amount_in_with_fee = amount_in * 997
+    return amount_in_with_fee * reserve_out // (reserve_in * 1000 + amount_in_with_fee)
+
+
+def ref_v2_amount_in(amount_out, reserve_in, reserve_out):
+    return reserve_in * amount_out * 1000 // ((reserve_out - amount_out) * 997) + 1
+
+
+@pytest.mark.parametrize("amount", [10 ** 15, 10 ** 18, 10 ** 20, 10 ** 22])
+def test_v2_amounts(amount):
+    reserve_in, reserve_out = 5_000 * 10 ** 18, 12_500_000 * 10 ** 6
+    out = ref_v2_amount_out(amount, reserve_in, reserve_out)
+
+    assert_close([pool_math.v2_amount_out(amount, reserve_in, reserve_out)], [out])
+    assert_close(
+        pool_math.v2_amount_in(out, reserve_in, reserve_out),
+        [ref_v2_amount_in(out, reserve_in, reserve_out)],
+    )
+
+
+@pytest.mark.parametrize("amount_out", [10 ** 6, 10 ** 7])
+def test_v2_amount_in_beyond_reserves_is_inf(amount_out):
+    assert pool_math.v2_amount_in(amount_out, 10 ** 18, 10 ** 6) == np.inf
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from scripts import prefilter
+
+
+def test_crypto_prices():
+    prices = prefilter.crypto_prices([40_000 * 10 ** 18, 3_000 * 10 ** 18])
+
+    assert prices.tolist() == [1.0, 40_000.0, 3_000.0]
+
+
+def test_v2_rate_scales_to_18_decimals():
+    # 3M USDT (6 decimals) against 1000 WETH
+    rate = prefilter.v2_rate(3_000_000 * 10 ** 6, 1_000 * 10 ** 18, 10 ** 12, 1)
+
+    assert rate == pytest.approx(1 / 3_000)
+
+
+def test_spreads_round_trip():
+    curve_prices = prefilter.crypto_prices([40_000 * 10 ** 18, 3_000 * 10 ** 18])
+    # DEX sells WETH for 1% more USDT than curve prices it at, WBTC at par
+    dex_rates = {(2, 0): 3_030.0, (1, 0): 40_000.0}
+
+    out = prefilter.spreads(curve_prices, dex_rates, curve_fee=0.0, dex_fee=0.0)
+
+    # USDT into WETH on curve, back to USDT on the DEX
+    assert out == pytest.approx({(0, 2): 0.01, (0, 1): 0.0})
+
+
+def test_spreads_use_the_most_favourable_curve_price():
+    oracle = prefilter.crypto_prices([40_000 * 10 ** 18, 3_000 * 10 ** 18])
+    last = prefilter.crypto_prices([40_000 * 10 ** 18, 2_970 * 10 ** 18])
+
+    out = prefilter.spreads(np.vstack([oracle, last]), {(2, 0): 3_000.0}, 0.0, 0.0)
+
+    assert out[(0, 2)] == pytest.approx(3_000 / 2_970 - 1)
+
+
+def test_spreads_pay_both_fees():
+    curve_prices = prefilter.crypto_prices([3_000 * 10 ** 18])
+
+    out = prefilter.spreads(curve_prices, {(1, 0): 3_000.0}, curve_fee=0.001)
+
+    assert out[(0, 1)] == pytest.approx(0.999 * (1 - prefilter.V2_FEE) - 1)
+
+
+def test_threshold():
+    assert prefilter.threshold(0.0009, 0.01, slack=0.005) == pytest.approx(0.0059)
+
+
+@pytest.mark.parametrize(
+    "min_spread,kept",
+    [
+        (-np.inf, [(0, 1), (1, 0), (0, 2), (2, 0)]),
+        (0.0, [(0, 1), (0, 2), (2, 0)]),
+        (0.006, [(0, 2), (2, 0)]),
+        (1.0, [(2, 0)]),
+    ],
+)
+def test_select(min_spread, kept):
+    pairs = [(0, 1), (1, 0), (0, 2), (2, 0)]
+    # (2, 0) has no DEX rate and is never filtered out
+    pair_spreads = {(0, 1): 0.001, (1, 0): -0.004, (0, 2): 0.02}
+
+    assert prefilter.select(pairs, pair_spreads, min_spread) == kept
@@ -0,0 +1,162 @@
+import concurrent.futures
+
+import pandas as pd
+from eth_abi import abi
+
+from scripts import codec, presim
+
+MULTICALL = "0x5BA1e12693Dc8F9c48aAD8770482f4739bEeD696"
+LENDING_POOL = "0x7d2768dE32b0b80b7a3454c06BdAc94A69DDc7A9"
+SENDER = "0x66aB6D9362d4F35596279692F0251Db635165871"
+OWNER = "0x33A4622B82D4c04a53e170c638B944ce27cffce3"
+ASSET = "0x6B175474E89094C44Da98b954EedeAC495271d0F"
+BALANCE = 10 ** 18
+
+
+def candidate(n):
+    return presim.Candidate(0, None, ASSET, "0x" + bytes([n] * 4).hex(), 0)
+
+
+def aggregate_result(profit):
+    """``tryAggregate`` return data of balanceOf, flashLoan, balanceOf"""
+    results = [
+        (True, codec.word(BALANCE)),
+        (profit is not None, b""),
+        (True, codec.word(BALANCE + (profit or 0))),
+    ]
+    return "0x" + abi.encode_abi(["(bool,bytes)[]"], [results]).hex()
+
+
+class FakeBatch:
+    """Answers each candidate's calls from ``answers[calldata] = (profit, gas)``
+
+    A ``None`` profit reverts the flash loan, an exception gas fails the estimate.
+    """
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = []
+
+    def _answer(self, method, params):
+        if method == "eth_gasPrice":
+            return hex(10 ** 9)
+        if method == "eth_blockNumber":
+            return hex(100)
+        data = params[0]["data"]
+        for calldata, (profit, gas) in self.answers.items():
+            if method == "eth_estimateGas" and data == calldata:
+                if isinstance(gas, BaseException):
+                    raise gas
+                return hex(gas)
+            if method == "eth_call" and calldata[2:] in data:
+                return aggregate_result(profit)
+        raise AssertionError(f"unexpected {method}")
+
+    def submit(self, method, params=()):
+        self.calls.append((method, params))
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(self._answer(method, params))
+        except ValueError as exc:
+            future.set_exception(exc)
+        return future
+
+    def flush(self):
+        pass
+
+
+def simulate(answers):
+    candidates = [candidate(n + 1) for n in range(len(answers))]
+    batch = FakeBatch(dict(zip((c.calldata for c in candidates), answers)))
+    results = presim.simulate(batch, MULTICALL, LENDING_POOL, SENDER, OWNER, candidates)
+    return batch, candidates, results
+
+
+def test_top_rows_across_directions():
+    frames = {
+        0: pd.DataFrame({"profit": [0.01, 0.05, 0.0005, 0.03]}),
+        1: pd.DataFrame({"profit": [0.04, 0.02]}),
+    }
+
+    rows = presim.top_rows(frames, 3, 0.0009)
+
+    assert [(direction, row["profit"]) for direction, row in rows] == [
+        (0, 0.05),
+        (1, 0.04),
+        (0, 0.03),
+    ]
+
+
+def test_top_rows_below_the_threshold():
+    frames = {0: pd.DataFrame({"profit": [0.0005]}), 1: pd.DataFrame({"profit": []})}
+
+    assert presim.top_rows(frames, 3, 0.0009) == []
+
+
+def test_simulate_batches_every_candidate():
+    batch, candidates, (results, gas_price, head) = simulate(
+        [(5 * 10 ** 15, 400_000), (10 ** 16, 350_000)]
+    )
+
+    assert [(result.profit, result.gas_limit) for result in results] == [
+        (5 * 10 ** 15, 400_000),
+        (10 ** 16, 350_000),
+    ]
+    assert all(result.ok for result in results)
+    assert [result.candidate for result in results] == candidates
+    assert (gas_price, head) == (10 ** 9, 100)
+    # balance, flash loan, balance in one eth_call, then the gas estimate
+    method, (call, block) = batch.calls[0]
+    assert method == "eth_call" and block == "pending" and call["to"] == MULTICALL
+    calls = [
+        (ASSET, codec.balance_of(OWNER)),
+        (LENDING_POOL, bytes.fromhex(candidates[0].calldata[2:])),
+        (ASSET, codec.balance_of(OWNER)),
+    ]
+    assert call["data"] == "0x" + codec.try_aggregate(False, calls).hex()
+    method, (tx, block) = batch.calls[1]
+    assert method == "eth_estimateGas"
+    assert tx == {"from": SENDER, "to": LENDING_POOL, "data": candidates[0].calldata}
+
+
+def test_simulate_reverts():
+    _, _, (results, _, _) = simulate(
+        [
+            (None, 400_000),
+            (10 ** 16, ValueError({"code": -32000, "message": "execution reverted"})),
+        ]
+    )
+
+    assert not results[0].ok and results[0].error == "flash loan reverted"
+    assert not results[1].ok and "execution reverted" in results[1].error
+    assert results[1].profit == results[1].gas_limit == 0
+
+
+def net_of_gas(result):
+    return result.profit - result.gas_limit * 10 ** 10
+
+
+def test_choose_the_highest_net_profit():
+    results = [
+        presim.Result(candidate(1), 10 ** 16, 500_000),
+        presim.Result(candidate(2), 2 * 10 ** 16, 0, "flash loan reverted"),
+        presim.Result(candidate(3), 9 * 10 ** 15, 100_000),
+    ]
+
+    # the most profitable candidate reverts, gas decides between the others
+    assert presim.choose(results, net_of_gas) is results[2]
+
+
+def test_choose_nothing_when_every_candidate_reverts():
+    results = [
+        presim.Result(candidate(1), 0, 0, "flash loan reverted"),
+        presim.Result(candidate(2), 0, 0, "execution reverted"),
+    ]
+
+    assert presim.choose(results, net_of_gas) is None
+
+
+def test_choose_nothing_that_does_not_pay_for_gas():
+    results = [presim.Result(candidate(1), 10 ** 14, 500_000)]
+
+    assert presim.choose(results, net_of_gas) is None
@@ -0,0 +1,119 @@
+import time
+
+import pytest
+
+from scripts import profiler
+
+STACKS = {
+    "main (arbie.py:1);scan (arbie.py:10);get_prices (quoting.py:5)": 6,
+    "main (arbie.py:1);scan (arbie.py:10)": 2,
+    "worker (thread.py:1);fetch (quotes.py:3)": 4,
+}
+
+
+class FakeSampler:
+    """Hands back ``STACKS`` over 10 samples"""
+
+    started = 0
+
+    def begin(self):
+        FakeSampler.started += 1
+
+    def end(self):
+        return dict(STACKS), 10
+
+
+@pytest.fixture
+def sampler(monkeypatch):
+    FakeSampler.started = 0
+    monkeypatch.setattr(profiler, "Sampler", FakeSampler)
+    return FakeSampler
+
+
+def scan(block_profiler, block_numbers, seconds=0.0):
+    for block_number in block_numbers:
+        with block_profiler.block(block_number):
+            time.sleep(seconds)
+
+
+def written(log_dir):
+    return sorted(path.name for path in log_dir.glob("*.collapsed"))
+
+
+def test_every_nth_block_is_captured(tmp_path, sampler):
+    block_profiler = profiler.Profiler(tmp_path, 1, armed=True, every=3)
+
+    scan(block_profiler, range(10, 17))
+
+    assert sampler.started == 2
+    assert written(tmp_path) == ["profile-1-12.collapsed", "profile-1-15.collapsed"]
+
+
+def test_only_slow_blocks_are_kept(tmp_path, sampler):
+    block_profiler = profiler.Profiler(tmp_path, 1, armed=True, threshold=0.05)
+
+    scan(block_profiler, [10, 11])
+    scan(block_profiler, [12], seconds=0.06)
+
+    # every block is sampled, it is not known in advance which will be slow
+    assert sampler.started == 3
+    assert written(tmp_path) == ["profile-1-12.collapsed"]
+
+
+def test_nothing_is_captured_disarmed(tmp_path, sampler):
+    block_profiler = profiler.Profiler(
+        tmp_path, 1, armed=False, every=1, threshold=0.01
+    )
+
+    scan(block_profiler, [10, 11], seconds=0.02)
+    assert sampler.started == 0 and written(tmp_path) == []
+
+    block_profiler.toggle()
+    scan(block_profiler, [12])
+    assert written(tmp_path) == ["profile-1-12.collapsed"]
+
+
+def test_output_files(tmp_path, sampler):
+    block_profiler = profiler.Profiler(tmp_path, 137, armed=True, every=1)
+
+    scan(block_profiler, [42])
+
+    collapsed = tmp_path.joinpath("profile-137-42.collapsed").read_text()
+    assert sorted(collapsed.splitlines()) == sorted(
+        f"{stack} {count}" for stack, count in STACKS.items()
+    )
+    lines = tmp_path.joinpath("profile-137-42.txt").read_text().splitlines()
+    assert lines[0].startswith("block 42 took ")
+    assert lines[1] == "10 samples, 12 busy thread stacks (3 distinct)"
+    by_self = lines[lines.index(f"top {profiler.TOP_N} by self samples") + 1 :]
+    assert by_self[:3] == [
+        "       6   50.0%  get_prices (quoting.py:5)",
+        "       4   33.3%  fetch (quotes.py:3)",
+        "       2   16.7%  scan (arbie.py:10)",
+    ]
+    cumulative = lines[lines.index(f"top {profiler.TOP_N} by cumulative samples") + 1 :]
+    # tied frames come in any order
+    assert sorted(cumulative[:2]) == [
+        "       8   66.7%  main (arbie.py:1)",
+        "       8   66.7%  scan (arbie.py:10)",
+    ]
+
+
+def spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_sampler_collects_the_running_stack():
+    sampler = profiler.Sampler(interval=0.001)
+
+    sampler.begin()
+    spin(0.05)
+    stacks, n_samples = sampler.end()
+
+    assert n_samples > 0
+    assert any(
+        stack.endswith(f"spin (test_profiler.py:{spin.__code__.co_firstlineno})")
+        for stack in stacks
+    )
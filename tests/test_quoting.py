@@ -0,0 +1,209 @@
+import concurrent.futures
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts import cancel, config, quotes, quoting, recorder, scheduler, surface
+
+BODY = (
+    b'{"priceRoute":{"blockNumber":13000000,"details":'
+    b'{"srcAmount":"100","destAmount":"99"},"bestRoute":[]}}'
+)
+
+
+class FakeSession:
+    def __init__(self, status_code, content=b"", from_cache=False):
+        self.response = SimpleNamespace(
+            ok=status_code == 200,
+            status_code=status_code,
+            content=content,
+            from_cache=from_cache,
+        )
+        self.requests = []
+
+    def get(self, url, params):
+        self.requests.append((url, params))
+        return self.response
+
+
+def test_get_prices():
+    session = FakeSession(200, BODY)
+
+    quote = quoting.get_prices(session, "https://prices", {"amount": 100})
+
+    assert (quote.src_amount, quote.dest_amount, quote.block_number) == (
+        100,
+        99,
+        13000000,
+    )
+    assert session.requests == [("https://prices", {"amount": 100})]
+
+
+def test_unroutable_pair_is_a_failed_quote():
+    quote = quoting.get_prices(FakeSession(400), "https://prices", {})
+
+    assert quote.src_amount == quotes.FAILED_SRC_AMOUNT and quote.dest_amount == 0
+
+
+@pytest.mark.parametrize(
+    "status_code,error", [(429, quoting.TooManyRequests), (500, Exception)]
+)
+def test_get_prices_errors(status_code, error):
+    with pytest.raises(error):
+        quoting.get_prices(FakeSession(status_code), "https://prices", {})
+
+
+def rows(direction, dx, min_dy, i=0, j=1):
+    return pd.DataFrame(
+        {
+            "i": i,
+            "j": j,
+            "dx": dx,
+            "min_dy": min_dy,
+            "direction": direction,
+            "size": np.asarray(dx, dtype=np.float64) / 1e20,
+        }
+    )
+
+
+def test_quote_margins():
+    frame = pd.concat(
+        [
+            rows(recorder.CURVE, [100, 200], [1, 1]),
+            rows(recorder.PARASWAP, [1, 1], [110, 90]),
+        ],
+        ignore_index=True,
+    )
+    results = [
+        quotes.Quote(0, 110),
+        quotes.Quote(0, 190),
+        quotes.Quote(100, 0),
+        quotes.Quote.failed(),
+    ]
+
+    margins = quoting.quote_margins(frame, results, 0.0)
+
+    assert margins[:3] == pytest.approx([0.1, -0.05, 0.1])
+    # a failed quote can never look profitable
+    assert margins[3] == pytest.approx(-1.0)
+
+
+def test_trading_pairs():
+    symbols = ["USDT", "WBTC", "WETH"]
+
+    assert quoting.trading_pairs(symbols, ()) == [
+        (0, 1),
+        (0, 2),
+        (1, 0),
+        (1, 2),
+        (2, 0),
+        (2, 1),
+    ]
+    assert quoting.trading_pairs(symbols, ("USDT", "WETH", "DAI")) == [(0, 2), (2, 0)]
+
+
+def test_apply_config():
+    old = config.Config(0.01, 2, 1 / 500, 1 / 250, 100, "Uniswap")
+    new = old._replace(slippage=0.02, n_threads=4, coins=("USDT", "WETH"))
+    quote_scheduler = scheduler.QuoteScheduler(scheduler.Budget(10, 1.0), 2)
+    surface_before = quote_scheduler.surface
+    model = surface.QuoteModel()
+    model.observe(1, rows(recorder.PARASWAP, [10], [11]), [quotes.Quote(10, 0)])
+    pool = concurrent.futures.ThreadPoolExecutor(2)
+    top_candidates = {recorder.CURVE: (True, 0, 2), recorder.PARASWAP: (False, 1, 0)}
+
+    new_pool, pairs = quoting.apply_config(
+        new,
+        config.changed_fields(old, new),
+        quote_scheduler,
+        model,
+        pool,
+        [(0, 1), (1, 0)],
+        ["USDT", "WBTC", "WETH"],
+        top_candidates,
+    )
+
+    assert new_pool is not pool and new_pool._max_workers == 4
+    assert quote_scheduler.wave_size == 4
+    assert quote_scheduler.surface is not surface_before
+    assert model.fit(1, (recorder.PARASWAP, 0, 1)) is None
+    assert pairs == [(0, 2), (2, 0)]
+    assert top_candidates == {recorder.CURVE: (True, 0, 2)}
+    new_pool.shutdown()
+
+
+def test_apply_config_keeps_what_did_not_change():
+    old = config.Config(0.01, 2, 1 / 500, 1 / 250, 100, "Uniswap")
+    new = old._replace(grid_size=50)
+    quote_scheduler = scheduler.QuoteScheduler(scheduler.Budget(10, 1.0), 2)
+    surface_before = quote_scheduler.surface
+    pool, pairs = concurrent.futures.ThreadPoolExecutor(2), [(0, 1)]
+
+    result = quoting.apply_config(
+        new,
+        config.changed_fields(old, new),
+        quote_scheduler,
+        surface.QuoteModel(),
+        pool,
+        pairs,
+        ["USDT", "WBTC"],
+        {},
+    )
+
+    assert result == (pool, pairs)
+    assert quote_scheduler.surface is surface_before
+    pool.shutdown()
+
+
+def test_confirm_predicted_quotes_the_predicted_best_row():
+    dx = [10 ** 18, 2 * 10 ** 18]
+    quoted = rows(recorder.PARASWAP, dx, [int(x * 1.05) for x in dx])
+    quoted["results"] = [quotes.Quote(x, 0) for x in dx]
+    unquoted = rows(recorder.PARASWAP, [4 * 10 ** 18], [44 * 10 ** 17])
+    candidates = pd.concat([quoted.drop(columns="results"), unquoted])
+    candidates.index = range(len(candidates))
+    quoted.index = range(len(quoted))
+    requested = []
+
+    def request_quote(direction, i, j, dx, min_dy):
+        requested.append((direction, i, j, dx, min_dy))
+        return quotes.Quote(dx, 0)
+
+    def margins(rows, results):
+        return quoting.quote_margins(rows, results, 0.0)
+
+    with concurrent.futures.ThreadPoolExecutor(2) as pool:
+        confirmed = quoting.confirm_predicted(
+            cancel.CancelScope(100),
+            pool,
+            surface.QuoteModel(),
+            candidates,
+            quoted,
+            request_quote,
+            margins,
+            0.0009,
+        )
+
+    assert requested == [(recorder.PARASWAP, 0, 1, 4 * 10 ** 18, 44 * 10 ** 17)]
+    assert len(confirmed) == 3
+    assert confirmed["results"].iloc[-1].src_amount == 4 * 10 ** 18
+
+
+def test_confirm_predicted_without_unquoted_rows():
+    quoted = rows(recorder.CURVE, [10 ** 18], [10 ** 18])
+    quoted["results"] = [quotes.Quote(0, 10 ** 18)]
+
+    confirmed = quoting.confirm_predicted(
+        cancel.CancelScope(100),
+        None,
+        surface.QuoteModel(),
+        quoted.drop(columns="results"),
+        quoted,
+        None,
+        None,
+        0.0009,
+    )
+
+    assert confirmed is quoted
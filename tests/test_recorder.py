@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+
+from scripts import recorder
+from scripts.amounts import MAX_AMOUNT, from_limbs
+
+# trailing zero bytes must survive the round trip
+TX_HASH = bytes(range(1, 31)) + b"\x00\x00"
+
+
+def record_block(writer, number, tx_hash=TX_HASH):
+    writer.begin_block(number, 1_600_000_000 + 13 * number)
+    writer.record_balances([10 ** 12, 10 ** 8, 2 ** 256 - 1])
+    writer.record_grid([(0, 1, number * 10 ** 6, 10 ** 5)])
+    writer.record_quotes(
+        recorder.CURVE, [(0, 1, number * 10 ** 6, 10 ** 5, 2 ** 256 - 1)]
+    )
+    writer.record_decision(
+        recorder.CURVE,
+        (0, 1, number * 10 ** 6, 10 ** 5, 10 ** 6),
+        0.01,
+        gas_limit=500_000,
+        gas_cost=10 ** 15,
+        outcome=recorder.PENDING,
+        tx_hash=tx_hash,
+    )
+    writer.record_outcome(tx_hash, recorder.SUCCEEDED)
+    writer.end_block()
+
+
+@pytest.fixture
+def history(tmp_path):
+    writer = recorder.SegmentWriter(tmp_path, blocks_per_segment=4)
+    for number in range(100, 110):
+        record_block(writer, number)
+    writer.flush()
+    return recorder.HistoryReader(tmp_path)
+
+
+def test_segments_rotate_and_flush(history):
+    segments = list(history.segments())
+
+    assert [(s.first_block, s.last_block) for s in segments] == [
+        (100, 103),
+        (104, 107),
+        (108, 109),
+    ]
+    assert not list(history.root.glob(".*.tmp"))
+
+
+def test_round_trip(history):
+    chunks = list(history.iter_table("quotes"))
+    blocks = np.concatenate([chunk["block_number"] for chunk in chunks])
+    dx = [value for chunk in chunks for value in from_limbs(chunk["dx"])]
+    quote = [value for chunk in chunks for value in from_limbs(chunk["quote"])]
+
+    assert blocks.tolist() == list(range(100, 110))
+    assert dx == [number * 10 ** 6 for number in range(100, 110)]
+    # the failed quote placeholder is clamped
+    assert quote == [MAX_AMOUNT] * 10
+
+
+def test_balances_round_trip(history):
+    chunk, *_ = history.iter_table("blocks", ["timestamp", "balances"])
+
+    assert chunk["timestamp"].tolist() == [
+        1_600_000_000 + 13 * n for n in range(100, 104)
+    ]
+    assert [from_limbs(row) for row in chunk["balances"]] == [
+        [10 ** 12, 10 ** 8, MAX_AMOUNT]
+    ] * 4
+
+
+@pytest.mark.parametrize(
+    "start_block,end_block,expected",
+    [
+        (None, None, list(range(100, 110))),
+        (102, 105, [102, 103, 104, 105]),
+        (104, 107, [104, 105, 106, 107]),
+        (107, None, [107, 108, 109]),
+        (None, 100, [100]),
+        (110, None, []),
+    ],
+)
+def test_iter_table_trims_block_range(history, start_block, end_block, expected):
+    chunks = history.iter_table("grid", ["i"], start_block, end_block)
+    blocks = [n for chunk in chunks for n in chunk["block_number"].tolist()]
+
+    assert blocks == expected
+
+
+def test_iter_table_skips_segments_outside_range(history):
+    segments = list(history.segments(104, 105))
+
+    assert [(s.first_block, s.last_block) for s in segments] == [(104, 107)]
+
+
+def test_tx_hash_keeps_trailing_zero_bytes(history):
+    decisions, *_ = history.iter_table("decisions", ["tx_hash", "outcome"])
+    outcomes, *_ = history.iter_table("outcomes", ["tx_hash"])
+
+    assert decisions["tx_hash"].shape == (4, 32)
+    assert bytes(decisions["tx_hash"][0]) == TX_HASH
+    assert bytes(outcomes["tx_hash"][0]) == TX_HASH
+
+
+def test_unsubmitted_tx_hash_is_zeros(tmp_path):
+    writer = recorder.SegmentWriter(tmp_path)
+    record_block(writer, 1, tx_hash=b"")
+    writer.flush()
+
+    chunk, *_ = recorder.HistoryReader(tmp_path).iter_table("decisions", ["tx_hash"])
+
+    assert bytes(chunk["tx_hash"][0]) == bytes(32)
+
+
+def test_block_without_balances_is_dropped(tmp_path):
+    writer = recorder.SegmentWriter(tmp_path)
+    writer.begin_block(1, 0)
+    writer.record_grid([(0, 1, 10, 10)])
+    writer.end_block()
+    writer.flush()
+
+    assert list(recorder.HistoryReader(tmp_path).segments()) == []
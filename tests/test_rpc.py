@@ -0,0 +1,255 @@
+import concurrent.futures
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from scripts import rpc
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.content = json.dumps(body).encode()
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    """Stands in for an endpoint's ``requests.Session``, answers with its name"""
+
+    def __init__(self, name, delay=0.0, fail=False, errors=()):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.errors = set(errors)
+        self.posted = []
+
+    def post(self, url, data, timeout):
+        request = json.loads(data)
+        self.posted.append(request)
+        time.sleep(self.delay)
+        if self.fail:
+            raise requests.ConnectionError(f"{url} is down")
+        return FakeResponse(self.answer(request))
+
+    def answer(self, request):
+        if isinstance(request, list):
+            return [self.respond(item) for item in request]
+        return self.respond(request)
+
+    def respond(self, request):
+        response = {"jsonrpc": "2.0", "id": request["id"]}
+        if request["method"] in self.errors:
+            response["error"] = {"code": -32000, "message": "execution reverted"}
+        else:
+            response["result"] = self.name
+        return response
+
+
+def make_provider(*sessions):
+    provider = rpc.HedgedProvider([f"http://{session.name}" for session in sessions])
+    for endpoint, session in zip(provider.endpoints, sessions):
+        endpoint.session = session
+    return provider
+
+
+def warm_up(provider, endpoint, delay):
+    """Give an endpoint a full latency window of ``delay``"""
+    session = endpoint.session
+    session.delay, previous = delay, session.delay
+    for _ in range(rpc.MIN_SAMPLES):
+        endpoint.post(provider.encode_rpc_request("eth_blockNumber", []))
+    session.delay = previous
+
+
+def test_needs_an_endpoint():
+    with pytest.raises(ValueError):
+        rpc.HedgedProvider([])
+
+
+def test_fast_primary_is_not_hedged():
+    primary, backup = FakeSession("primary"), FakeSession("backup")
+    provider = make_provider(primary, backup)
+
+    assert provider.make_request("eth_call", [])["result"] == "primary"
+    assert backup.posted == []
+
+
+def test_slow_primary_is_hedged_after_its_p90():
+    primary, backup = FakeSession("primary"), FakeSession("backup")
+    provider = make_provider(primary, backup)
+    warm_up(provider, provider.endpoints[0], 0.001)
+    warm_up(provider, provider.endpoints[1], 0.02)
+    assert provider.ranked()[0].session is primary
+
+    primary.delay = 1.0
+    start = time.perf_counter()
+    response = provider.make_request("eth_call", [])
+
+    assert response["result"] == "backup"
+    # raced after the primary's ~1ms p90, not its 1s answer
+    assert time.perf_counter() - start < 0.5
+
+
+def test_unmeasured_primary_is_hedged_after_default_delay():
+    primary, backup = FakeSession("primary", delay=1.0), FakeSession("backup")
+    provider = make_provider(primary, backup)
+
+    start = time.perf_counter()
+    response = provider.make_request("eth_gasPrice", [])
+    elapsed = time.perf_counter() - start
+
+    assert response["result"] == "backup"
+    assert rpc.DEFAULT_HEDGE_DELAY <= elapsed < 0.9
+
+
+def test_failed_primary_races_backup_and_ranks_last():
+    primary, backup = FakeSession("primary", fail=True), FakeSession("backup")
+    provider = make_provider(primary, backup)
+
+    assert provider.make_request("eth_call", [])["result"] == "backup"
+    assert provider.ranked()[0].session is backup
+
+
+def test_hedged_request_raises_when_every_endpoint_fails():
+    provider = make_provider(FakeSession("a", fail=True), FakeSession("b", fail=True))
+
+    with pytest.raises(requests.RequestException):
+        provider.make_request("eth_call", [])
+
+
+def test_writes_are_not_hedged():
+    primary, backup = FakeSession("primary", delay=0.4), FakeSession("backup")
+    provider = make_provider(primary, backup)
+
+    response = provider.make_request("eth_sendRawTransaction", ["0x00"])
+
+    assert response["result"] == "primary"
+    assert backup.posted == []
+
+
+def test_writes_fail_over_when_the_connection_fails():
+    primary, backup = FakeSession("primary", fail=True), FakeSession("backup")
+    provider = make_provider(primary, backup)
+
+    response = provider.make_request("eth_sendRawTransaction", ["0x00"])
+
+    assert response["result"] == "backup"
+    assert len(primary.posted) == 1
+
+
+def test_p90():
+    provider = make_provider(FakeSession("a"))
+    endpoint = provider.endpoints[0]
+    assert endpoint.p90() is None
+    assert endpoint.hedge_delay() == rpc.DEFAULT_HEDGE_DELAY
+
+    warm_up(provider, endpoint, 0.01)
+
+    assert 0.01 <= endpoint.p90() < 0.1
+    assert endpoint.hedge_delay() == endpoint.p90()
+
+
+def make_coalescer(session, window=0.05, **kwargs):
+    web3 = SimpleNamespace(provider=make_provider(session))
+    return rpc.Coalescer(web3, window=window, **kwargs)
+
+
+def test_coalesces_reads_from_several_threads():
+    session = FakeSession("node")
+    coalescer = make_coalescer(session)
+    calls = [("eth_blockNumber", []), ("eth_gasPrice", []), ("eth_call", [{}])]
+
+    with concurrent.futures.ThreadPoolExecutor(len(calls)) as pool:
+        results = list(pool.map(lambda call: coalescer.call(*call), calls))
+
+    assert results == ["node"] * 3
+    assert len(session.posted) == 1
+    assert sorted(request["method"] for request in session.posted[0]) == sorted(
+        method for method, _ in calls
+    )
+
+
+def test_gather_sends_without_waiting_for_the_window():
+    session = FakeSession("node")
+    coalescer = make_coalescer(session, window=10)
+    queued = coalescer.submit("eth_chainId")
+
+    start = time.perf_counter()
+    results = coalescer.gather(("eth_blockNumber", []), ("eth_gasPrice", []))
+
+    assert results == ["node", "node"]
+    assert queued.result(timeout=0) == "node"
+    assert time.perf_counter() - start < 1
+    assert [len(batch) for batch in session.posted] == [3]
+
+
+def test_errors_fail_only_their_own_future():
+    session = FakeSession("node", errors={"eth_estimateGas"})
+    coalescer = make_coalescer(session)
+
+    estimate = coalescer.submit("eth_estimateGas", [{}])
+    gas_price = coalescer.submit("eth_gasPrice")
+    coalescer.flush()
+
+    assert gas_price.result(timeout=0) == "node"
+    with pytest.raises(ValueError, match="execution reverted"):
+        estimate.result(timeout=0)
+
+
+def test_transport_error_fails_every_future():
+    coalescer = make_coalescer(FakeSession("node", fail=True))
+
+    futures = [coalescer.submit("eth_blockNumber"), coalescer.submit("eth_gasPrice")]
+    coalescer.flush()
+
+    for future in futures:
+        with pytest.raises(requests.RequestException):
+            future.result(timeout=0)
+
+
+def test_full_batch_is_sent_immediately():
+    session = FakeSession("node")
+    coalescer = make_coalescer(session, window=10, max_batch_size=2)
+
+    futures = [coalescer.submit("eth_blockNumber") for _ in range(3)]
+
+    assert [f.done() for f in futures] == [True, True, False]
+    coalescer.flush()
+    assert [len(batch) for batch in session.posted] == [2, 1]
+
+
+def test_missing_response_is_an_error():
+    session = FakeSession("node")
+    # drop the response to the first call of every batch
+    session.answer = lambda batch: [session.respond(item) for item in batch[1:]]
+    coalescer = make_coalescer(session)
+
+    missing = coalescer.submit("eth_blockNumber")
+    present = coalescer.submit("eth_gasPrice")
+    coalescer.flush()
+
+    assert present.result(timeout=0) == "node"
+    with pytest.raises(ValueError, match="missing from batch response"):
+        missing.result(timeout=0)
+
+
+def test_rejected_batch_fails_every_future():
+    session = FakeSession("node")
+    session.answer = lambda request: {"jsonrpc": "2.0", "error": {"code": -32600}}
+    coalescer = make_coalescer(session)
+
+    futures = [coalescer.submit("eth_blockNumber"), coalescer.submit("eth_gasPrice")]
+    coalescer.flush()
+
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=0)
+
+
+def test_to_int():
+    assert rpc.to_int("0x0") == 0
+    assert rpc.to_int("0x1bc16d674ec80000") == 2 * 10 ** 18
@@ -0,0 +1,62 @@
+import concurrent.futures
+
+import numpy as np
+
+from scripts import scanpool
+
+PAIRS = [(0, 1), (0, 2), (1, 0), (1, 2), (2, 0), (2, 1)]
+
+
+def linear(a, b, i, j, dx):
+    """Stands in for a pool_math simulator, importable by the spawned workers"""
+    return a * dx + b * (10 * i + j)
+
+
+def grid():
+    return np.linspace(1.0, 2.0, len(PAIRS) * 5).reshape(len(PAIRS), 5)
+
+
+def test_simulate_in_process():
+    dx = grid()
+
+    out = scanpool.ScanPool(processes=0).simulate(linear, (2.0, 1.0), PAIRS, dx)
+
+    expected = [2.0 * dx[n] + 10 * i + j for n, (i, j) in enumerate(PAIRS)]
+    assert np.array_equal(out, expected)
+
+
+def test_simulate_on_workers_matches_in_process():
+    dx = grid()
+    pool = scanpool.ScanPool(processes=2)
+    pool.start()
+    try:
+        out = pool.simulate(linear, (2.0, 1.0), PAIRS, dx)
+        # the buffers of a known grid shape are reused
+        again = pool.simulate(linear, (3.0, 0.0), PAIRS, dx)
+    finally:
+        pool.close()
+
+    assert np.array_equal(out, scanpool.simulate(linear, (2.0, 1.0), PAIRS, dx))
+    assert np.array_equal(again, 3.0 * dx)
+
+
+class FakeExecutor:
+    def __init__(self):
+        self.shutdowns = []
+
+    def shutdown(self, wait=True):
+        self.shutdowns.append(wait)
+
+
+def test_close_cancels_pending_chunks_without_waiting():
+    pool = scanpool.ScanPool(processes=2)
+    executor = pool._executor = FakeExecutor()
+    running, queued = concurrent.futures.Future(), concurrent.futures.Future()
+    running.set_running_or_notify_cancel()
+    pool._futures = [running, queued]
+
+    pool.close()
+
+    assert queued.cancelled() and not running.cancelled()
+    assert executor.shutdowns == [False]
+    assert pool._executor is None and pool._futures == []
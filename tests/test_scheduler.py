@@ -0,0 +1,191 @@
+import concurrent.futures
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts import cancel, scheduler
+
+
+@pytest.fixture
+def executor():
+    with concurrent.futures.ThreadPoolExecutor(4) as pool:
+        yield pool
+
+
+def make_candidates(directions):
+    """One row per direction entry, each on its own pair so surfaces do not mix"""
+    n = len(directions)
+    return pd.DataFrame(
+        {
+            "direction": directions,
+            "i": range(n),
+            "j": range(1, n + 1),
+            "dx": [10 ** 18] * n,
+            "min_dy": [10 ** 18] * n,
+            "size": [0.01] * n,
+        }
+    )
+
+
+def run(quote_scheduler, executor, candidates, prior, fetch=None, **kwargs):
+    fetch = fetch or (lambda direction, i, j, dx, min_dy: 0.0)
+    quoted = quote_scheduler.run(
+        cancel.CancelScope(100),
+        executor,
+        candidates,
+        fetch,
+        lambda rows, results: np.asarray(results, dtype=np.float64),
+        np.asarray(prior, dtype=np.float64),
+        **kwargs,
+    )
+    return quoted.index.tolist()
+
+
+@pytest.mark.parametrize(
+    "chain_id,budget",
+    [(1, scheduler.CHAIN_BUDGETS[1]), (137, scheduler.CHAIN_BUDGETS[137])],
+)
+def test_chain_budget(monkeypatch, chain_id, budget):
+    monkeypatch.delenv("ARBIE_QUOTE_BUDGET", raising=False)
+    monkeypatch.delenv("ARBIE_QUOTE_SECONDS", raising=False)
+
+    assert scheduler.chain_budget(chain_id) == budget
+
+
+def test_chain_budget_default_and_override(monkeypatch):
+    monkeypatch.delenv("ARBIE_QUOTE_BUDGET", raising=False)
+    monkeypatch.delenv("ARBIE_QUOTE_SECONDS", raising=False)
+    assert scheduler.chain_budget(56) == scheduler.Budget(60, 4.0)
+
+    monkeypatch.setenv("ARBIE_QUOTE_BUDGET", "15")
+    monkeypatch.setenv("ARBIE_QUOTE_SECONDS", "0.5")
+    assert scheduler.chain_budget(137) == scheduler.Budget(15, 0.5)
+
+
+def test_surface_interpolates_the_latest_block():
+    surface = scheduler.Surface()
+    key, other = (0, 0, 1), (1, 0, 1)
+    surface.update(10, [key, key], [0.01, 0.03], [0.0, 0.02])
+    surface.update(10, [key], [0.02], [np.nan])
+
+    predicted = surface.predict(
+        [key, other], np.array([0, 0, 1]), np.array([0.02, 0.05, 0.02]), [-1, -1, -1]
+    )
+
+    # NaN margins are not observed, sizes past the quoted ones are held flat
+    assert predicted == pytest.approx([0.01, 0.02, -1])
+
+    surface.update(11, [key], [0.01], [0.05])
+    predicted = surface.predict([key], np.array([0]), np.array([0.03]), [-1])
+
+    assert predicted == pytest.approx([0.05])
+
+
+def test_waves_follow_expected_value_within_the_quote_budget(executor):
+    quote_scheduler = scheduler.QuoteScheduler(
+        scheduler.Budget(4, 10.0), wave_size=2, explore=0.0
+    )
+    candidates = make_candidates([0, 0, 0, 1, 1, 1])
+
+    quoted = run(
+        quote_scheduler,
+        executor,
+        candidates,
+        [0.01, 0.05, 0.03, 0.02, 0.04, -0.5],
+    )
+
+    # the best row of each direction first, then by expected value
+    assert quoted == [1, 4, 2, 3]
+
+
+def test_each_direction_gets_a_quote_below_the_floor(executor):
+    quote_scheduler = scheduler.QuoteScheduler(
+        scheduler.Budget(10, 10.0), wave_size=4, explore=0.0
+    )
+    candidates = make_candidates([0, 0, 1, 1])
+
+    quoted = run(quote_scheduler, executor, candidates, [0.05, -0.5, -0.3, -0.4])
+
+    # nothing else is expected to reach the floor
+    assert quoted == [0, 2]
+
+
+def test_expected_value_weighs_margin_by_size(executor):
+    quote_scheduler = scheduler.QuoteScheduler(
+        scheduler.Budget(2, 10.0), wave_size=1, explore=0.0
+    )
+    candidates = make_candidates([0, 0, 0])
+    candidates["size"] = [0.001, 0.01, 0.004]
+
+    quoted = run(quote_scheduler, executor, candidates, [0.03, 0.01, 0.02])
+
+    # 0.01 * 0.01 beats 0.02 * 0.004 beats 0.03 * 0.001
+    assert quoted == [1, 2]
+
+
+def test_observed_margins_reorder_later_waves(executor):
+    quote_scheduler = scheduler.QuoteScheduler(
+        scheduler.Budget(3, 10.0), wave_size=1, explore=0.0
+    )
+    candidates = make_candidates([0, 0, 0])
+    # rows 1 and 2 share row 0's pair, they are at other sizes
+    candidates["i"], candidates["j"] = 0, 1
+    candidates["size"] = [0.01, 0.011, 0.02]
+
+    def fetch(direction, i, j, dx, min_dy):
+        return -0.5
+
+    quoted = run(quote_scheduler, executor, candidates, [0.05, 0.04, 0.02], fetch)
+
+    # row 0 answered far below the floor, its neighbours are expected there too
+    assert quoted == [0]
+
+
+def test_deadline_stops_issuing_waves(executor):
+    quote_scheduler = scheduler.QuoteScheduler(
+        scheduler.Budget(100, 0.05), wave_size=1, explore=0.0
+    )
+    candidates = make_candidates([0, 0, 0, 0])
+
+    def fetch(direction, i, j, dx, min_dy):
+        time.sleep(0.04)
+        return 0.0
+
+    quoted = run(quote_scheduler, executor, candidates, [0.04, 0.03, 0.02, 0.01], fetch)
+
+    # a second 40ms wave would not land before the 50ms deadline
+    assert quoted == [0]
+
+
+def test_quote_all_ignores_budget_and_floor(executor):
+    quote_scheduler = scheduler.QuoteScheduler(
+        scheduler.Budget(1, 10.0), wave_size=4, explore=0.0
+    )
+    candidates = make_candidates([0, 0, 1, 1, 1])
+
+    quoted = run(
+        quote_scheduler,
+        executor,
+        candidates,
+        [-0.5, -0.3, 0.01, -0.5, -0.4],
+        quote_all=True,
+    )
+
+    assert sorted(quoted) == [0, 1, 2, 3, 4]
+    assert quoted[:2] == [1, 2]
+
+
+def test_exploration_fills_the_wave(executor):
+    quote_scheduler = scheduler.QuoteScheduler(
+        scheduler.Budget(4, 10.0), wave_size=4, explore=0.5, seed=1
+    )
+    candidates = make_candidates([0] * 8)
+
+    quoted = run(quote_scheduler, executor, candidates, [0.08, 0.07, 0.06] + [-0.5] * 5)
+
+    # 1 best row, 1 exploited, 2 random rows
+    assert quoted[:2] == [0, 1]
+    assert len(quoted) == 4 and len(set(quoted)) == 4
+    assert set(quoted[2:]) <= set(range(2, 8))
@@ -0,0 +1,109 @@
+import pytest
+import requests
+
+from scripts import signers
+
+KEYS = ["0x" + "11" * 32, "0x" + "22" * 32]
+LENDING_POOL = "0x7d2768dE32b0b80b7a3454c06BdAc94A69DDc7A9"
+
+
+class FakeBatch:
+    """Answers nonces with ``nonce``, raw tx sends with the scripted ``sends``"""
+
+    def __init__(self, sends=(), nonce=5):
+        # None accepts the tx, exceptions are raised
+        self.sends = list(sends)
+        self.nonce = nonce
+        self.sent = []
+
+    def call(self, method, params):
+        assert method == "eth_sendRawTransaction"
+        result = self.sends.pop(0) if self.sends else None
+        if isinstance(result, BaseException):
+            raise result
+        self.sent.append(params[0])
+
+    def gather(self, *calls):
+        assert all(method == "eth_getTransactionCount" for method, _ in calls)
+        return [hex(self.nonce) for _ in calls]
+
+
+def start_pool(batch, keys=KEYS):
+    pool = signers.SignerPool(keys, batch, 1, poll_interval=60)
+    pool.start()
+    return pool
+
+
+def submit(pool, signer):
+    return pool.submit(signer, LENDING_POOL, b"\x01", 300_000, 10 ** 9, 0)
+
+
+def test_submit_marks_the_signer_pending():
+    batch = FakeBatch()
+    pool = start_pool(batch)
+    signer = pool.acquire()
+
+    tx_hash = submit(pool, signer)
+
+    assert not signer.reserved and signer.pending.tx_hash == tx_hash
+    assert signer.nonce == 6 and len(batch.sent) == 1
+    assert pool.acquire() is pool.signers[1]
+    assert pool.acquire() is None
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        requests.ConnectionError("node down"),
+        TimeoutError(),
+        ValueError({"code": -32000, "message": "insufficient funds"}),
+    ],
+)
+def test_failed_submission_releases_the_signer(error):
+    pool = start_pool(FakeBatch([error]))
+    signer = pool.acquire()
+
+    with pytest.raises(type(error)):
+        submit(pool, signer)
+
+    assert signer.idle and signer.nonce == 5
+    assert pool.acquire() is signer
+
+
+def test_nonce_too_low_resyncs_and_resends():
+    batch = FakeBatch([ValueError({"code": -32000, "message": "nonce too low"})])
+    pool = start_pool(batch)
+    signer = pool.acquire()
+    batch.nonce = 9
+
+    submit(pool, signer)
+
+    assert signer.pending.tx["nonce"] == 9 and signer.nonce == 10
+    assert len(batch.sent) == 1
+
+
+def test_failed_resend_releases_the_signer():
+    batch = FakeBatch(
+        [
+            ValueError({"code": -32000, "message": "nonce too low"}),
+            requests.Timeout("read timed out"),
+        ]
+    )
+    pool = start_pool(batch)
+    signer = pool.acquire()
+
+    with pytest.raises(requests.Timeout):
+        submit(pool, signer)
+
+    assert signer.idle
+
+
+def test_start_needs_keys():
+    with pytest.raises(ValueError, match="No signer keys"):
+        start_pool(FakeBatch(), keys=[])
+
+
+def test_require_keys():
+    assert signers.require_keys(KEYS) is KEYS
+    with pytest.raises(ValueError, match="No signer keys"):
+        signers.require_keys([])
@@ -0,0 +1,92 @@
+import pytest
+import requests
+from brownie import chain, network
+from eth_abi import abi
+from hexbytes import HexBytes
+
+from scripts import quotes, simulate
+
+
+@pytest.fixture(scope="module")
+def deployment(alice):
+    if "fork" in network.show_active():
+        pytest.skip("the simulation replaces mainnet code, run it on a plain dev chain")
+    try:
+        return simulate.deploy(alice)
+    except RuntimeError as exc:
+        pytest.skip(str(exc))
+
+
+@pytest.fixture(scope="module")
+def fake_paraswap(deployment):
+    fake = simulate.FakeParaswap(deployment).start()
+    yield fake
+    fake.close()
+
+
+def test_flash_loaned_curve_arbitrage(alice, deployment):
+    usdt, wbtc, _ = deployment.tokens
+    crypto_swap = deployment.crypto_swap
+    # dump wbtc into the pool, making it cheap on curve
+    wbtc.mint(alice, 1_000 * 10 ** 8, {"from": alice})
+    wbtc.approve(crypto_swap, 2 ** 256 - 1, {"from": alice})
+    crypto_swap.add_liquidity([0, 1_000 * 10 ** 8, 0], 0, {"from": alice})
+
+    # spend what 10 wbtc cost before on curve, sell the wbtc on uniswap
+    usdt_amount = 10 * simulate.PRICES["WBTC"] * 10 ** 6
+    min_dy = crypto_swap.get_dy(0, 1, usdt_amount)
+    factory = deployment.factories["Uniswap"]
+    amounts = deployment.augustus.getAmountsOut(factory, min_dy, [wbtc, usdt])
+    usdt_amount_out = amounts[-1]
+    assert usdt_amount_out > usdt_amount
+
+    paraswap_calldata = deployment.augustus.swapOnUniswap.encode_input(
+        min_dy, usdt_amount_out, [wbtc, usdt], 0
+    )
+    param = abi.encode_single(
+        "(bool,uint256,uint256,uint256,uint256,uint256,bytes)",
+        [
+            True,
+            0,
+            1,
+            usdt_amount,
+            min_dy,
+            chain.time() + 60,
+            HexBytes(paraswap_calldata),
+        ],
+    )
+    balance_before = usdt.balanceOf(alice)
+
+    deployment.lending_pool.flashLoan(
+        deployment.arbie, [usdt], [usdt_amount], [0], alice, param, 0, {"from": alice}
+    )
+
+    assert usdt.balanceOf(alice) > balance_before
+
+
+def test_fake_paraswap_quote_executes(alice, deployment, fake_paraswap):
+    usdt, _, weth = deployment.tokens
+    amount = 10 * 10 ** 18
+    resp = requests.get(
+        f"{fake_paraswap.url}/v2/prices",
+        params={"from": weth.address, "to": usdt.address, "amount": amount},
+    )
+    quote = quotes.Quote.from_bytes(resp.content)
+    assert quote.src_amount == amount
+
+    tx = requests.post(
+        f"{fake_paraswap.url}/v2/transactions/1",
+        json={
+            "priceRoute": quote.route,
+            "srcAmount": str(quote.src_amount),
+            "destAmount": str(quote.dest_amount),
+            "userAddress": alice.address,
+        },
+    ).json()
+    weth.mint(alice, amount, {"from": alice})
+    weth.approve(deployment.augustus.getTokenTransferProxy(), amount, {"from": alice})
+    balance_before = usdt.balanceOf(alice)
+
+    alice.transfer(tx["to"], 0, data=tx["data"])
+
+    assert usdt.balanceOf(alice) - balance_before == quote.dest_amount
@@ -0,0 +1,214 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts import quotes, recorder, surface
+
+
+def make_rows(direction, amounts, i=0, j=1):
+    """Rows asking Paraswap to price ``amounts``, ``min_dy`` or ``dx`` by direction"""
+    amounts = np.asarray(amounts, dtype=np.float64)
+    return pd.DataFrame(
+        {"direction": direction, "i": i, "j": j, "dx": amounts, "min_dy": amounts}
+    )
+
+
+def answer(direction, values):
+    """Quotes answering ``values``, ``destAmount`` of a sell, ``srcAmount`` of a buy"""
+    if direction == recorder.CURVE:
+        return [quotes.Quote(0, value) for value in values]
+    return [quotes.Quote(value, 0) for value in values]
+
+
+def observe(model, block_number, direction, amounts, rates, **kwargs):
+    rows = make_rows(direction, amounts, **kwargs)
+    results = answer(direction, [a * r for a, r in zip(amounts, rates)])
+    model.observe(block_number, rows, results)
+
+
+@pytest.mark.parametrize(
+    "values,weights",
+    [
+        ([1.0, 2.0, 3.0], [1.0, 1.0, 1.0]),
+        ([3.0, 1.0, 2.0, 0.5, 4.0], [1.0, 2.0, 1.0, 0.5, 3.0]),
+        ([5.0, 4.0, 3.0, 2.0], [0.1, 1.0, 10.0, 1.0]),
+    ],
+)
+def test_isotonic_is_monotone_and_keeps_the_weighted_mean(values, weights):
+    fitted = surface.isotonic(values, weights)
+
+    assert len(fitted) == len(values)
+    assert np.all(np.diff(fitted) >= 0)
+    assert np.dot(fitted, weights) == pytest.approx(np.dot(values, weights))
+
+
+def test_isotonic_pools_by_weight():
+    assert surface.isotonic([3.0, 1.0], [1.0, 3.0]) == pytest.approx([1.5, 1.5])
+    assert surface.isotonic([1.0, 3.0], [1.0, 3.0]) == pytest.approx([1.0, 3.0])
+
+
+@pytest.mark.parametrize(
+    "direction,sign", [(recorder.CURVE, -1.0), (recorder.PARASWAP, 1.0)]
+)
+def test_fit_is_monotone_in_size(direction, sign):
+    model = surface.QuoteModel()
+    amounts = [10 ** 18, 2 * 10 ** 18, 4 * 10 ** 18, 8 * 10 ** 18]
+    # the noisy answers break monotonicity either way
+    observe(model, 10, direction, amounts, [1.0, 1.02, 0.97, 1.01])
+
+    fit = model.fit(10, (direction, 0, 1))
+
+    # a sell's rate only falls with size, a buy's price only rises
+    assert np.all(sign * np.diff(fit.rates) >= 0)
+    assert np.all(np.diff(fit.log_amounts) > 0)
+    assert fit.sigma > surface.MIN_SIGMA and fit.age == 0
+
+
+def test_older_quotes_weigh_less():
+    model = surface.QuoteModel(half_life=1)
+    amounts = [10 ** 18, 2 * 10 ** 18]
+    observe(model, 10, recorder.PARASWAP, amounts, [1.1, 1.0])
+    observe(model, 14, recorder.PARASWAP, amounts, [1.0, 1.1])
+
+    fit = model.fit(14, (recorder.PARASWAP, 0, 1))
+
+    # the stale 1.1 at the smallest size is pooled into the fresh answers next to
+    # it at 1/16 of their weight, the fresh 1.1 at the largest size stands
+    assert fit.rates == pytest.approx([1.0 + 0.1 / 18] * 3 + [1.1])
+
+
+def test_failed_quotes_are_ignored():
+    model = surface.QuoteModel()
+    rows = make_rows(recorder.PARASWAP, [10 ** 18, 2 * 10 ** 18])
+
+    model.observe(10, rows, [quotes.Quote(10 ** 18, 0), quotes.Quote.failed()])
+
+    assert len(model.fit(10, (recorder.PARASWAP, 0, 1)).rates) == 1
+
+
+def test_predict_unknown_pairs_is_nan():
+    model = surface.QuoteModel()
+    observe(model, 10, recorder.CURVE, [10 ** 18], [1.0])
+
+    prediction = model.predict(10, make_rows(recorder.CURVE, [10 ** 18], i=2))
+
+    assert np.isnan(prediction.answer).all()
+    assert np.isnan(prediction.low).all() and np.isnan(prediction.high).all()
+
+
+def test_predict_interpolates_and_holds_flat():
+    model = surface.QuoteModel()
+    observe(model, 10, recorder.CURVE, [10 ** 18, 4 * 10 ** 18], [1.0, 0.9])
+
+    prediction = model.predict(
+        10, make_rows(recorder.CURVE, [10 ** 17, 2 * 10 ** 18, 8 * 10 ** 18])
+    )
+
+    # halfway in log size between the two quotes
+    assert prediction.answer == pytest.approx(
+        [10 ** 17 * 1.0, 2 * 10 ** 18 * 0.95, 8 * 10 ** 18 * 0.9]
+    )
+    assert np.all(prediction.low <= prediction.answer)
+    assert np.all(prediction.high >= prediction.answer)
+
+
+def band(prediction):
+    return (prediction.high - prediction.low) / prediction.answer
+
+
+def test_band_widens_with_age():
+    model = surface.QuoteModel()
+    observe(model, 10, recorder.CURVE, [10 ** 18, 4 * 10 ** 18], [1.0, 0.9])
+    rows = make_rows(recorder.CURVE, [2 * 10 ** 18])
+
+    fresh, stale = band(model.predict(10, rows)), band(model.predict(20, rows))
+
+    assert stale[0] == pytest.approx(fresh[0] + 2 * surface.DRIFT * 10)
+
+
+def test_band_widens_outside_the_quoted_sizes():
+    model = surface.QuoteModel()
+    observe(model, 10, recorder.CURVE, [10 ** 18, 4 * 10 ** 18], [1.0, 0.9])
+
+    widths = band(
+        model.predict(
+            10, make_rows(recorder.CURVE, [2 * 10 ** 18, 8 * 10 ** 18, 16 * 10 ** 18])
+        )
+    )
+
+    assert widths[1] == pytest.approx(widths[0] + 2 * surface.EXTRAPOLATION * np.log(2))
+    assert widths[2] == pytest.approx(widths[0] + 2 * surface.EXTRAPOLATION * np.log(4))
+
+
+def test_stale_quotes_are_not_fitted():
+    model = surface.QuoteModel(max_age=5)
+    observe(model, 10, recorder.CURVE, [10 ** 18], [1.0])
+
+    assert model.fit(14, (recorder.CURVE, 0, 1)) is not None
+    assert model.fit(15, (recorder.CURVE, 0, 1)) is None
+
+    model.reset()
+    assert model.fit(10, (recorder.CURVE, 0, 1)) is None
+
+
+def test_points_are_capped_after_expired_ones_are_dropped():
+    model = surface.QuoteModel(max_age=5, max_points=3)
+    observe(model, 10, recorder.PARASWAP, [10 ** 18, 2 * 10 ** 18], [1.0, 1.0])
+    amounts = [3 * 10 ** 18, 4 * 10 ** 18, 5 * 10 ** 18, 6 * 10 ** 18]
+    # block 10's quotes have expired by block 15
+    observe(model, 15, recorder.PARASWAP, amounts, [1.0] * 4)
+
+    fit = model.fit(15, (recorder.PARASWAP, 0, 1))
+
+    # the cap keeps the newest points
+    assert np.exp(fit.log_amounts) == pytest.approx(amounts[1:])
+
+
+def test_points_cap_drops_the_oldest():
+    model = surface.QuoteModel(max_points=3)
+    observe(model, 10, recorder.PARASWAP, [10 ** 18, 2 * 10 ** 18], [1.0, 1.0])
+    observe(model, 11, recorder.PARASWAP, [3 * 10 ** 18, 4 * 10 ** 18], [1.0, 1.0])
+
+    fit = model.fit(11, (recorder.PARASWAP, 0, 1))
+
+    assert np.exp(fit.log_amounts) == pytest.approx([2e18, 3e18, 4e18])
+
+
+def test_best_unquoted_per_direction():
+    rows = pd.DataFrame({"direction": [recorder.CURVE] * 3 + [recorder.PARASWAP] * 2})
+    margin = np.array([0.01, 0.03, np.nan, 0.02, 0.015])
+    optimistic = margin + 0.01
+
+    picked = surface.best_unquoted(rows, margin, optimistic, {}, 0.0009)
+
+    assert picked == {recorder.CURVE: 1, recorder.PARASWAP: 3}
+
+
+@pytest.mark.parametrize(
+    "quoted_best,threshold,picked",
+    [
+        # the quoted rows already do better
+        ({recorder.CURVE: 0.03}, 0.0, {}),
+        ({recorder.CURVE: 0.02}, 0.0, {recorder.CURVE: 1}),
+        # even the favourable end of the band misses the flash loan premium
+        ({}, 0.05, {}),
+        ({}, 0.035, {recorder.CURVE: 1}),
+    ],
+)
+def test_best_unquoted_must_beat_quotes_and_threshold(quoted_best, threshold, picked):
+    rows = pd.DataFrame({"direction": [recorder.CURVE] * 2})
+    margin = np.array([0.01, 0.03])
+
+    assert (
+        surface.best_unquoted(rows, margin, margin + 0.01, quoted_best, threshold)
+        == picked
+    )
+
+
+def test_best_unquoted_skips_directions_without_predictions():
+    rows = pd.DataFrame({"direction": [recorder.CURVE, recorder.PARASWAP]})
+    margin = np.array([np.nan, 0.01])
+
+    assert surface.best_unquoted(rows, margin, margin, {}, 0.0) == {
+        recorder.PARASWAP: 1
+    }
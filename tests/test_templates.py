@@ -0,0 +1,123 @@
+import random
+
+import pytest
+from eth_abi import abi
+
+from scripts import codec, templates
+
+ENCODE_TYP = "(bool,uint256,uint256,uint256,uint256,uint256,bytes)"
+FLASH_LOAN_TYPES = [
+    "address",
+    "address[]",
+    "uint256[]",
+    "uint256[]",
+    "address",
+    "bytes",
+    "uint16",
+]
+RECEIVER = "0x" + "11" * 20
+ASSET = "0xdAC17F958D2ee523a2206206994597C13D831ec7"
+ON_BEHALF_OF = "0x" + "22" * 20
+
+
+def reference_params(is_curve, i, j, dx, min_dy, deadline, payload):
+    return abi.encode_single(
+        ENCODE_TYP, [is_curve, i, j, dx, min_dy, deadline, payload]
+    )
+
+
+def reference_flash_loan(amount, params):
+    return codec.FLASH_LOAN + abi.encode_abi(
+        FLASH_LOAN_TYPES, [RECEIVER, [ASSET], [amount], [0], ON_BEHALF_OF, params, 0]
+    )
+
+
+def build(key, encode_flash_loan=reference_flash_loan):
+    is_curve, i, j = key
+
+    def encode_params(dx, min_dy, deadline, payload):
+        return reference_params(is_curve, i, j, dx, min_dy, deadline, payload)
+
+    return templates.build_template(key, encode_params, encode_flash_loan)
+
+
+def codec_flash_loan(amount, params):
+    return codec.flash_loan(RECEIVER, [ASSET], [amount], [0], ON_BEHALF_OF, params, 0)
+
+
+@pytest.mark.parametrize("key", [(True, 0, 1), (False, 2, 1)])
+@pytest.mark.parametrize("length", [0, 1, 4, 31, 32, 33, 63, 64, 100, 4 + 32 * 9 + 5])
+@pytest.mark.parametrize("encode_flash_loan", [reference_flash_loan, codec_flash_loan])
+def test_render_matches_eth_abi(key, length, encode_flash_loan):
+    rng = random.Random(length)
+    template = build(key, encode_flash_loan)
+
+    for _ in range(5):
+        amount = rng.getrandbits(128)
+        dx, min_dy = rng.getrandbits(128), rng.getrandbits(96)
+        deadline = rng.getrandbits(40)
+        payload = bytes(rng.getrandbits(8) for _ in range(length))
+
+        rendered = template.render(amount, dx, min_dy, deadline, payload)
+
+        params = reference_params(*key, dx, min_dy, deadline, payload)
+        assert rendered == reference_flash_loan(amount, params)
+
+
+def test_render_extreme_values():
+    template = build((True, 0, 1))
+    payload = b"\xff" * 45
+
+    rendered = template.render(0, 2 ** 256 - 1, 0, 2 ** 256 - 1, payload)
+
+    params = reference_params(True, 0, 1, 2 ** 256 - 1, 0, 2 ** 256 - 1, payload)
+    assert rendered == reference_flash_loan(0, params)
+
+
+def test_build_accepts_hex_strings():
+    template = build(
+        (True, 0, 1), lambda **kwargs: "0x" + reference_flash_loan(**kwargs).hex()
+    )
+
+    rendered = template.render(10, 20, 30, 40, b"\x01\x02")
+
+    params = reference_params(True, 0, 1, 20, 30, 40, b"\x01\x02")
+    assert rendered == reference_flash_loan(10, params)
+
+
+def test_build_rejects_duplicated_sentinel():
+    def encode_params(dx, min_dy, deadline, payload):
+        # dx encoded twice, its word cannot be patched unambiguously
+        return reference_params(True, 0, 1, dx, dx, deadline, payload)
+
+    with pytest.raises(ValueError):
+        templates.build_template((True, 0, 1), encode_params, reference_flash_loan)
+
+
+def test_build_rejects_mismatched_encoding():
+    def encode_params(dx, min_dy, deadline, payload):
+        # a payload that is not the trailing dynamic argument
+        return reference_params(True, 0, 1, dx, min_dy, deadline, payload[::-1])
+
+    with pytest.raises(ValueError):
+        templates.build_template((True, 0, 1), encode_params, reference_flash_loan)
+
+
+def test_template_cache():
+    built = []
+
+    def factory(key):
+        built.append(key)
+        return build(key)
+
+    cache = templates.TemplateCache(factory)
+    cache.prebuild([(True, 0, 1), (False, 0, 1)])
+    cache.get((True, 0, 1))
+    cache.prebuild([(True, 0, 1)])
+
+    assert built == [(True, 0, 1), (False, 0, 1)]
+
+    cache.clear()
+    cache.get((True, 0, 1))
+
+    assert built[-1] == (True, 0, 1) and len(built) == 3